@@ -14,3 +14,6 @@ UNISWAP_ALEPH_POOL_ADDRESS = Web3.to_checksum_address(
 REVENUE_SHARE_OWNER = 90
 REVENUE_SHARE_PLATFORM = 5
 REVENUE_SHARE_CREAITOR = 5
+
+# Base produces a block every 2 seconds
+POOL_PRICE_MAX_AGE_SECONDS = 2
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from web3.contract import Contract
+
+from creaitors.constants import POOL_PRICE_MAX_AGE_SECONDS
+
+
+def price_from_sqrt_price_x96(sqrt_price_x96: int) -> float:
+    """Compute a Uniswap V3 pool price from its sqrtPriceX96 value
+
+    Args:
+        sqrt_price_x96: The sqrtPriceX96 value returned by the pool slot0
+
+    Returns:
+        The number of token1 you get for 1 token0
+    """
+    return (sqrt_price_x96 / (2**96)) ** 2  # Uniswap V3 formula
+
+
+class PoolPriceOracle:
+    """Price of a Uniswap V3 pool cached per block number
+
+    A cached price is returned without any RPC call while it's younger than max_age seconds.
+    After that, the latest block is checked and slot0 is only read again if the block changed.
+    Concurrent callers wait for the in-flight read instead of issuing their own.
+    """
+
+    pool_contract: Contract
+    max_age: float
+    __lock: threading.Lock
+    __block_number: int | None
+    __price: float | None
+    __fetched_at: float
+
+    def __init__(
+        self, pool_contract: Contract, max_age: float = POOL_PRICE_MAX_AGE_SECONDS
+    ):
+        self.pool_contract = pool_contract
+        self.max_age = max_age
+        self.__lock = threading.Lock()
+        self.__block_number = None
+        self.__price = None
+        self.__fetched_at = 0
+
+    def get_price(self) -> float:
+        """Get the current pool price
+
+        Returns:
+            The number of token1 you get for 1 token0
+        """
+        with self.__lock:
+            if (
+                self.__price is not None
+                and time.monotonic() - self.__fetched_at < self.max_age
+            ):
+                return self.__price
+
+            block_number = self.pool_contract.w3.eth.block_number
+            if self.__price is None or block_number != self.__block_number:
+                slot0 = self.pool_contract.functions.slot0().call(
+                    block_identifier=block_number
+                )
+                self.__price = price_from_sqrt_price_x96(slot0[0])
+                self.__block_number = block_number
+
+            self.__fetched_at = time.monotonic()
+            return self.__price
@@ -24,6 +24,7 @@ from creaitors.constants import (
     UNISWAP_ROUTER_ADDRESS,
     WETH_ADDRESS,
 )
+from creaitors.oracle import PoolPriceOracle
 
 
 class AmountArgs(BaseModel):
@@ -44,6 +45,14 @@ with open(os.path.join(code_dir, "abis/uniswap_v3_pool.json"), "r") as abi_file:
 
 w3 = Web3(Web3.HTTPProvider("https://mainnet.base.org"))
 
+# Contracts are built once, decoding the ABIs on every call is wasteful
+swap_router_contract = Web3().eth.contract(
+    address=UNISWAP_ROUTER_ADDRESS, abi=SWAP_ROUTER_ABI
+)
+aleph_price_oracle = PoolPriceOracle(
+    w3.eth.contract(address=UNISWAP_ALEPH_POOL_ADDRESS, abi=POOL_ABI)
+)
+
 
 class AlephProvider(ActionProvider[EvmWalletProvider]):
     def __init__(self):
@@ -117,14 +126,7 @@ class AlephProvider(ActionProvider[EvmWalletProvider]):
                 float(Web3.from_wei(aleph_flow, "ether")) * 3600, 3
             )
 
-            aleph_pool_contract = w3.eth.contract(
-                address=UNISWAP_ALEPH_POOL_ADDRESS, abi=POOL_ABI
-            )
-            slot0 = aleph_pool_contract.functions.slot0().call()
-            sqrtPriceX96 = slot0[0]  # Extract sqrtPriceX96
-
-            # Calculate token price from sqrtPriceX96
-            nb_aleph_for_1_eth = (sqrtPriceX96 / (2**96)) ** 2  # Uniswap V3 formula
+            nb_aleph_for_1_eth = aleph_price_oracle.get_price()
 
             return {
                 "aleph_balance": formatted_aleph_balance,
@@ -159,9 +161,7 @@ class AlephProvider(ActionProvider[EvmWalletProvider]):
         try:
             validated_args = AmountArgs(**args)
 
-            contract = Web3().eth.contract(
-                address=UNISWAP_ROUTER_ADDRESS, abi=SWAP_ROUTER_ABI
-            )
+            contract = swap_router_contract
             address = wallet_provider.get_address()
 
             # Fee Tier (1%)
@@ -0,0 +1,21 @@
+"""Micro-benchmarks of the helpers run when an autonomous agent is built.
+
+pytest and pytest-benchmark aren't part of the locked dev dependencies, install them in
+the project environment first with `poetry run pip install pytest pytest-benchmark`.
+They are skipped unless pytest runs with `--benchmarks`. Compare against a stored
+baseline with
+`pytest tests --benchmarks --benchmark-save=baseline` then
+`pytest tests --benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%`.
+"""
+
+from creaitors.provider import AlephProvider
+from creaitors.utils import get_provider_langchain_tools
+
+
+def test_get_provider_langchain_tools(benchmark):
+    action_provider = AlephProvider()
+    # The wallet provider is only bound to the tools, never called while building them
+    tools = benchmark(get_provider_langchain_tools, action_provider, None)
+    assert {tool.name for tool in tools} == {
+        action.name for action in action_provider.get_actions(None)
+    }
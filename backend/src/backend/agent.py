@@ -3,13 +3,27 @@ from http import HTTPStatus
 from fastapi import HTTPException
 from typing import List, Optional, Dict
 
-from aleph.sdk import AlephHttpClient
 from aleph.sdk.query.filters import PostFilter
 
+from .cache import MISSING, TTLCache
+from .clients import clients
 from .config import config
+from .metrics import instrumented, register_cache
 from .models import FetchedAgentDeployment
+from .serialization import DeploymentVersion
 
+# Deployment posts by agent ID, `None` entries remember unknown IDs for a shorter time
+agents_cache: TTLCache[str, Optional[FetchedAgentDeployment]] = TTLCache(
+    maxsize=config.AGENT_CACHE_SIZE, ttl=config.AGENT_CACHE_TTL
+)
+register_cache("agents", agents_cache)
 
+# Validators of the last state returned or published for each agent, `If-None-Match` requests are answered from there
+agent_versions: TTLCache[str, DeploymentVersion] = TTLCache(maxsize=config.AGENT_CACHE_SIZE, ttl=config.AGENT_CACHE_TTL)
+register_cache("agent_versions", agent_versions)
+
+
+@instrumented("aleph")
 async def fetch_agents(
         ids: list[str] | None = None,
         addresses: Optional[List[str]] = None
@@ -17,7 +31,7 @@ async def fetch_agents(
     if not addresses:
         addresses = []
 
-    async with AlephHttpClient(api_server=config.ALEPH_API_URL) as client:
+    async with clients.aleph_client() as client:
         result = await client.get_posts(
             post_filter=PostFilter(
                 types=[config.ALEPH_AGENT_DEPLOYMENT_POST_TYPE],
@@ -32,26 +46,44 @@ async def fetch_agents(
     ]
 
 
+def cache_agent(deployment: FetchedAgentDeployment):
+    """Write-through a deployment state that has just been published"""
+    agents_cache.set(deployment.id, deployment.copy())
+    record_agent_version(deployment)
+
+
+def record_agent_version(deployment: FetchedAgentDeployment) -> DeploymentVersion:
+    """Remember the validators of a deployment state, to be called whenever it changes or it's returned"""
+    version = DeploymentVersion.of(deployment)
+    agent_versions.set(deployment.id, version)
+    return version
+
+
 async def get_agent(agent_id: str, check_result: bool = True) -> Optional[FetchedAgentDeployment]:
-    agents = await fetch_agents([agent_id])
+    agent = agents_cache.get(agent_id)
+    if agent is MISSING:
+        agents = await fetch_agents([agent_id])
+
+        if len(agents) > 1:
+            raise HTTPException(
+                status_code=HTTPStatus.NOT_FOUND,
+                detail=f"Some agents with ID {agent_id} found.",
+            )
+
+        agent = agents[0] if agents else None
+        agents_cache.set(agent_id, agent, ttl=None if agent else config.AGENT_NEGATIVE_CACHE_TTL)
 
-    if not check_result:
-        if len(agents) == 0:
+    if agent is None:
+        if not check_result:
             return None
 
-    if len(agents) < 1:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail=f"Agent with ID {agent_id} not found.",
         )
 
-    if len(agents) > 1:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND,
-            detail=f"Some agents with ID {agent_id} found.",
-        )
-
-    return agents[0]
+    # Callers mutate the deployment while it progresses, never hand out the cached instance
+    return agent.copy()
 
 
 def generate_fixed_env_variables(private_key: str, creator_address: str, owner_address: str) -> str:
@@ -1,33 +1,41 @@
+import asyncio
 from decimal import Decimal
+from hashlib import sha256
 from pathlib import Path
 
-from typing import Optional, Any, Tuple
+from typing import Optional, Any, Dict, Tuple
 
 from aiohttp import (
     ClientConnectorError,
     ClientResponseError,
     ConnectionTimeoutError,
-    ClientSession,
 )
 from ipaddress import IPv6Interface
 
 from aleph.sdk.chains.ethereum import ETHAccount
-from aleph.sdk.client.authenticated_http import AuthenticatedAlephHttpClient, AlephHttpClient
 from aleph.sdk.conf import settings
 from aleph.sdk.evm_utils import FlowUpdate
 from aleph.sdk.query.filters import PostFilter
 from aleph_message.models import InstanceMessage, Chain, Payment, PaymentType, StoreMessage
 from aleph_message.models.execution.environment import HypervisorType, HostRequirements, NodeRequirements
 
+from backend.artifacts import code_files
+from backend.clients import clients
 from backend.config import config
+from backend.crn import crn_executions
+from backend.metrics import instrumented
 from backend.models import FetchedAgentDeployment, CRNInfo
 from backend.utils import format_cost
 
-PATH_ABOUT_EXECUTIONS_LIST = "/about/executions/list"
 PATH_INSTANCE_NOTIFY = "/control/allocation/notify"
 COMMUNITY_FLOW_PERCENTAGE = Decimal(0.2)
 
 
+def _execution_ip(execution: Dict[str, Any]) -> str:
+    interface = IPv6Interface(execution["networking"]["ipv6"])
+    return str(interface.ip + 1)
+
+
 async def fetch_instance_ip(crn_url: str, item_hash: str) -> str:
     """
     Fetches IPv6 of an allocated instance given a message hash.
@@ -39,47 +47,59 @@ async def fetch_instance_ip(crn_url: str, item_hash: str) -> str:
         IPv6 address
     """
 
-    async with ClientSession() as session:
-        try:
-            async with session.get(
-                    f"{crn_url}{PATH_ABOUT_EXECUTIONS_LIST}"
-            ) as resp:
-                resp.raise_for_status()
-                executions = await resp.json()
-
-                if item_hash in executions:
-                    interface = IPv6Interface(executions[item_hash]["networking"]["ipv6"])
-                    return str(interface.ip + 1)
-        except (
-                ClientResponseError,
-                ClientConnectorError,
-                ConnectionTimeoutError,
-        ):
-            raise ValueError()
+    executions = await crn_executions.get_executions(crn_url)
+    if item_hash in executions:
+        return _execution_ip(executions[item_hash])
 
     return ""
 
 
+async def wait_for_instance_ip(crn_url: str, item_hash: str) -> str:
+    """
+    Waits for an allocated instance to appear on the CRN and returns its IPv6 address.
+
+    Args:
+        crn_url: Url of CRN.
+        item_hash: Instance message hash.
+    Returns:
+        IPv6 address, empty if the instance didn't show up in time
+    """
+
+    try:
+        execution = await crn_executions.wait_for_execution(crn_url, item_hash, timeout=config.INSTANCE_IP_TIMEOUT)
+    except asyncio.TimeoutError:
+        return ""
+
+    return _execution_ip(execution)
+
+
+@instrumented("aleph")
+async def get_rootfs_size(rootfs: str) -> int:
+    async with clients.aleph_client() as client:
+        rootfs_message: StoreMessage = await client.get_message(
+            item_hash=rootfs, message_type=StoreMessage
+        )
+
+    return (
+        rootfs_message.content.size
+        if rootfs_message.content.size is not None
+        else settings.DEFAULT_ROOTFS_SIZE
+    )
+
+
+@instrumented("aleph")
 async def create_instance_message(
         account: ETHAccount,
         deployment: FetchedAgentDeployment,
         ssh_public_key: str,
-        crn: CRNInfo
+        crn: CRNInfo,
+        rootfs_size: Optional[int] = None,
 ) -> InstanceMessage:
-    async with AuthenticatedAlephHttpClient(
-            account=account, api_server=config.ALEPH_API_URL
-    ) as client:
-        rootfs = settings.UBUNTU_24_QEMU_ROOTFS_ID
-        rootfs_message: StoreMessage = await client.get_message(
-            item_hash=rootfs, message_type=StoreMessage
-        )
-        rootfs_size = (
-            rootfs_message.content.size
-            if rootfs_message.content.size is not None
-            else settings.DEFAULT_ROOTFS_SIZE
-        )
+    rootfs = settings.UBUNTU_24_QEMU_ROOTFS_ID
+    if rootfs_size is None:
+        rootfs_size = await get_rootfs_size(rootfs)
 
-        # TODO: Find the proper way to select the base CRN, at the moment get a fixed CRN
+    async with clients.authenticated_aleph_client(account) as client:
         instance_message, _status = await client.create_instance(
             rootfs=rootfs,
             rootfs_size=rootfs_size,
@@ -110,10 +130,9 @@ async def create_instance_message(
         return instance_message
 
 
+@instrumented("aleph")
 async def amend_message(account: ETHAccount, content: Any, ref: str):
-    async with AuthenticatedAlephHttpClient(
-            account=account, api_server=config.ALEPH_API_URL
-    ) as client:
+    async with clients.authenticated_aleph_client(account) as client:
         await client.create_post(
             address=account.get_address(),
             post_content=content,
@@ -123,62 +142,69 @@ async def amend_message(account: ETHAccount, content: Any, ref: str):
         )
 
 
+@instrumented("crn")
 async def notify_allocation(crn_url: str, instance_hash: str) -> bool:
-    async with ClientSession() as session:
-        try:
-            async with session.post(
-                    f"{crn_url}{PATH_INSTANCE_NOTIFY}",
-                    json={
-                        "instance": instance_hash
-                    }
-            ) as resp:
-                if not resp.ok:
-                    error_text = await resp.text()
-                    raise ValueError(error_text)
-
-                return True
-        except (
-                ClientResponseError,
-                ClientConnectorError,
-                ConnectionTimeoutError,
-        ):
-            raise ValueError()
+    session = clients.session()
+    try:
+        async with session.post(
+                f"{crn_url}{PATH_INSTANCE_NOTIFY}",
+                json={
+                    "instance": instance_hash
+                }
+        ) as resp:
+            if not resp.ok:
+                error_text = await resp.text()
+                raise ValueError(error_text)
+
+            return True
+    except (
+            ClientResponseError,
+            ClientConnectorError,
+            ConnectionTimeoutError,
+    ):
+        raise ValueError()
 
     return False
 
 
-async def get_code_file(code_hash: str) -> Optional[str]:
-    async with AlephHttpClient(api_server=config.ALEPH_API_URL) as client:
+@instrumented("aleph", "download_code_file")
+async def _download_code_file(code_hash: str, destination: Path) -> bool:
+    async with clients.aleph_client() as client:
         code_stored_content = await client.get_stored_content(code_hash)
-        if not code_stored_content:
-            return None
+        if not code_stored_content or not code_stored_content.url:
+            return False
 
-        code_filename = f"{code_hash}.zip"
-        if code_stored_content.filename:
-            code_filename = code_stored_content.filename
-
-        try:
-            code_filename_path = f"{config.CODE_FILES_PATH}/{code_filename}"
-            # If the file already exists, just return the path
-            if Path(code_filename_path).is_file():
-                return code_filename_path
-
-            async with ClientSession() as session:
-                async with session.get(code_stored_content.url) as resp:
-                    resp.raise_for_status()
-                    data = await resp.read()
-                    with open(code_filename_path, mode="wb") as file:
-                        file.write(data)
-        except Exception as error:
-            error_message = str(error)
-            print(f"Error ocurred downloading the code: {error_message}")
-            return None
+    # Aleph native storage uses the SHA256 of the file as hash, IPFS CIDs can't be checked that way
+    file_hash = sha256() if code_stored_content.hash and len(code_stored_content.hash) == 64 else None
+
+    async with clients.session().get(code_stored_content.url) as resp:
+        resp.raise_for_status()
+        with open(destination, mode="wb") as file:
+            async for chunk in resp.content.iter_chunked(config.CODE_DOWNLOAD_CHUNK_SIZE):
+                file.write(chunk)
+                if file_hash:
+                    file_hash.update(chunk)
+
+    if file_hash and file_hash.hexdigest() != code_stored_content.hash:
+        raise ValueError(f"Integrity check failed for code {code_hash}")
+
+    return True
+
+
+async def get_code_file(code_hash: str) -> Optional[str]:
+    try:
+        code_filename_path = await code_files.get(code_hash, _download_code_file)
+    except Exception as error:
+        error_message = str(error)
+        print(f"Error ocurred downloading the code: {error_message}")
+        return None
 
-    return code_filename_path
+    return str(code_filename_path) if code_filename_path else None
 
 
+@instrumented("aleph")
 async def get_code_hash(agent_hash: str) -> Optional[str]:
-    async with AlephHttpClient(api_server=config.ALEPH_API_URL) as client:
+    async with clients.aleph_client() as client:
         agent_messages = await client.get_posts(
             post_filter=PostFilter(
                 types=[config.ALEPH_AGENT_POST_TYPE],
@@ -198,8 +224,9 @@ async def get_code_hash(agent_hash: str) -> Optional[str]:
         return source_code_hash
 
 
+@instrumented("aleph")
 async def get_instance_price(item_hash: str) -> Tuple[Decimal, Decimal]:
-    async with AlephHttpClient(api_server=config.ALEPH_API_URL) as client:
+    async with clients.aleph_client() as client:
         instance_message = await client.get_message(item_hash, with_status=False)
         if not instance_message:
             raise ValueError(f"Instance with hash {item_hash} doesn't exists")
@@ -214,9 +241,16 @@ async def get_instance_price(item_hash: str) -> Tuple[Decimal, Decimal]:
         return required_community_tokens, required_operator_tokens
 
 
-async def create_instance_flow(aleph_account: ETHAccount, receiver_address: str, instance_flow_amount: Decimal):
-    existing_flow = await aleph_account.get_flow(receiver_address)
-    existing_flow_rate = Decimal(existing_flow["flowRate"] or 0)
+@instrumented("rpc")
+async def create_instance_flow(
+        aleph_account: ETHAccount,
+        receiver_address: str,
+        instance_flow_amount: Decimal,
+        existing_flow_rate: Optional[Decimal] = None,
+):
+    if existing_flow_rate is None:
+        existing_flow = await aleph_account.get_flow(receiver_address)
+        existing_flow_rate = Decimal(existing_flow["flowRate"] or 0)
     if existing_flow_rate < instance_flow_amount:
         flow_to_update = instance_flow_amount - existing_flow_rate
         operator_flow_tx = await aleph_account.manage_flow(
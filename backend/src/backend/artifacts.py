@@ -0,0 +1,99 @@
+import asyncio
+import os
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+
+from backend.config import config
+from backend.metrics import register_cache
+from backend.timeline import run_shared
+
+TEMPORARY_SUFFIX = ".part"
+
+
+class ArtifactCache:
+    """
+    Content-addressed file cache stored in a directory. Files are named after their key, written through a temporary
+    file that is atomically renamed once complete, and the least recently used ones are deleted when the total size
+    goes over `max_size` bytes. Concurrent requests for the same missing key share a single download.
+    """
+
+    directory: Path
+    extension: str
+    max_size: int
+
+    def __init__(self, directory: str, extension: str, max_size: int):
+        self.directory = Path(directory)
+        self.extension = extension
+        self.max_size = max_size
+        self._downloads: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+        # Drop incomplete files left by a previous run
+        for leftover in self.directory.glob(f"*{TEMPORARY_SUFFIX}"):
+            leftover.unlink(missing_ok=True)
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / f"{key}{self.extension}"
+
+    async def get(self, key: str, download: Callable[[str, Path], Awaitable[bool]]) -> Optional[Path]:
+        """
+        Returns the cached file for a key, calling `download(key, temporary_path)` to fill it if it's missing.
+        The download callable must return False (or raise) if the content couldn't be fetched or verified.
+        """
+        path = self.path_for(key)
+        if path.is_file():
+            # Refresh the modification time, used as recency by the eviction
+            path.touch()
+            self.hits += 1
+            return path
+
+        self.misses += 1
+
+        task = self._downloads.get(key)
+        if task is None:
+            task = asyncio.create_task(run_shared(self._download(key, download)))
+            self._downloads[key] = task
+            task.add_done_callback(lambda _: self._downloads.pop(key, None))
+
+        return await asyncio.shield(task)
+
+    async def _download(self, key: str, download: Callable[[str, Path], Awaitable[bool]]) -> Optional[Path]:
+        path = self.path_for(key)
+        temporary_path = self.directory / f"{key}-{uuid.uuid4().hex}{TEMPORARY_SUFFIX}"
+        try:
+            if not await download(key, temporary_path):
+                return None
+
+            os.replace(temporary_path, path)
+        finally:
+            temporary_path.unlink(missing_ok=True)
+
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: Optional[Path] = None):
+        files = [
+            (file.stat(), file)
+            for file in self.directory.glob(f"*{self.extension}")
+            if file.is_file()
+        ]
+        total_size = sum(stat.st_size for stat, _ in files)
+
+        for stat, file in sorted(files, key=lambda item: item[0].st_mtime):
+            if total_size <= self.max_size:
+                break
+            if file == keep:
+                continue
+
+            file.unlink(missing_ok=True)
+            total_size -= stat.st_size
+
+
+code_files = ArtifactCache(
+    directory=config.CODE_FILES_PATH,
+    extension=".zip",
+    max_size=config.CODE_FILES_MAX_SIZE,
+)
+register_cache("code_files", code_files)
@@ -1,14 +1,23 @@
+import asyncio
 import json
 import os
+import time
 from decimal import Decimal
+from typing import Optional
 
 from aleph.sdk.chains.ethereum import ETHAccount
 from aleph.sdk.exceptions import InsufficientFundsError
 from aleph.sdk.types import TokenType
+from aleph_message.models import Chain
 
 from eth_account import Account
 from eth_account.account import LocalAccount
-from web3 import Web3
+from web3 import AsyncWeb3, AsyncHTTPProvider, Web3
+from web3.contract import AsyncContract
+
+from backend.config import config
+from backend.metrics import instrumented
+from backend.timeline import run_shared
 
 UNISWAP_ROUTER_ADDRESS = Web3.to_checksum_address(
     "0x2626664c2603336E57B271c5C0b26F421741e481"
@@ -27,32 +36,94 @@ with open(os.path.join(code_dir, "abis/uniswap_router.json"), "r") as abi_file:
 with open(os.path.join(code_dir, "abis/uniswap_v3_pool.json"), "r") as abi_file:
     POOL_ABI = json.load(abi_file)
 
-w3 = Web3(Web3.HTTPProvider("https://mainnet.base.org"))
+BASE_RPC_URL = config.BASE_RPC_URL
+BASE_CHAIN_ID = 8453
+
+w3 = Web3(Web3.HTTPProvider(BASE_RPC_URL))
+# Shared non-blocking provider, all the chain interactions done by the deployments go through it
+async_w3 = AsyncWeb3(AsyncHTTPProvider(BASE_RPC_URL))
+
+# Contracts are built once, decoding the ABIs on every call is wasteful
+swap_router_contract = async_w3.eth.contract(address=UNISWAP_ROUTER_ADDRESS, abi=SWAP_ROUTER_ABI)
+aleph_pool_contract = async_w3.eth.contract(address=UNISWAP_ALEPH_POOL_ADDRESS, abi=POOL_ABI)
 
 
 def web3_from_wei(number: int, unit: str) -> int | Decimal:
     return Web3.from_wei(number, unit)
 
 
-def convert_aleph_to_eth(required_tokens: Decimal) -> Decimal:
-    aleph_pool_contract = w3.eth.contract(
-        address=UNISWAP_ALEPH_POOL_ADDRESS, abi=POOL_ABI
-    )
-    slot0 = aleph_pool_contract.functions.slot0().call()
-    sqrt_price_x96 = slot0[0]  # Extract sqrtPriceX96
-
+def price_from_sqrt_price_x96(sqrt_price_x96: int) -> Decimal:
     # Calculate token price from sqrtPriceX96
-    nb_aleph_for_1_eth = Decimal((sqrt_price_x96 / (2**96)) ** 2)  # Uniswap V3 formula
+    return Decimal((sqrt_price_x96 / (2**96)) ** 2)  # Uniswap V3 formula
+
+
+class PoolPriceOracle:
+    """
+    Caches the price of a Uniswap V3 pool per block number. A cached price is served without any RPC call while
+    it's younger than `max_age` seconds, then the latest block is checked and `slot0` is only read again if the
+    block changed. Concurrent callers share the same in-flight refresh.
+    """
+
+    pool_contract: AsyncContract
+    max_age: float
+
+    def __init__(self, pool_contract: AsyncContract, max_age: float):
+        self.pool_contract = pool_contract
+        self.max_age = max_age
+        self._block_number: Optional[int] = None
+        self._price: Optional[Decimal] = None
+        self._fetched_at: float = 0
+        self._refresh: Optional[asyncio.Task] = None
+
+    async def get_price(self) -> Decimal:
+        if self._price is not None and time.monotonic() - self._fetched_at < self.max_age:
+            return self._price
+
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(run_shared(self._fetch_price()))
+
+        return await asyncio.shield(self._refresh)
+
+    def update(self, block_number: int, sqrt_price_x96: int):
+        """Seed the cache with a slot0 value read elsewhere, e.g. within a multicall"""
+        if self._block_number is not None and block_number < self._block_number:
+            return
+
+        self._price = price_from_sqrt_price_x96(sqrt_price_x96)
+        self._block_number = block_number
+        self._fetched_at = time.monotonic()
+
+    @instrumented("rpc", "pool_price")
+    async def _fetch_price(self) -> Decimal:
+        block_number = await self.pool_contract.w3.eth.block_number
+
+        if self._price is None or block_number != self._block_number:
+            slot0 = await self.pool_contract.functions.slot0().call(block_identifier=block_number)
+            self._price = price_from_sqrt_price_x96(slot0[0])  # Extract sqrtPriceX96
+            self._block_number = block_number
+
+        self._fetched_at = time.monotonic()
+        return self._price
+
+
+aleph_price_oracle = PoolPriceOracle(aleph_pool_contract, max_age=config.POOL_PRICE_MAX_AGE)
+
+
+async def convert_aleph_to_eth(required_tokens: Decimal) -> Decimal:
+    nb_aleph_for_1_eth = await aleph_price_oracle.get_price()
     required_eth_tokens = required_tokens / nb_aleph_for_1_eth
     print(f"This {required_tokens} $ALEPH are {required_eth_tokens} $ETH tokens")
 
     return required_eth_tokens
 
 
-def make_eth_to_aleph_conversion(aleph_account: ETHAccount, required_eth_tokens: Decimal) -> str:
-    contract = w3.eth.contract(
-        address=UNISWAP_ROUTER_ADDRESS, abi=SWAP_ROUTER_ABI
-    )
+@instrumented("rpc")
+async def make_eth_to_aleph_conversion(
+        aleph_account: ETHAccount,
+        required_eth_tokens: Decimal,
+        base_fee: Optional[int] = None,
+) -> str:
+    contract = swap_router_contract
 
     account: LocalAccount = Account.from_key(aleph_account.export_private_key())
     address = account.address
@@ -63,9 +134,12 @@ def make_eth_to_aleph_conversion(aleph_account: ETHAccount, required_eth_tokens:
     # Amount to swap
     amount_in_wei = w3.to_wei(required_eth_tokens, "ether")
 
-    # Fetch current base fee from the latest block
-    latest_block = w3.eth.get_block('latest')
-    base_fee = latest_block['baseFeePerGas']
+    nonce = await async_w3.eth.get_transaction_count(address)
+
+    # Fetch current base fee from the latest block if the caller didn't read it already
+    if base_fee is None:
+        latest_block = await async_w3.eth.get_block('latest')
+        base_fee = latest_block['baseFeePerGas']
 
     # Set priority fee (tip to miners)
     priority_fee = Web3.to_wei(2, 'gwei')  # Adjust based on network congestion
@@ -74,7 +148,7 @@ def make_eth_to_aleph_conversion(aleph_account: ETHAccount, required_eth_tokens:
     max_fee = base_fee + priority_fee
 
     # Transaction Data (Using exactInputSingle)
-    tx = contract.functions.exactInputSingle(
+    tx = await contract.functions.exactInputSingle(
         {
             "tokenIn": WETH_ADDRESS,
             "tokenOut": ALEPH_ADDRESS,
@@ -91,21 +165,25 @@ def make_eth_to_aleph_conversion(aleph_account: ETHAccount, required_eth_tokens:
             "gas": 1000000,
             'maxFeePerGas': max_fee,
             'maxPriorityFeePerGas': priority_fee,
-            "nonce": w3.eth.get_transaction_count(address),
-            "chainId": 8453,  # Base Mainnet
+            "nonce": nonce,
+            "chainId": BASE_CHAIN_ID,  # Base Mainnet
         }
     )
 
     # First simulate the transaction
     try:
-        w3.eth.call(tx)
+        await async_w3.eth.call(tx)
     except Exception as e:
         print(f"Error in TX simulation: {e}")
         raise ValueError(print(f"Error in TX simulation: {e}"))
 
     signed_transaction = account.sign_transaction(tx)
-    tx_hash = w3.eth.send_raw_transaction(signed_transaction.rawTransaction)
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    tx_hash = await async_w3.eth.send_raw_transaction(signed_transaction.rawTransaction)
+    receipt = await async_w3.eth.wait_for_transaction_receipt(
+        tx_hash,
+        timeout=config.SWAP_RECEIPT_TIMEOUT,
+        poll_latency=config.SWAP_RECEIPT_POLL_INTERVAL,
+    )
     print(f"Transaction {'failed' if receipt['status'] != 1 else 'succeeded'}"
           f" with transaction hash {receipt['transactionHash'].hex()}")
     return str(receipt['transactionHash'].hex())
@@ -125,4 +203,12 @@ class CustomETHAccount(ETHAccount):
                 required_funds=CUSTOM_MIN_ETH_BALANCE,
                 available_funds=float(w3.from_wei(int(balance), "ether")),
             )
-        return valid
\ No newline at end of file
+        return valid
+
+
+async def load_account(private_key: bytes) -> CustomETHAccount:
+    """
+    Base account of a private key. Connecting it to the chain builds the web3 and Superfluid contract objects, tens of
+    milliseconds of Python that run on a thread instead of blocking the event loop.
+    """
+    return await asyncio.to_thread(CustomETHAccount, private_key, chain=Chain.BASE)
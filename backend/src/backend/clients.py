@@ -0,0 +1,112 @@
+import asyncio
+import json
+from typing import Dict, Optional
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from aleph.sdk.client.authenticated_http import (
+    AlephHttpClient,
+    AuthenticatedAlephHttpClient,
+)
+from aleph.sdk.conf import settings
+from aleph.sdk.types import Account
+from aleph.sdk.utils import extended_json_encoder
+
+from backend.config import config
+
+
+class _SharedSessionMixin:
+    """
+    Makes an Aleph SDK client borrow an already opened session instead of creating (and closing) its own.
+    """
+
+    # Same type as the attribute of the SDK clients
+    _http_session: Optional[ClientSession]
+
+    def __init__(self, *args, session: ClientSession, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http_session = session
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # The session belongs to the registry and outlives the client
+        pass
+
+
+class SharedAlephHttpClient(_SharedSessionMixin, AlephHttpClient):
+    pass
+
+
+class SharedAuthenticatedAlephHttpClient(_SharedSessionMixin, AuthenticatedAlephHttpClient):
+    pass
+
+
+class _LoopSessions:
+    aleph: ClientSession
+    external: ClientSession
+
+    def __init__(self):
+        timeout = ClientTimeout(total=config.HTTP_TIMEOUT, connect=config.HTTP_CONNECT_TIMEOUT)
+
+        self.aleph = ClientSession(
+            base_url=config.ALEPH_API_URL or settings.API_HOST,
+            connector=_create_connector(),
+            timeout=timeout,
+            json_serialize=lambda obj: json.dumps(obj, default=extended_json_encoder),
+        )
+        self.external = ClientSession(connector=_create_connector(), timeout=timeout)
+
+    async def close(self):
+        await self.aleph.close()
+        await self.external.close()
+
+
+def _create_connector() -> TCPConnector:
+    return TCPConnector(
+        limit=config.HTTP_CONNECTION_LIMIT,
+        limit_per_host=config.HTTP_CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT,
+    )
+
+
+class HttpClientRegistry:
+    """
+    App-lifetime registry of pooled HTTP sessions, one pool for the Aleph API and another one for the CRNs and
+    any other external host. Sessions are bound to the event loop that created them.
+    """
+
+    _sessions: Dict[asyncio.AbstractEventLoop, _LoopSessions]
+
+    def __init__(self):
+        self._sessions = {}
+
+    def _loop_sessions(self) -> _LoopSessions:
+        loop = asyncio.get_running_loop()
+        sessions = self._sessions.get(loop)
+        if sessions is None:
+            sessions = _LoopSessions()
+            self._sessions[loop] = sessions
+        return sessions
+
+    def session(self) -> ClientSession:
+        """Session to use against CRNs and any non Aleph API host"""
+        return self._loop_sessions().external
+
+    def aleph_client(self) -> AlephHttpClient:
+        return SharedAlephHttpClient(api_server=config.ALEPH_API_URL, session=self._loop_sessions().aleph)
+
+    def authenticated_aleph_client(self, account: Account) -> AuthenticatedAlephHttpClient:
+        return SharedAuthenticatedAlephHttpClient(
+            account=account, api_server=config.ALEPH_API_URL, session=self._loop_sessions().aleph
+        )
+
+    async def start(self):
+        self._loop_sessions()
+
+    async def close(self):
+        """Close the sessions bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        sessions: Optional[_LoopSessions] = self._sessions.pop(loop, None)
+        if sessions:
+            await sessions.close()
+
+
+clients = HttpClientRegistry()
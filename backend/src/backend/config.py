@@ -15,12 +15,76 @@ class _Config:
     WALLET_PROOF: str = "DEPLOYMENT-"
 
     CODE_FILES_PATH: str
+    CODE_FILES_MAX_SIZE: int
+    CODE_DOWNLOAD_CHUNK_SIZE: int
     SCRIPTS_PATH: str
+    IMAGES_PATH: str
+    IMAGES_MAX_SIZE: int
+    AGENT_IMAGE_BUILD: bool
+    AGENT_IMAGE_FAILURE_TTL: float
     DEVELOPMENT_PUBLIC_KEY: str = "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIGBogG5GtRkK98C2cEvAT9StWSdEA3tktvdfj1clFfEZ"
     DEVELOPMENT_ALT_PUBLIC_KEY: str = "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIHlGJRaIv/EzNT0eNqNB5DiGEbii28Fb2zCjuO/bMu7y"
 
     PLATFORM_REWARD_ADDRESS: str = "0xA07B1214bAe0D5ccAA25449C3149c0aC83658874"
 
+    HTTP_CONNECTION_LIMIT: int
+    HTTP_CONNECTION_LIMIT_PER_HOST: int
+    HTTP_KEEPALIVE_TIMEOUT: float
+    HTTP_TIMEOUT: float
+    HTTP_CONNECT_TIMEOUT: float
+
+    DEPLOYMENT_WORKERS: int
+
+    AGENT_CACHE_SIZE: int
+    AGENT_CACHE_TTL: float
+    AGENT_NEGATIVE_CACHE_TTL: float
+    AGENT_RESPONSE_CACHE_CONTROL: str
+
+    BASE_RPC_URL: str
+    POOL_PRICE_MAX_AGE: float
+    SWAP_RECEIPT_TIMEOUT: float
+    SWAP_RECEIPT_POLL_INTERVAL: float
+    MULTICALL_BATCH_SIZE: int
+
+    SSH_MAX_CONCURRENCY: int
+    SSH_CONNECT_TIMEOUT: float
+    SSH_PORT: int
+    SSH_KEY_TYPE: str
+    SSH_KEY_POOL_SIZE: int
+
+    READINESS_TIMEOUT: float
+    READINESS_ATTEMPT_TIMEOUT: float
+    READINESS_BACKOFF_INITIAL: float
+    READINESS_BACKOFF_MAX: float
+
+    CRN_EXECUTIONS_TTL: float
+    CRN_EXECUTIONS_POLL_INTERVAL: float
+    INSTANCE_IP_TIMEOUT: float
+
+    STATE_DB_PATH: str
+    STATUS_PUBLISH_MAX_ATTEMPTS: int
+    STATUS_PUBLISH_BACKOFF_INITIAL: float
+    STATUS_PUBLISH_BACKOFF_MAX: float
+    STATUS_PUBLISH_FLUSH_TIMEOUT: float
+    CRYPTO_WORKERS: int
+    CRYPTO_CACHE_SIZE: int
+    RESUME_MAX_ATTEMPTS: int
+
+    TIMELINE_MAX_DEPLOYMENTS: int
+    TIMELINE_MAX_EVENTS: int
+
+    EVENTS_BUFFER_SIZE: int
+    EVENTS_MAX_SUBSCRIBERS: int
+    EVENTS_KEEPALIVE_INTERVAL: float
+    EVENTS_RETRY_INTERVAL: float
+
+    CRN_SELECTION: bool
+    CRN_LIST_URL: str
+    CRN_LIST_TTL: float
+    CRN_PROBE_INTERVAL: float
+    CRN_PROBE_TIMEOUT: float
+    CRN_PROBE_CONCURRENCY: int
+
     def __init__(self):
         load_dotenv()
 
@@ -33,14 +97,94 @@ class _Config:
         )
 
         self.CODE_FILES_PATH = os.getenv("CODE_FILES_PATH", "downloads")
+        self.CODE_FILES_MAX_SIZE = int(os.getenv("CODE_FILES_MAX_SIZE", 5 * 1024 ** 3))
+        self.CODE_DOWNLOAD_CHUNK_SIZE = int(os.getenv("CODE_DOWNLOAD_CHUNK_SIZE", 64 * 1024))
         self.SCRIPTS_PATH = os.getenv("SCRIPTS_PATH", "src/backend/scripts")
+        self.IMAGES_PATH = os.getenv("IMAGES_PATH", "images")
+        self.IMAGES_MAX_SIZE = int(os.getenv("IMAGES_MAX_SIZE", 20 * 1024 ** 3))
+        # Build the agent images on the backend host when Docker is available, instead of on each instance
+        self.AGENT_IMAGE_BUILD = os.getenv("AGENT_IMAGE_BUILD", "true").lower() == "true"
+        # Codes whose image failed to build are left to the instances for that long instead of being rebuilt
+        self.AGENT_IMAGE_FAILURE_TTL = float(os.getenv("AGENT_IMAGE_FAILURE_TTL", 600))
         self.KEYS_PATH = os.getenv("KEYS_PATH", "keys")
 
+        self.HTTP_CONNECTION_LIMIT = int(os.getenv("HTTP_CONNECTION_LIMIT", 100))
+        self.HTTP_CONNECTION_LIMIT_PER_HOST = int(os.getenv("HTTP_CONNECTION_LIMIT_PER_HOST", 20))
+        self.HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+        self.HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 300))
+        self.HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 30))
+
+        self.DEPLOYMENT_WORKERS = int(os.getenv("DEPLOYMENT_WORKERS", 10))
+        # Worker processes for the signature checks and key derivations of the API requests
+        self.CRYPTO_WORKERS = int(os.getenv("CRYPTO_WORKERS", min(os.cpu_count() or 1, 4)))
+        self.CRYPTO_CACHE_SIZE = int(os.getenv("CRYPTO_CACHE_SIZE", 10000))
+        self.STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state.db")
+        # Deployment post amends are sent in the background, retried, and flushed on shutdown
+        self.STATUS_PUBLISH_MAX_ATTEMPTS = int(os.getenv("STATUS_PUBLISH_MAX_ATTEMPTS", 5))
+        self.STATUS_PUBLISH_BACKOFF_INITIAL = float(os.getenv("STATUS_PUBLISH_BACKOFF_INITIAL", 1))
+        self.STATUS_PUBLISH_BACKOFF_MAX = float(os.getenv("STATUS_PUBLISH_BACKOFF_MAX", 30))
+        self.STATUS_PUBLISH_FLUSH_TIMEOUT = float(os.getenv("STATUS_PUBLISH_FLUSH_TIMEOUT", 30))
+        # Deployments that failed this many times aren't resumed on startup anymore, only on a new deploy call
+        self.RESUME_MAX_ATTEMPTS = int(os.getenv("RESUME_MAX_ATTEMPTS", 5))
+
+        self.AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", 10000))
+        self.AGENT_CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", 60))
+        self.AGENT_NEGATIVE_CACHE_TTL = float(os.getenv("AGENT_NEGATIVE_CACHE_TTL", 10))
+        # Cache-Control of the agent status responses, e.g. "public, max-age=0, s-maxage=2" lets a CDN absorb polling
+        self.AGENT_RESPONSE_CACHE_CONTROL = os.getenv("AGENT_RESPONSE_CACHE_CONTROL", "no-cache")
+
+        self.BASE_RPC_URL = os.getenv("BASE_RPC_URL", "https://mainnet.base.org")
+        # Base produces a block every 2 seconds
+        self.POOL_PRICE_MAX_AGE = float(os.getenv("POOL_PRICE_MAX_AGE", 2))
+        self.SWAP_RECEIPT_TIMEOUT = float(os.getenv("SWAP_RECEIPT_TIMEOUT", 120))
+        self.SWAP_RECEIPT_POLL_INTERVAL = float(os.getenv("SWAP_RECEIPT_POLL_INTERVAL", 1))
+        # Wallets read per multicall, each one adds two calls to the batch
+        self.MULTICALL_BATCH_SIZE = int(os.getenv("MULTICALL_BATCH_SIZE", 250))
+
+        self.SSH_MAX_CONCURRENCY = int(os.getenv("SSH_MAX_CONCURRENCY", 10))
+        self.SSH_CONNECT_TIMEOUT = float(os.getenv("SSH_CONNECT_TIMEOUT", 30))
+        # Port of the SSH server of the instances, probed for readiness then used for the code deployment
+        self.SSH_PORT = int(os.getenv("SSH_PORT", 22))
+        # "ed25519" or "rsa", deployment keys are generated in advance by a background process
+        self.SSH_KEY_TYPE = os.getenv("SSH_KEY_TYPE", "ed25519")
+        self.SSH_KEY_POOL_SIZE = int(os.getenv("SSH_KEY_POOL_SIZE", 10))
+
+        # Instance boot wait, probing the SSH port
+        self.READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", 300))
+        self.READINESS_ATTEMPT_TIMEOUT = float(os.getenv("READINESS_ATTEMPT_TIMEOUT", 5))
+        self.READINESS_BACKOFF_INITIAL = float(os.getenv("READINESS_BACKOFF_INITIAL", 0.5))
+        self.READINESS_BACKOFF_MAX = float(os.getenv("READINESS_BACKOFF_MAX", 10))
+
+        self.CRN_EXECUTIONS_TTL = float(os.getenv("CRN_EXECUTIONS_TTL", 5))
+        self.CRN_EXECUTIONS_POLL_INTERVAL = float(os.getenv("CRN_EXECUTIONS_POLL_INTERVAL", 2))
+        self.INSTANCE_IP_TIMEOUT = float(os.getenv("INSTANCE_IP_TIMEOUT", 60))
+
+        self.TIMELINE_MAX_DEPLOYMENTS = int(os.getenv("TIMELINE_MAX_DEPLOYMENTS", 1000))
+        self.TIMELINE_MAX_EVENTS = int(os.getenv("TIMELINE_MAX_EVENTS", 500))
+
+        # Events stream: frames waiting per subscriber, streams open at once, comment line sent on idle streams so
+        # proxies keep them open, and delay before a disconnected client reconnects
+        self.EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", 100))
+        self.EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", 10000))
+        self.EVENTS_KEEPALIVE_INTERVAL = float(os.getenv("EVENTS_KEEPALIVE_INTERVAL", 15))
+        self.EVENTS_RETRY_INTERVAL = float(os.getenv("EVENTS_RETRY_INTERVAL", 3))
+
+        # Pick the CRN of new instances from the network list, by latency and free resources
+        self.CRN_SELECTION = os.getenv("CRN_SELECTION", "true").lower() == "true"
+        self.CRN_LIST_URL = os.getenv("CRN_LIST_URL", "https://crns-list.aleph.sh/crns.json")
+        self.CRN_LIST_TTL = float(os.getenv("CRN_LIST_TTL", 600))
+        self.CRN_PROBE_INTERVAL = float(os.getenv("CRN_PROBE_INTERVAL", 60))
+        self.CRN_PROBE_TIMEOUT = float(os.getenv("CRN_PROBE_TIMEOUT", 5))
+        self.CRN_PROBE_CONCURRENCY = int(os.getenv("CRN_PROBE_CONCURRENCY", 20))
+
         if not Path(self.KEYS_PATH).is_dir():
             Path(self.KEYS_PATH).mkdir()
 
         if not Path(self.CODE_FILES_PATH).is_dir():
             Path(self.CODE_FILES_PATH).mkdir()
 
+        if not Path(self.IMAGES_PATH).is_dir():
+            Path(self.IMAGES_PATH).mkdir()
+
 
 config = _Config()
@@ -0,0 +1,299 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import (
+    ClientConnectorError,
+    ClientResponseError,
+    ClientTimeout,
+    ConnectionTimeoutError,
+)
+from aleph.sdk.conf import settings
+from pydantic import BaseModel
+
+from backend.clients import clients
+from backend.config import config
+from backend.metrics import instrumented, register_cache
+from backend.models import CRNInfo
+from backend.timeline import run_shared
+
+PATH_ABOUT_EXECUTIONS_LIST = "/about/executions/list"
+PATH_ABOUT_USAGE_SYSTEM = "/about/usage/system"
+
+# Weights of the probed metrics in the CRN score, the network score given by the list multiplies the sum
+FREE_MEMORY_WEIGHT = 0.4
+FREE_CPU_WEIGHT = 0.3
+LATENCY_WEIGHT = 0.3
+
+
+class CRNExecutionsCache:
+    """
+    Keeps the last executions list downloaded from each CRN for `ttl` seconds. Concurrent readers of the same CRN share
+    one request, and deployments waiting for their instance to show up share one poller per CRN.
+    """
+
+    ttl: float
+    poll_interval: float
+
+    def __init__(self, ttl: float, poll_interval: float):
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._executions: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._refreshes: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, Dict[str, List[asyncio.Future]]] = {}
+        self._pollers: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_executions(self, crn_url: str, max_age: Optional[float] = None) -> Dict[str, Any]:
+        max_age = self.ttl if max_age is None else max_age
+        cached = self._executions.get(crn_url)
+        if cached and time.monotonic() - cached[0] < max_age:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+
+        task = self._refreshes.get(crn_url)
+        if task is None:
+            task = asyncio.create_task(run_shared(self._fetch(crn_url)))
+            self._refreshes[crn_url] = task
+            task.add_done_callback(lambda _: self._refreshes.pop(crn_url, None))
+
+        return await asyncio.shield(task)
+
+    def invalidate(self, crn_url: str):
+        self._executions.pop(crn_url, None)
+
+    async def wait_for_execution(self, crn_url: str, item_hash: str, timeout: float) -> Dict[str, Any]:
+        """
+        Waits until an execution appears on the CRN executions list and returns it.
+        """
+        executions = await self.get_executions(crn_url)
+        if item_hash in executions:
+            return executions[item_hash]
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.setdefault(crn_url, {}).setdefault(item_hash, [])
+        waiters.append(future)
+        if crn_url not in self._pollers:
+            self._pollers[crn_url] = asyncio.create_task(run_shared(self._poll(crn_url)))
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if future in waiters:
+                waiters.remove(future)
+            crn_waiters = self._waiters.get(crn_url, {})
+            if not crn_waiters.get(item_hash):
+                crn_waiters.pop(item_hash, None)
+
+    @instrumented("crn", "executions_list")
+    async def _fetch(self, crn_url: str) -> Dict[str, Any]:
+        try:
+            async with clients.session().get(
+                    f"{crn_url}{PATH_ABOUT_EXECUTIONS_LIST}"
+            ) as resp:
+                resp.raise_for_status()
+                executions = await resp.json()
+        except (
+                ClientResponseError,
+                ClientConnectorError,
+                ConnectionTimeoutError,
+        ):
+            raise ValueError()
+
+        self._executions[crn_url] = (time.monotonic(), executions)
+        self._resolve_waiters(crn_url, executions)
+        return executions
+
+    def _resolve_waiters(self, crn_url: str, executions: Dict[str, Any]):
+        crn_waiters = self._waiters.get(crn_url, {})
+        for item_hash in [item_hash for item_hash in crn_waiters if item_hash in executions]:
+            for future in crn_waiters.pop(item_hash):
+                if not future.done():
+                    future.set_result(executions[item_hash])
+
+    async def _poll(self, crn_url: str):
+        try:
+            while self._waiters.get(crn_url):
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    await self.get_executions(crn_url, max_age=self.poll_interval)
+                except Exception as error:
+                    print(f"Error polling executions of CRN {crn_url}: {str(error)}")
+        finally:
+            self._pollers.pop(crn_url, None)
+            self._waiters.pop(crn_url, None)
+
+
+class CRNProbe(BaseModel):
+    latency: float
+    cpu_count: int
+    load_average: float
+    memory_total_kb: int
+    memory_available_kb: int
+    disk_available_kb: int
+    probed_at: float
+
+
+class CRNCandidate(BaseModel):
+    info: CRNInfo
+    network_score: float
+    probe: Optional[CRNProbe] = None
+
+
+class CRNSelector:
+    """
+    Picks the CRN to allocate new instances on. The CRN list is fetched and cached, and every node able to run
+    instances is probed in the background for latency and free resources. Resources handed out since the last probe
+    of a node are reserved, so a burst of deployments spreads over several nodes.
+    """
+
+    list_url: str
+
+    def __init__(self, list_url: str):
+        self.list_url = list_url
+        self._candidates: Dict[str, CRNCandidate] = {}
+        self._listed_at: float = 0
+        self._reserved_memory_kb: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._refresh: Optional[asyncio.Task] = None
+
+    @property
+    def candidates(self) -> List[CRNCandidate]:
+        return list(self._candidates.values())
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._probe_periodically())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def select(self) -> Optional[CRNInfo]:
+        """
+        Returns the best scored CRN able to host a new instance, None if no node qualifies.
+        """
+        if not any(candidate.probe for candidate in self._candidates.values()):
+            await self.refresh()
+
+        scored = [
+            (score, candidate)
+            for candidate in self._candidates.values()
+            if (score := self.score(candidate)) is not None
+        ]
+        if not scored:
+            return None
+
+        _score, best = max(scored, key=lambda item: item[0])
+        self._reserved_memory_kb[best.info.hash] = (
+            self._reserved_memory_kb.get(best.info.hash, 0) + settings.DEFAULT_INSTANCE_MEMORY * 1024
+        )
+        return best.info
+
+    def score(self, candidate: CRNCandidate) -> Optional[float]:
+        probe = candidate.probe
+        if not probe or probe.memory_total_kb <= 0 or probe.cpu_count <= 0:
+            return None
+
+        free_memory_kb = probe.memory_available_kb - self._reserved_memory_kb.get(candidate.info.hash, 0)
+        if free_memory_kb < settings.DEFAULT_INSTANCE_MEMORY * 1024:
+            return None
+        if probe.disk_available_kb < settings.DEFAULT_ROOTFS_SIZE * 1024:
+            return None
+
+        free_memory = free_memory_kb / probe.memory_total_kb
+        free_cpu = max(0.0, 1 - probe.load_average / probe.cpu_count)
+        latency = 1 / (1 + probe.latency)
+
+        return candidate.network_score * (
+            FREE_MEMORY_WEIGHT * free_memory + FREE_CPU_WEIGHT * free_cpu + LATENCY_WEIGHT * latency
+        )
+
+    async def refresh(self):
+        """Refresh the CRN list if it expired and probe all the nodes, concurrent calls share the same refresh"""
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(run_shared(self._refresh_candidates()))
+        await asyncio.shield(self._refresh)
+
+    async def _probe_periodically(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as error:
+                print(f"Error refreshing the CRN list: {str(error)}")
+            await asyncio.sleep(config.CRN_PROBE_INTERVAL)
+
+    async def _refresh_candidates(self):
+        if not self._candidates or time.monotonic() - self._listed_at > config.CRN_LIST_TTL:
+            await self._fetch_list()
+
+        semaphore = asyncio.Semaphore(config.CRN_PROBE_CONCURRENCY)
+
+        async def probe(candidate: CRNCandidate):
+            async with semaphore:
+                try:
+                    candidate.probe = await self._probe(candidate.info.url)
+                    self._reserved_memory_kb.pop(candidate.info.hash, None)
+                except Exception:
+                    # Unreachable nodes stop being candidates until they answer again
+                    candidate.probe = None
+
+        await asyncio.gather(*[probe(candidate) for candidate in self._candidates.values()])
+
+    @instrumented("crn", "crn_list")
+    async def _fetch_list(self):
+        async with clients.session().get(self.list_url) as resp:
+            resp.raise_for_status()
+            crns = (await resp.json()).get("crns", [])
+
+        candidates: Dict[str, CRNCandidate] = {}
+        for crn in crns:
+            url = (crn.get("address") or "").rstrip("/")
+            receiver_address = crn.get("payment_receiver_address") or crn.get("stream_reward")
+            if not url or not receiver_address or not crn.get("qemu_support"):
+                continue
+
+            info = CRNInfo(url=url, hash=crn["hash"], receiver_address=receiver_address)
+            previous = self._candidates.get(info.hash)
+            candidates[info.hash] = CRNCandidate(
+                info=info,
+                network_score=float(crn.get("score") or 0),
+                probe=previous.probe if previous else None,
+            )
+
+        self._candidates = candidates
+        self._listed_at = time.monotonic()
+
+    @instrumented("crn", "usage_probe")
+    async def _probe(self, crn_url: str) -> CRNProbe:
+        start = time.monotonic()
+        async with clients.session().get(
+                f"{crn_url}{PATH_ABOUT_USAGE_SYSTEM}", timeout=ClientTimeout(total=config.CRN_PROBE_TIMEOUT)
+        ) as resp:
+            resp.raise_for_status()
+            usage = await resp.json()
+        latency = time.monotonic() - start
+
+        return CRNProbe(
+            latency=latency,
+            cpu_count=usage["cpu"]["count"],
+            load_average=usage["cpu"]["load_average"]["load5"],
+            memory_total_kb=usage["mem"]["total_kB"],
+            memory_available_kb=usage["mem"]["available_kB"],
+            disk_available_kb=usage["disk"]["available_kB"],
+            probed_at=time.time(),
+        )
+
+
+crn_selector = CRNSelector(list_url=config.CRN_LIST_URL)
+
+crn_executions = CRNExecutionsCache(
+    ttl=config.CRN_EXECUTIONS_TTL,
+    poll_interval=config.CRN_EXECUTIONS_POLL_INTERVAL,
+)
+register_cache("crn_executions", crn_executions)
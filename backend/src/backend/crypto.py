@@ -0,0 +1,69 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Tuple
+from uuid import UUID
+
+from backend.cache import MISSING, TTLCache
+from backend.config import config
+from backend.metrics import register_cache
+from backend.utils import check_agent_key
+
+
+def _warm_up():
+    # Importing the module is what makes the first task of a spawned worker slow
+    return None
+
+
+class CryptoExecutor:
+    """
+    Runs the signature recoveries of the request handlers on a pool of worker processes, so bursts of requests use
+    every core instead of queuing on the event loop. Verifications are deterministic and the recent results are kept
+    in memory.
+    """
+
+    workers: int
+    verifications: TTLCache[Tuple[str, str, str], bool]
+
+    def __init__(self, workers: int, cache_size: int):
+        self.workers = workers
+        self.verifications = TTLCache(maxsize=cache_size, ttl=float("inf"))
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def start(self):
+        """Start the worker processes now rather than on the first requests"""
+        try:
+            await asyncio.gather(*[self._run(_warm_up) for _ in range(self.workers)])
+        except BrokenProcessPool as error:
+            print(f"Error starting the crypto worker processes: {str(error)}")
+
+    async def stop(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._create_executor()
+
+    async def _run(self, function: Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, function, *args)
+        except BrokenProcessPool:
+            # A worker process died, the following calls use a new pool
+            self._executor = self._create_executor()
+            raise
+
+    async def check_agent_key(self, agent_id: UUID, owner: str, agent_key: str) -> bool:
+        key = (owner, str(agent_id), agent_key)
+        cached = self.verifications.get(key)
+        if cached is not MISSING:
+            return cached
+
+        valid = await self._run(check_agent_key, agent_id, owner, agent_key)
+        self.verifications.set(key, valid)
+        return valid
+
+
+crypto_executor = CryptoExecutor(workers=config.CRYPTO_WORKERS, cache_size=config.CRYPTO_CACHE_SIZE)
+register_cache("signature_verifications", crypto_executor.verifications)
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from collections import deque
+from enum import Enum
+from typing import Deque, Dict, Optional, Set
+
+import orjson
+from pydantic import BaseModel
+
+from backend.config import config
+from backend.metrics import event_subscribers, events_dropped
+from backend.models import AgentDeploymentStatus, FetchedAgentDeployment
+from backend.serialization import ModelSerializer
+
+
+class DeploymentEventType(Enum):
+    STATUS = "STATUS"
+    RETRY = "RETRY"
+    FAILED = "FAILED"
+
+
+class DeploymentEvent(BaseModel):
+    type: DeploymentEventType
+    timestamp: float
+    status: AgentDeploymentStatus
+    # Operation retried, on RETRY events
+    name: Optional[str] = None
+    # Error of the attempt, on RETRY and FAILED events
+    reason: Optional[str] = None
+    # Full state, as returned by `GET /agent/{agent_id}`
+    deployment: FetchedAgentDeployment
+
+
+deployment_event_content = ModelSerializer(DeploymentEvent)
+
+
+class Subscription:
+    """
+    Events of one agent for one subscriber, as Server-Sent Events frames. Once `maxsize` frames are waiting, the
+    oldest ones are dropped, a slow subscriber always gets the latest state without holding memory for the others.
+    """
+
+    agent_id: str
+    closed: bool
+
+    def __init__(self, agent_id: str, maxsize: int):
+        self.agent_id = agent_id
+        self.closed = False
+        self._frames: Deque[bytes] = deque(maxlen=maxsize)
+        self._ready = asyncio.Event()
+
+    def put(self, frame: bytes) -> bool:
+        """Queue a frame, returns whether the oldest one was dropped to make room"""
+        dropped = len(self._frames) == self._frames.maxlen
+        self._frames.append(frame)
+        self._ready.set()
+        return dropped
+
+    def close(self):
+        """No frame will follow, the ones waiting are still delivered"""
+        self.closed = True
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Next frame, `None` if there wasn't any after `timeout` seconds or once closed and drained"""
+        if not self._frames and not self.closed:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._frames.popleft() if self._frames else None
+
+
+class DeploymentEventHub:
+    """
+    Fans out the events of the deployments to their subscribers, as they happen. Events are encoded once whatever
+    the number of subscribers, and not at all for agents nobody follows.
+    """
+
+    buffer_size: int
+    max_subscribers: int
+
+    def __init__(self, buffer_size: int, max_subscribers: int):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._next_id = 0
+        self.subscribers = 0
+        self.dropped = 0
+
+    def subscribe(self, agent_id: str) -> Optional[Subscription]:
+        """Follow the events of an agent, `None` if there are already `max_subscribers` subscriptions"""
+        if self.subscribers >= self.max_subscribers:
+            return None
+
+        subscription = Subscription(agent_id, maxsize=self.buffer_size)
+        self._subscriptions.setdefault(agent_id, set()).add(subscription)
+        self.subscribers += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.agent_id)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.agent_id]
+        self.subscribers -= 1
+
+    def encode(self, event_type: DeploymentEventType, deployment: FetchedAgentDeployment, **fields) -> bytes:
+        """Server-Sent Events frame of an event about the current state of a deployment"""
+        event = DeploymentEvent.construct(
+            type=event_type, timestamp=time.time(), status=deployment.status, deployment=deployment, **fields
+        )
+        self._next_id += 1
+        data = orjson.dumps(deployment_event_content(event))
+        return b"id: %d\nevent: %s\ndata: %s\n\n" % (self._next_id, event_type.value.encode(), data)
+
+    def _deliver(self, subscription: Subscription, frame: bytes, deployment: FetchedAgentDeployment):
+        if subscription.put(frame):
+            self.dropped += 1
+            events_dropped.inc()
+        # Nothing happens to an agent once alive
+        if deployment.status == AgentDeploymentStatus.ALIVE:
+            subscription.close()
+
+    def send_state(self, subscription: Subscription, deployment: FetchedAgentDeployment):
+        """Send the current state of the deployment to a new subscriber"""
+        self._deliver(subscription, self.encode(DeploymentEventType.STATUS, deployment), deployment)
+
+    def publish(self, event_type: DeploymentEventType, deployment: FetchedAgentDeployment, **fields):
+        subscriptions = self._subscriptions.get(deployment.id)
+        if not subscriptions:
+            return
+
+        frame = self.encode(event_type, deployment, **fields)
+        for subscription in subscriptions:
+            self._deliver(subscription, frame, deployment)
+
+
+deployment_events = DeploymentEventHub(
+    buffer_size=config.EVENTS_BUFFER_SIZE,
+    max_subscribers=config.EVENTS_MAX_SUBSCRIBERS,
+)
+event_subscribers.set_function(lambda: deployment_events.subscribers)
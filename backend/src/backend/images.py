@@ -0,0 +1,125 @@
+import asyncio
+import shlex
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Optional, Set
+
+from backend.aleph import get_code_file, get_code_hash
+from backend.artifacts import ArtifactCache
+from backend.cache import MISSING, TTLCache
+from backend.config import config
+from backend.metrics import register_cache
+from backend.utils import run_in_subprocess
+
+IMAGE_NAME = "libertai-agent"
+# Architecture of the Aleph instances, whatever the backend host is
+IMAGE_PLATFORM = "linux/amd64"
+PYTHON_VERSION = "3.12"
+DEPENDENCIES_MANAGER = "poetry"
+
+
+def find_code_root(path: Path) -> Path:
+    """Same lookup as the deployment script, the zip may hold the code directly or inside a single folder"""
+    if any(child.is_file() for child in path.iterdir()):
+        return path
+
+    folders = sorted(child for child in path.iterdir() if child.is_dir())
+    return folders[0] if folders else path
+
+
+def _extract_zip(filename: str, path: Path):
+    with zipfile.ZipFile(filename) as zip_file:
+        zip_file.extractall(path)
+
+
+class AgentImageBuilder:
+    """
+    Builds the agent container image once per source code hash on the backend host and keeps it as a compressed
+    `docker save` tarball, so the instances only need to load and run it.
+    """
+
+    images: ArtifactCache
+    # Code hashes whose last build failed, they aren't retried until their entry expires
+    failures: TTLCache[str, bool]
+
+    def __init__(self, images: ArtifactCache, enabled: bool, failure_ttl: float):
+        self.images = images
+        self.enabled = enabled and shutil.which("docker") is not None
+        self.failures = TTLCache(maxsize=1024, ttl=failure_ttl)
+        self._background_tasks: Set[asyncio.Task] = set()
+
+    async def get_image(self, code_hash: str) -> Optional[str]:
+        """
+        Returns the image tarball for some code, building it if needed. None means the instance must build it.
+        """
+        if not self.enabled or self.failures.get(code_hash) is not MISSING:
+            return None
+
+        try:
+            image_path = await self.images.get(code_hash, self._build)
+        except Exception as error:
+            print(f"Error building the image for code {code_hash}: {str(error)}")
+            image_path = None
+
+        if image_path is None:
+            self.failures.set(code_hash, True)
+            return None
+        return str(image_path)
+
+    def prefetch(self, agent_hash: str):
+        """Start building the image of an agent in the background, as soon as its deployment is registered"""
+        if not self.enabled:
+            return
+
+        task = asyncio.create_task(self._prefetch(agent_hash))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _prefetch(self, agent_hash: str):
+        code_hash = await get_code_hash(agent_hash)
+        if code_hash:
+            await self.get_image(code_hash)
+
+    async def _build(self, code_hash: str, destination: Path) -> bool:
+        code_filename = await get_code_file(code_hash)
+        if not code_filename:
+            return False
+
+        tag = f"{IMAGE_NAME}:{code_hash}"
+        build_path = Path(tempfile.mkdtemp(prefix="agent-build-"))
+        try:
+            await asyncio.to_thread(_extract_zip, code_filename, build_path)
+
+            await run_in_subprocess([
+                "docker", "buildx", "build", "-q", str(find_code_root(build_path)),
+                "-f", f"{config.SCRIPTS_PATH}/{DEPENDENCIES_MANAGER}.Dockerfile",
+                "-t", tag,
+                "--platform", IMAGE_PLATFORM,
+                "--build-arg", f"PYTHON_VERSION={PYTHON_VERSION}",
+            ])
+            try:
+                await run_in_subprocess([
+                    "bash", "-c",
+                    f"set -o pipefail && docker save {shlex.quote(tag)} | gzip -1 > {shlex.quote(str(destination))}",
+                ])
+            finally:
+                # The tarball is the cached copy, don't keep the image in the Docker store as well
+                await run_in_subprocess(["docker", "image", "rm", tag], check=False)
+        finally:
+            shutil.rmtree(build_path, ignore_errors=True)
+
+        return True
+
+
+agent_images = AgentImageBuilder(
+    images=ArtifactCache(
+        directory=config.IMAGES_PATH,
+        extension=".tar.gz",
+        max_size=config.IMAGES_MAX_SIZE,
+    ),
+    enabled=config.AGENT_IMAGE_BUILD,
+    failure_ttl=config.AGENT_IMAGE_FAILURE_TTL,
+)
+register_cache("agent_images", agent_images.images)
@@ -0,0 +1,130 @@
+import asyncio
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from backend.config import config
+from backend.utils import generate_ssh_key_pair
+
+
+def _create_executor() -> ProcessPoolExecutor:
+    # RSA generation takes up to seconds of CPU, it runs in a separate process to keep the event loop responsive
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _key_paths(directory: Path, name: str) -> Tuple[Path, Path]:
+    return directory / f"{name}_private.key", directory / f"{name}_public.key"
+
+
+class SSHKeyPool:
+    """
+    Keeps `size` SSH key pairs generated in advance, so assigning keys to a new deployment is only a file rename.
+    The ready pairs are stored in a folder and survive restarts, the pool is refilled in the background.
+    """
+
+    directory: Path
+    size: int
+    key_type: str
+
+    def __init__(self, directory: str, size: int, key_type: str):
+        self.directory = Path(directory)
+        self.size = size
+        self.key_type = key_type
+        self._ready: List[str] = []
+        self._refill: Optional[asyncio.Task] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for private_key_path in self.directory.glob("*_private.key"):
+            name = private_key_path.name.removesuffix("_private.key")
+            _, public_key_path = _key_paths(self.directory, name)
+            if public_key_path.exists():
+                self._ready.append(name)
+            else:
+                private_key_path.unlink(missing_ok=True)
+
+    @property
+    def available(self) -> int:
+        return len(self._ready)
+
+    async def start(self):
+        self._executor = _create_executor()
+        self._schedule_refill()
+
+    async def stop(self):
+        if self._refill:
+            self._refill.cancel()
+            await asyncio.gather(self._refill, return_exceptions=True)
+            self._refill = None
+        if self._executor:
+            # Don't wait for a generation in progress, its pair would be discarded anyway
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def assign(self, private_key_path: Path, public_key_path: Path) -> Tuple[str, str]:
+        """
+        Move a ready pair to the given paths and return it, a pair is generated on the spot if the pool is empty.
+        """
+        if self._ready:
+            name = self._ready.pop()
+            pool_private_key_path, pool_public_key_path = _key_paths(self.directory, name)
+            os.replace(pool_public_key_path, public_key_path)
+            os.replace(pool_private_key_path, private_key_path)
+            ssh_private_key, ssh_public_key = private_key_path.read_text(), public_key_path.read_text()
+        else:
+            ssh_private_key, ssh_public_key = await self._generate()
+            _write_key_pair(private_key_path, public_key_path, ssh_private_key, ssh_public_key)
+
+        self._schedule_refill()
+        return ssh_private_key, ssh_public_key
+
+    def _schedule_refill(self):
+        if len(self._ready) < self.size and (self._refill is None or self._refill.done()):
+            self._refill = asyncio.create_task(self._fill())
+
+    async def _fill(self):
+        while len(self._ready) < self.size:
+            try:
+                ssh_private_key, ssh_public_key = await self._generate()
+            except Exception as error:
+                print(f"Error generating a SSH key pair: {str(error)}")
+                return
+
+            name = uuid.uuid4().hex
+            _write_key_pair(*_key_paths(self.directory, name), ssh_private_key, ssh_public_key)
+            self._ready.append(name)
+
+    async def _generate(self) -> Tuple[str, str]:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, generate_ssh_key_pair, self.key_type)
+        except BrokenProcessPool:
+            # The worker process died, the next generation starts a new one
+            self._executor = _create_executor()
+            raise
+
+
+def _write_key_pair(private_key_path: Path, public_key_path: Path, ssh_private_key: str, ssh_public_key: str):
+    # Write the private key first, a pair is only considered complete once its public key exists
+    private_key_path.write_text(ssh_private_key)
+    private_key_path.chmod(0o600)
+    public_key_path.write_text(ssh_public_key)
+
+
+ssh_key_pool = SSHKeyPool(
+    directory=f"{config.KEYS_PATH}/pool",
+    size=config.SSH_KEY_POOL_SIZE,
+    key_type=config.SSH_KEY_TYPE,
+)
+
+
+async def create_or_recover_ssh_keys(agent_id: str) -> Tuple[str, str]:
+    private_key_path, public_key_path = _key_paths(Path(config.KEYS_PATH), agent_id)
+    if private_key_path.exists() and public_key_path.exists():
+        return private_key_path.read_text(), public_key_path.read_text()
+
+    return await ssh_key_pool.assign(private_key_path, public_key_path)
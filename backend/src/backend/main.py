@@ -1,28 +1,73 @@
 import time
 from decimal import Decimal
+from http import HTTPStatus
 
 from fastapi import FastAPI, Depends, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from starlette.middleware.cors import CORSMiddleware
 
-from aleph.sdk.client.authenticated_http import AuthenticatedAlephHttpClient
-from aleph_message.models import Chain
-
-from .agent import get_agent
-from .blockchain import CustomETHAccount, web3_from_wei
+from .agent import agent_versions, cache_agent, get_agent, record_agent_version
+from .blockchain import load_account, web3_from_wei
+from .clients import clients
 from .config import config
-from .models import AgentDeployment, AgentDeploymentStatus, AgentRequest
+from .crn import crn_selector
+from .crypto import crypto_executor
+from .events import Subscription, deployment_events
+from .images import agent_images
+from .keys import ssh_key_pool
+from .metrics import deployment_queue_depth, deployments_in_flight, registry
+from .models import AgentDeployment, AgentDeploymentStatus, AgentRequest, FetchedAgentDeployment
+from .multicall import read_wallet_balances
 from .orchestrator import DeploymentOrchestrator
-from .utils import check_agent_key, generate_predictable_key
+from .publisher import status_publisher
+from .serialization import agent_post_content, deployment_response
+from .state import state_store
+from .timeline import DeploymentTimeline, deployment_timelines
+from .utils import generate_predictable_key
 
 # TODO: Calculate required tokens in realtime
 MINIMUM_REQUIRED_AMOUNT = Decimal(0.005)  # At least have around $10 in ETH
 
 
+async def start_services(application: FastAPI):
+    orchestrator = DeploymentOrchestrator()
+    application.state.orchestrator = orchestrator
+    await orchestrator.scheduler.start()
+
+    deployment_queue_depth.set_function(lambda: orchestrator.scheduler.queue_depth)
+    deployments_in_flight.set_function(lambda: orchestrator.scheduler.in_flight)
+
+    # Open the pooled HTTP sessions once and keep them alive during the whole app lifetime
+    await clients.start()
+    # Probe the CRNs in the background so new instances don't wait for it
+    if config.CRN_SELECTION:
+        await crn_selector.start()
+    await crypto_executor.start()
+    # Generate SSH keys ahead of the deployments that will need them
+    await ssh_key_pool.start()
+
+    # Pick up the deployments interrupted by the last shutdown or crash
+    resumed = await orchestrator.resume()
+    if resumed:
+        print(f"Resuming {resumed} unfinished agent deployments")
+
+
+async def stop_services(application: FastAPI):
+    await application.state.orchestrator.scheduler.stop()
+    await status_publisher.stop()
+    await crypto_executor.stop()
+    await ssh_key_pool.stop()
+    await state_store.close()
+    await crn_selector.stop()
+    await clients.close()
+
+
 # FastAPI Application Factory
 def create_app() -> FastAPI:
     """Creates the FastAPI application.
     """
-    application = FastAPI(title='CreAItors agents')
+    application = FastAPI(title='CreAItors agents', default_response_class=ORJSONResponse)
 
     application.add_middleware(
         CORSMiddleware,
@@ -33,8 +78,12 @@ def create_app() -> FastAPI:
 
     # Register our singleton service for DI once when the app has finished startup
     @application.on_event('startup')
-    def load_orchestrator_service():
-        application.state.orchestrator = DeploymentOrchestrator()
+    async def load_orchestrator_service():
+        await start_services(application)
+
+    @application.on_event('shutdown')
+    async def stop_orchestrator_service():
+        await stop_services(application)
 
     return application
 
@@ -54,11 +103,16 @@ async def index():
     }
 
 
+@app.get("/metrics", description="Deployment pipeline metrics in the Prometheus text format")
+async def get_metrics():
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/agent", description="Setup a new autonomous agent")
 async def create_agent_deployment(agent_request: AgentRequest):
     agent_account_key = agent_request.agent_key
     agent_id = agent_request.agent_id
-    verify_result = check_agent_key(agent_request.agent_id, agent_request.owner, agent_account_key)
+    verify_result = await crypto_executor.check_agent_key(agent_request.agent_id, agent_request.owner, agent_account_key)
 
     if not verify_result:
         return {
@@ -73,8 +127,7 @@ async def create_agent_deployment(agent_request: AgentRequest):
             "message": f"Agent {agent_id} already deployed"
         }
 
-    agent_proof_key = generate_predictable_key(agent_account_key)
-    aleph_account = CustomETHAccount(agent_proof_key, chain=Chain.BASE)
+    aleph_account = await load_account(generate_predictable_key(agent_account_key))
     address = aleph_account.get_address()
 
     agent = AgentDeployment(
@@ -89,15 +142,18 @@ async def create_agent_deployment(agent_request: AgentRequest):
         status=AgentDeploymentStatus.PENDING_FUND,
     )
 
-    async with AuthenticatedAlephHttpClient(
-            account=aleph_account, api_server=config.ALEPH_API_URL
-    ) as client:
-        await client.create_post(
+    async with clients.authenticated_aleph_client(aleph_account) as client:
+        post_message, _status = await client.create_post(
             address=address,
-            post_content=agent.dict(),
+            post_content=agent_post_content(agent),
             post_type=config.ALEPH_AGENT_DEPLOYMENT_POST_TYPE,
             channel=config.ALEPH_CHANNEL,
         )
+    # Replace the negative entry cached by the existence check above
+    cache_agent(FetchedAgentDeployment(**agent.dict(), post_hash=post_message.item_hash, instance_ip=None))
+
+    # Build the agent image while the wallet is being funded
+    agent_images.prefetch(agent.agent_hash)
 
     return {
         "required_tokens": agent.required_tokens,
@@ -113,7 +169,7 @@ async def deploy_agent(
     agent_id = agent_request.agent_id
     agent_account_key = agent_request.agent_key
 
-    verify_result = check_agent_key(agent_id, agent_request.owner, agent_account_key)
+    verify_result = await crypto_executor.check_agent_key(agent_id, agent_request.owner, agent_account_key)
     if not verify_result:
         return {
             "error": True,
@@ -127,10 +183,10 @@ async def deploy_agent(
             "message": f"Agent {agent_id} not found"
         }
 
-    agent_proof_key = generate_predictable_key(agent_account_key)
-    aleph_account = CustomETHAccount(agent_proof_key, chain=Chain.BASE)
+    aleph_account = await load_account(generate_predictable_key(agent_account_key))
     wallet_address = aleph_account.get_address()
-    eth_balance = web3_from_wei(int(aleph_account.get_eth_balance()), "ether")
+    balances = await read_wallet_balances([wallet_address])
+    eth_balance = web3_from_wei(int(balances[wallet_address].eth_balance), "ether")
 
     print(wallet_address)
 
@@ -144,7 +200,7 @@ async def deploy_agent(
     # Create and start the autonomous agent deployment
     deployment = orchestrator.get(agent_id=str(agent_id), deploy=True)
     if not deployment:
-        orchestrator.new(
+        await orchestrator.new(
             deployment=agent,
             aleph_account=aleph_account,
             env_variables=agent_request.env_variables
@@ -159,12 +215,20 @@ async def deploy_agent(
 @app.get("/agent/{agent_id}", description="Get an agent information")
 async def get_agent_info(
     agent_id: str,
+    request: Request,
     orchestrator: DeploymentOrchestrator = Depends(get_orchestrator_service)
 ):
     """Get an agent by an agent ID"""
+    # Polling clients revalidate their copy, answered from the known validators without looking up the agent
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        version = agent_versions.get(agent_id, None)
+        if version and version.matches(if_none_match):
+            return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=version.headers())
+
     deployment = orchestrator.get(agent_id)
     if deployment:
-        return deployment.deployment
+        return deployment_response(deployment.deployment, record_agent_version(deployment.deployment))
 
     agent = await get_agent(agent_id)
     if not agent:
@@ -173,4 +237,82 @@ async def get_agent_info(
             "message": f"Agent with id {agent_id} not found",
         }
 
-    return agent
+    return deployment_response(agent, record_agent_version(agent))
+
+
+async def _event_stream(subscription: Subscription):
+    try:
+        yield b"retry: %d\n\n" % (config.EVENTS_RETRY_INTERVAL * 1000)
+        while True:
+            frame = await subscription.get(timeout=config.EVENTS_KEEPALIVE_INTERVAL)
+            if frame is not None:
+                yield frame
+            elif subscription.closed:
+                return
+            else:
+                # Idle stream, a comment line keeps the proxies from closing it
+                yield b": keepalive\n\n"
+    finally:
+        deployment_events.unsubscribe(subscription)
+
+
+@app.get("/agent/{agent_id}/events", description="Follow an agent deployment progress as Server-Sent Events")
+async def stream_agent_events(
+    agent_id: str,
+    orchestrator: DeploymentOrchestrator = Depends(get_orchestrator_service)
+):
+    """
+    Sends the current state, then every status change, retry and failure of the deployment as they happen. The
+    stream ends once the agent is ALIVE.
+    """
+    # Subscribe before reading the current state so that no change is missed in between
+    subscription = deployment_events.subscribe(agent_id)
+    if subscription is None:
+        return {
+            "error": True,
+            "message": "Too many event streams open, poll the agent status instead",
+        }
+
+    orchestration = orchestrator.get(agent_id)
+    try:
+        deployment = orchestration.deployment if orchestration else await get_agent(agent_id, check_result=False)
+    except Exception:
+        deployment_events.unsubscribe(subscription)
+        raise
+    if not deployment:
+        deployment_events.unsubscribe(subscription)
+        return {
+            "error": True,
+            "message": f"Agent with id {agent_id} not found",
+        }
+
+    deployment_events.send_state(subscription, deployment)
+    return StreamingResponse(
+        _event_stream(subscription),
+        media_type="text/event-stream",
+        # Sent as they come, not buffered by reverse proxies
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/agent/{agent_id}/timeline", description="Get the stages and timings of an agent deployment")
+async def get_agent_timeline(
+    agent_id: str,
+    orchestrator: DeploymentOrchestrator = Depends(get_orchestrator_service)
+):
+    events = deployment_timelines.get(agent_id)
+    if events is None:
+        return {
+            "error": True,
+            "message": f"No deployment timeline for agent with id {agent_id}",
+        }
+
+    orchestration = orchestrator.get(agent_id)
+    deployment = orchestration.deployment if orchestration else await get_agent(agent_id, check_result=False)
+
+    return DeploymentTimeline(
+        agent_id=agent_id,
+        status=deployment.status if deployment else None,
+        last_update=deployment.last_update if deployment else None,
+        events=events,
+    )
@@ -0,0 +1,132 @@
+import functools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+
+from backend.timeline import deployment_timelines
+
+# Deployment stages last from seconds to tens of minutes, dependency calls from milliseconds to minutes
+STAGE_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class CacheCollector(Collector):
+    """Reads the `hits` and `misses` counters of the registered caches when the metrics are collected"""
+
+    def __init__(self) -> None:
+        self.caches: Dict[str, Any] = {}
+
+    def collect(self) -> Iterator[Metric]:
+        hits = CounterMetricFamily("creaitors_cache_hits", "Cache lookups served from memory", labels=["cache"])
+        misses = CounterMetricFamily("creaitors_cache_misses", "Cache lookups that missed", labels=["cache"])
+        hit_ratio = GaugeMetricFamily(
+            "creaitors_cache_hit_ratio", "Share of cache lookups served from memory", labels=["cache"]
+        )
+        for name, cache in self.caches.items():
+            lookups = cache.hits + cache.misses
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+            hit_ratio.add_metric([name], cache.hits / lookups if lookups else 0)
+        yield hits
+        yield misses
+        yield hit_ratio
+
+
+# Only the metrics of the deployment pipeline, without the default process and platform collectors
+registry = CollectorRegistry()
+cache_collector = CacheCollector()
+registry.register(cache_collector)
+
+stage_duration = Histogram(
+    "creaitors_deployment_stage_duration_seconds",
+    "Time spent by a deployment in a stage, by status the stage starts from",
+    ("stage", "outcome"),
+    buckets=STAGE_BUCKETS,
+    registry=registry,
+)
+deployment_ready_duration = Histogram(
+    "creaitors_deployment_time_to_ready_seconds",
+    "Time between a new instance allocation and its SSH port answering",
+    buckets=STAGE_BUCKETS,
+    registry=registry,
+)
+dependency_duration = Histogram(
+    "creaitors_dependency_request_duration_seconds",
+    "Latency of the calls to external dependencies",
+    ("dependency", "operation"),
+    buckets=REQUEST_BUCKETS,
+    registry=registry,
+)
+dependency_errors = Counter(
+    "creaitors_dependency_errors",
+    "Failed calls to external dependencies",
+    ("dependency", "operation"),
+    registry=registry,
+)
+deployment_queue_depth = Gauge(
+    "creaitors_deployment_queue_depth",
+    "Deployments waiting for a scheduler worker",
+    registry=registry,
+)
+deployments_in_flight = Gauge(
+    "creaitors_deployments_in_flight",
+    "Deployments being processed by a scheduler worker",
+    registry=registry,
+)
+status_publish_queue_depth = Gauge(
+    "creaitors_status_publish_queue_depth",
+    "Agents with a status amend waiting to be published",
+    registry=registry,
+)
+event_subscribers = Gauge(
+    "creaitors_event_subscribers",
+    "Clients following the events of a deployment",
+    registry=registry,
+)
+events_dropped = Counter(
+    "creaitors_events_dropped",
+    "Deployment events dropped from the buffer of a slow subscriber",
+    registry=registry,
+)
+
+
+def register_cache(name: str, cache):
+    """Expose the `hits` and `misses` counters of a cache"""
+    cache_collector.caches[name] = cache
+
+
+@asynccontextmanager
+async def track_dependency(dependency: str, operation: str):
+    """Record the duration of a call to an external dependency and count its failures"""
+    start = time.monotonic()
+    success = False
+    try:
+        yield
+        success = True
+    except Exception:
+        dependency_errors.labels(dependency=dependency, operation=operation).inc()
+        raise
+    finally:
+        duration = time.monotonic() - start
+        dependency_duration.labels(dependency=dependency, operation=operation).observe(duration)
+        deployment_timelines.record_call(f"{dependency}.{operation}", duration, success)
+
+
+def instrumented(dependency: str, operation: Optional[str] = None):
+    """Decorator version of `track_dependency` for coroutine functions, the operation defaults to the function name"""
+
+    def decorator(function):
+        name = operation or function.__name__
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            async with track_dependency(dependency, name):
+                return await function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,4 +1,3 @@
-from copy import deepcopy
 from decimal import Decimal
 from enum import Enum
 from typing import Optional, Dict
@@ -26,6 +25,12 @@ class AgentRequest(BaseModel):
     env_variables: Dict[str, str] = {}
 
 
+class CRNInfo(BaseModel):
+    url: str
+    hash: str
+    receiver_address: str
+
+
 class PublicAgentDeployment(BaseModel):
     id: str
     name: str
@@ -40,23 +45,14 @@ class PublicAgentDeployment(BaseModel):
 
 class AgentDeployment(PublicAgentDeployment):
     tags: list[str]
+    # CRN selected for the instance, None on deployments created before the selection was recorded
+    crn: Optional[CRNInfo] = None
 
 
 class FetchedAgentDeployment(AgentDeployment):
     post_hash: Optional[str]
     instance_ip: str | None
 
-    def to_message(self):
-        message = deepcopy(self)
-        message.post_hash = None
-        return message
-
-
-class CRNInfo(BaseModel):
-    url: str
-    hash: str
-    receiver_address: str
-
 
 class HostNotFoundError(Exception):
     pass
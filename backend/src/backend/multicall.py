@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from aleph.sdk.evm_utils import BALANCEOF_ABI
+from pydantic import BaseModel
+from superfluid.src.constants import CFA_V1_ABI  # type: ignore[import-untyped]
+from superfluid.src.utils import get_network  # type: ignore[import-untyped]
+from web3 import Web3
+from web3.contract import AsyncContract
+
+from backend.blockchain import (
+    ALEPH_ADDRESS,
+    BASE_CHAIN_ID,
+    aleph_pool_contract,
+    async_w3,
+)
+from backend.config import config
+from backend.metrics import instrumented
+
+# Same address on every EVM chain, Base included
+MULTICALL3_ADDRESS = Web3.to_checksum_address("0xcA11bde05977b3631167028862bE2a173976CA11")
+
+code_dir = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(code_dir, "abis/multicall3.json"), "r") as abi_file:
+    MULTICALL3_ABI = json.load(abi_file)
+
+multicall_contract = async_w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+aleph_token_contract = async_w3.eth.contract(address=ALEPH_ADDRESS, abi=BALANCEOF_ABI)
+superfluid_cfa_contract = async_w3.eth.contract(address=get_network(BASE_CHAIN_ID).CFA_V1, abi=CFA_V1_ABI)
+
+
+class WalletChainSnapshot(BaseModel):
+    """
+    Chain state needed by a deployment, read at a single block. Balances and flow rates use the same raw units as
+    `ETHAccount.get_eth_balance`, `ETHAccount.get_token_balance` and `ETHAccount.get_flow`.
+    """
+
+    address: str
+    block_number: int
+    base_fee: int
+    eth_balance: Decimal
+    aleph_balance: Decimal
+    flow_rates: Dict[str, Decimal]
+    sqrt_price_x96: int
+
+
+class WalletBalances(BaseModel):
+    eth_balance: Decimal
+    aleph_balance: Decimal
+
+
+class _Call:
+    def __init__(self, contract: AsyncContract, fn_name: str, args: Optional[List[Any]] = None):
+        self.target = contract.address
+        self.call_data = contract.encodeABI(fn_name=fn_name, args=args or [])
+        self.output_types = [output["type"] for output in contract.get_function_by_name(fn_name).abi["outputs"]]
+
+    def decode(self, success: bool, return_data: bytes) -> Tuple[Any, ...]:
+        if not success:
+            raise ValueError(f"Multicall to {self.target} failed")
+        return async_w3.codec.decode(self.output_types, return_data)
+
+
+@instrumented("rpc", "multicall")
+async def _aggregate(calls: List[_Call]) -> List[Tuple[Any, ...]]:
+    results = await multicall_contract.functions.aggregate3(
+        [(call.target, False, call.call_data) for call in calls]
+    ).call()
+    return [call.decode(success, return_data) for call, (success, return_data) in zip(calls, results)]
+
+
+async def read_wallet_snapshot(address: str, flow_receivers: List[str]) -> WalletChainSnapshot:
+    """
+    Reads the block, base fee, wallet balances, existing flows to `flow_receivers` and the ALEPH pool price
+    in one `eth_call`.
+    """
+    address = Web3.to_checksum_address(address)
+    receivers = [Web3.to_checksum_address(receiver) for receiver in flow_receivers]
+
+    calls = [
+        _Call(multicall_contract, "getBlockNumber"),
+        _Call(multicall_contract, "getBasefee"),
+        _Call(multicall_contract, "getEthBalance", [address]),
+        _Call(aleph_token_contract, "balanceOf", [address]),
+        _Call(aleph_pool_contract, "slot0"),
+        *[_Call(superfluid_cfa_contract, "getFlow", [ALEPH_ADDRESS, address, receiver]) for receiver in receivers],
+    ]
+    block_number, base_fee, eth_balance, aleph_balance, slot0, *flows = await _aggregate(calls)
+
+    return WalletChainSnapshot(
+        address=address,
+        block_number=block_number[0],
+        base_fee=base_fee[0],
+        eth_balance=Decimal(eth_balance[0]),
+        aleph_balance=Decimal(aleph_balance[0]),
+        # Keys are the receivers as given by the caller
+        flow_rates={receiver: Decimal(flow[1]) for receiver, flow in zip(flow_receivers, flows)},
+        sqrt_price_x96=slot0[0],
+    )
+
+
+async def read_wallet_balances(addresses: List[str]) -> Dict[str, WalletBalances]:
+    """
+    Reads ETH and ALEPH balances of many wallets, batching `MULTICALL_BATCH_SIZE` wallets per `eth_call`.
+    """
+    batch_size = config.MULTICALL_BATCH_SIZE
+
+    async def read_batch(batch: List[str]) -> Dict[str, WalletBalances]:
+        calls = []
+        for address in batch:
+            checksum_address = Web3.to_checksum_address(address)
+            calls.append(_Call(multicall_contract, "getEthBalance", [checksum_address]))
+            calls.append(_Call(aleph_token_contract, "balanceOf", [checksum_address]))
+
+        results = await _aggregate(calls)
+        return {
+            address: WalletBalances(
+                eth_balance=Decimal(results[index * 2][0]),
+                aleph_balance=Decimal(results[index * 2 + 1][0]),
+            )
+            for index, address in enumerate(batch)
+        }
+
+    batches = await asyncio.gather(
+        *[read_batch(addresses[index:index + batch_size]) for index in range(0, len(addresses), batch_size)]
+    )
+
+    balances: Dict[str, WalletBalances] = {}
+    for batch_balances in batches:
+        balances.update(batch_balances)
+    return balances
@@ -2,25 +2,39 @@ import asyncio
 import time
 
 from decimal import Decimal
-from typing import Dict, Optional
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Optional
 
 from aleph.sdk.chains.ethereum import ETHAccount
-from aleph.sdk.client.authenticated_http import AuthenticatedAlephHttpClient
+from aleph.sdk.conf import settings
 from aleph_message.models import PostMessage
 
+from pydantic import Field, PrivateAttr
 from pydantic.main import BaseModel
 
-from backend.agent import get_agent
-from backend.aleph import notify_allocation, fetch_instance_ip, amend_message, \
-    get_instance_price, create_instance_flow, create_instance_message
-from backend.blockchain import make_eth_to_aleph_conversion, convert_aleph_to_eth
+from backend.agent import get_agent, record_agent_version
+from backend.aleph import notify_allocation, fetch_instance_ip, wait_for_instance_ip, \
+    get_instance_price, create_instance_flow, create_instance_message, get_code_file, get_code_hash, get_rootfs_size
+from backend.blockchain import make_eth_to_aleph_conversion, convert_aleph_to_eth, aleph_price_oracle, \
+    load_account
+from backend.clients import clients
 from backend.config import config
-from backend.models import CRNInfo, AgentDeploymentStatus, FetchedAgentDeployment, HostNotFoundError
+from backend.crn import crn_executions, crn_selector
+from backend.events import DeploymentEventType, deployment_events
+from backend.images import agent_images
+from backend.keys import create_or_recover_ssh_keys
+from backend.metrics import deployment_ready_duration, stage_duration, track_dependency
+from backend.models import CRNInfo, AgentDeploymentStatus, FetchedAgentDeployment
+from backend.multicall import read_wallet_balances, read_wallet_snapshot
+from backend.publisher import status_publisher
+from backend.scheduler import DeploymentScheduler, PRIORITY_RESUME
 from backend.ssh import agent_ssh_deployment
-from backend.utils import check_connectivity, run_in_new_loop, format_cost, create_or_recover_ssh_keys, clean_ssh_keys
+from backend.state import state_store
+from backend.timeline import TimelineEventType, current_agent_id, deployment_timelines
+from backend.utils import backoff_delays, wait_for_ssh, format_cost, clean_ssh_keys
 
 ALEPH_COMMUNITY_RECEIVER = "0x5aBd3258C5492fD378EBC2e0017416E199e5Da56"
-TARGET_CRN = CRNInfo(
+# Used when the selection is disabled or no CRN of the network qualifies
+DEFAULT_CRN = CRNInfo(
     url="https://gpu-test-02.nergame.app",
     hash="e9423d9f9fd27cdc9c4c27d5cf3120ef573eece260d44e6df76b3c27569a3154",
     receiver_address="0xA07B1214bAe0D5ccAA25449C3149c0aC83658874",
@@ -35,107 +49,226 @@ class AgentOrchestration(BaseModel):
     creator_wallet: Optional[str] = None
     env_variables: Dict[str, str] = {}
     running: bool = False
+    time_to_ready: Optional[float] = None
+    _prefetches: Dict[str, asyncio.Task] = PrivateAttr(default_factory=dict)
 
     class Config:
         arbitrary_types_allowed = True
 
+    @property
+    def crn(self) -> CRNInfo:
+        return self.deployment.crn or DEFAULT_CRN
+
     async def deploy(self):
         try:
             if not self.running:
                 self.running = True
-                # Refresh agent post from the network
+                current_agent_id.set(str(self.deployment.id))
+                # Start the lookups of the next stages while refreshing the state
+                self._start_prefetches()
+                # Refresh agent post from the network, unless the local state is ahead of it
                 agent = await get_agent(str(self.deployment.id))
-                self.deployment = agent
-                # Get agent creator wallet
-                if not self.creator_wallet:
-                    async with AuthenticatedAlephHttpClient(
-                            account=self.aleph_account, api_server=config.ALEPH_API_URL
-                    ) as client:
-                        agent_message = await client.get_message(self.deployment.agent_hash, with_status=False)
-                        if not agent_message:
-                            raise ValueError(f"Agent with hash {self.deployment.agent_hash} not found")
-
-                        if not isinstance(agent_message, PostMessage):
-                            raise ValueError(f"Hash {self.deployment.agent_hash} isn't an agent")
-
-                        self.creator_wallet = agent_message.content.address
+                if agent.last_update > self.deployment.last_update:
+                    self.deployment = agent
 
                 await self._continue_actions()
-        except:
+        except Exception as error:
+            deployment_timelines.record(
+                self.deployment.id, TimelineEventType.FAILED, stage=self.deployment.status, reason=str(error)
+            )
+            deployment_events.publish(DeploymentEventType.FAILED, self.deployment, reason=str(error))
+            await state_store.record_failure(self.deployment.id, str(error))
             raise
         finally:
             self.running = False
 
+    async def save(self):
+        record_agent_version(self.deployment)
+        await state_store.save(
+            deployment=self.deployment,
+            private_key=self.aleph_account.private_key.hex(),
+            creator_wallet=self.creator_wallet,
+            env_variables=self.env_variables,
+        )
+
+    async def _publish(self):
+        # Persist the new stage locally, a restart resumes from there, the post amend is sent in the background
+        self.deployment.last_update = int(time.time())
+        await self.save()
+        status_publisher.publish(self.aleph_account, self.deployment)
+        deployment_events.publish(DeploymentEventType.STATUS, self.deployment)
+
+    def _prefetch(self, name: str, fetch: Callable[[], Coroutine[Any, Any, Any]]) -> asyncio.Task:
+        """
+        Start a lookup in the background, or return the one already started. Failed lookups are started again.
+        """
+        task = self._prefetches.get(name)
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            task = asyncio.create_task(fetch())
+            # Errors are raised to the stage awaiting the result, not logged as never retrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._prefetches[name] = task
+        return task
+
+    def _start_prefetches(self):
+        status = self.deployment.status
+        if status == AgentDeploymentStatus.ALIVE:
+            return
+
+        if not self.creator_wallet:
+            self._prefetch("creator_wallet", self._fetch_creator_wallet)
+        if status == AgentDeploymentStatus.PENDING_FUND:
+            self._prefetch("rootfs_size", lambda: get_rootfs_size(settings.UBUNTU_24_QEMU_ROOTFS_ID))
+        if status == AgentDeploymentStatus.PENDING_SWAP and self.deployment.instance_hash:
+            instance_hash = self.deployment.instance_hash
+            self._prefetch("instance_price", lambda: get_instance_price(instance_hash))
+        self._prefetch("code", self._fetch_code)
+
+    def _cancel_prefetches(self):
+        for task in self._prefetches.values():
+            task.cancel()
+        self._prefetches = {}
+
+    async def _fetch_creator_wallet(self) -> str:
+        async with track_dependency("aleph", "get_agent_message"), clients.aleph_client() as client:
+            agent_message = await client.get_message(self.deployment.agent_hash, with_status=False)
+        if not agent_message:
+            raise ValueError(f"Agent with hash {self.deployment.agent_hash} not found")
+
+        if not isinstance(agent_message, PostMessage):
+            raise ValueError(f"Hash {self.deployment.agent_hash} isn't an agent")
+
+        return agent_message.content.address
+
+    async def _fetch_code(self) -> str:
+        """Download the agent code, or build its image, ahead of the code deployment"""
+        code_hash = await get_code_hash(self.deployment.agent_hash)
+        if not code_hash:
+            raise ValueError(f"Code hash not found for Agent hash {self.deployment.agent_hash}")
+
+        if not await agent_images.get_image(code_hash):
+            await get_code_file(code_hash)
+        return code_hash
+
+    async def _get_creator_wallet(self) -> str:
+        if not self.creator_wallet:
+            self.creator_wallet = await self._prefetch("creator_wallet", self._fetch_creator_wallet)
+        return self.creator_wallet
+
     async def _continue_actions(self):
         print(f"Agent is in {self.deployment.status} status")
-        if not self.deployment.instance_ip:
-            self.deployment.instance_ip = await fetch_instance_ip(TARGET_CRN.url, self.deployment.instance_hash)
+        self._start_prefetches()
+        if not self.deployment.instance_ip and self.deployment.instance_hash:
+            self.deployment.instance_ip = await fetch_instance_ip(self.crn.url, self.deployment.instance_hash)
+        # The state may have been refreshed from the network or completed above
+        record_agent_version(self.deployment)
 
         if self.deployment.status == AgentDeploymentStatus.PENDING_FUND:
-            await self.create_instance()
+            await self._run_stage(self.create_instance)
             await self._continue_actions()
         if self.deployment.status == AgentDeploymentStatus.PENDING_SWAP:
-            await self.create_flows()
+            await self._run_stage(self.create_flows)
             await self._continue_actions()
         elif self.deployment.status == AgentDeploymentStatus.PENDING_ALLOCATION:
-            await self.notify()
+            await self._run_stage(self.notify)
             await self._continue_actions()
         elif self.deployment.status == AgentDeploymentStatus.PENDING_START:
-            await self.check_connectivity()
+            await self._run_stage(self.check_connectivity)
             await self._continue_actions()
         elif self.deployment.status == AgentDeploymentStatus.PENDING_DEPLOY:
-            await self.deploy_code()
+            await self._run_stage(self.deploy_code)
             await self._continue_actions()
         elif self.deployment.status == AgentDeploymentStatus.ALIVE:
             print(f"Agent {self.deployment.id} is ALIVE!")
             await self.cleanup()
 
+    async def _run_stage(self, stage: Callable[[], Awaitable[None]]):
+        status = self.deployment.status
+        deployment_timelines.record(self.deployment.id, TimelineEventType.STAGE_ENTERED, stage=status)
+        start = time.monotonic()
+        success = False
+        try:
+            await stage()
+            success = True
+        finally:
+            duration = time.monotonic() - start
+            stage_duration.labels(stage=status.value, outcome="success" if success else "error").observe(duration)
+            deployment_timelines.record(
+                self.deployment.id, TimelineEventType.STAGE_EXITED, stage=status, duration=duration, success=success
+            )
+
     async def create_instance(self):
+        # Fail before paying for an instance if the agent doesn't exist
+        await self._get_creator_wallet()
+
+        if config.CRN_SELECTION:
+            self.deployment.crn = await crn_selector.select()
         instance_message = await create_instance_message(
             account=self.aleph_account,
             deployment=self.deployment,
             ssh_public_key=self.ssh_public_key,
-            crn=TARGET_CRN,
+            crn=self.crn,
+            rootfs_size=await self._prefetch(
+                "rootfs_size", lambda: get_rootfs_size(settings.UBUNTU_24_QEMU_ROOTFS_ID)
+            ),
         )
 
         self.deployment.instance_hash = instance_message.item_hash
         self.deployment.status = AgentDeploymentStatus.PENDING_SWAP
-        self.deployment.last_update = int(time.time())
-        await amend_message(self.aleph_account, self.deployment.to_message(), self.deployment.post_hash)
+        await self._publish()
 
     async def create_flows(self):
         aleph_account = self.aleph_account
         wallet_address = aleph_account.get_address()
 
         # Create the needed PAYG flows for the Agent Deployment instance
-        community_flow_amount, instance_flow_amount = await get_instance_price(self.deployment.instance_hash)
+        instance_hash = self.deployment.instance_hash
+        community_flow_amount, instance_flow_amount = await self._prefetch(
+            "instance_price", lambda: get_instance_price(instance_hash)
+        )
         minimum_required_aleph_tokens = format_cost((community_flow_amount + instance_flow_amount) * 3600 * 4)
         # Add a token offset to ensure converted tokens covers the needs
         convert_required_aleph_tokens = minimum_required_aleph_tokens + Decimal(0.1)
 
-        if aleph_account.get_token_balance() < minimum_required_aleph_tokens:
+        # Read balance, existing flows, pool price and base fee at once
+        snapshot = await read_wallet_snapshot(
+            wallet_address, [self.crn.receiver_address, ALEPH_COMMUNITY_RECEIVER]
+        )
+        aleph_price_oracle.update(snapshot.block_number, snapshot.sqrt_price_x96)
+
+        if snapshot.aleph_balance < minimum_required_aleph_tokens:
             try:
-                required_eth_to_convert = convert_aleph_to_eth(convert_required_aleph_tokens)
-                _ = make_eth_to_aleph_conversion(aleph_account, required_eth_to_convert)
+                required_eth_to_convert = await convert_aleph_to_eth(convert_required_aleph_tokens)
+                _ = await make_eth_to_aleph_conversion(aleph_account, required_eth_to_convert, snapshot.base_fee)
             except Exception as err:
                 print(f"Error found converting ETH to ALEPH: {str(err)}")
 
-            aleph_balance = aleph_account.get_token_balance()
+            balances = await read_wallet_balances([wallet_address])
+            aleph_balance = balances[wallet_address].aleph_balance
             if aleph_balance < minimum_required_aleph_tokens:
                 raise ValueError(f"Balance on address {wallet_address} is {aleph_balance} and "
                                  f"it's less than {minimum_required_aleph_tokens} required")
 
-        await create_instance_flow(aleph_account, TARGET_CRN.receiver_address, instance_flow_amount)
+        await create_instance_flow(
+            aleph_account,
+            self.crn.receiver_address,
+            instance_flow_amount,
+            snapshot.flow_rates[self.crn.receiver_address],
+        )
         await asyncio.sleep(10)  # Added a sleep time between flows creation to avoid fails
-        await create_instance_flow(aleph_account, ALEPH_COMMUNITY_RECEIVER, community_flow_amount)
+        await create_instance_flow(
+            aleph_account,
+            ALEPH_COMMUNITY_RECEIVER,
+            community_flow_amount,
+            snapshot.flow_rates[ALEPH_COMMUNITY_RECEIVER],
+        )
 
         self.deployment.status = AgentDeploymentStatus.PENDING_ALLOCATION
-        self.deployment.last_update = int(time.time())
-        await amend_message(self.aleph_account, self.deployment.to_message(), self.deployment.post_hash)
+        await self._publish()
 
     async def notify(self):
         try:
-            allocation_success = await notify_allocation(TARGET_CRN.url, self.deployment.instance_hash)
+            allocation_success = await notify_allocation(self.crn.url, self.deployment.instance_hash)
         except Exception as err:
             raise ValueError(f"Allocation failed with that message '{str(err)}'")
 
@@ -143,41 +276,31 @@ class AgentOrchestration(BaseModel):
             raise ValueError("Allocation failed by some reason")
 
         self.deployment.status = AgentDeploymentStatus.PENDING_START
-        self.deployment.last_update = int(time.time())
-        await amend_message(self.aleph_account, self.deployment.to_message(), self.deployment.post_hash)
+        await self._publish()
 
-        instance_ip = await fetch_instance_ip(TARGET_CRN.url, self.deployment.instance_hash)
+        # The cached executions list can't contain the instance just allocated
+        crn_executions.invalidate(self.crn.url)
+        instance_ip = await wait_for_instance_ip(self.crn.url, self.deployment.instance_hash)
         if not instance_ip:
-            raise ValueError(f"Instance {self.deployment.instance_hash} not found on CRN {TARGET_CRN.url}")
+            raise ValueError(f"Instance {self.deployment.instance_hash} not found on CRN {self.crn.url}")
         self.deployment.instance_ip = instance_ip
+        await self.save()
 
     async def check_connectivity(self):
         if not self.deployment.instance_ip:
             raise ValueError(f"Instance {self.deployment.instance_hash} IP"
                              f" not defined for agent deployment {self.deployment.id}")
 
-        attempts = 30
-        timeout_seconds = 5
-
-        for attempt in range(attempts):
-            try:
-                await check_connectivity(self.deployment.instance_ip, packets=1, timeout=timeout_seconds)
-                break
-            except HostNotFoundError:
-                if attempt < (attempts - 1):
-                    continue
-                else:
-                    raise
+        self.time_to_ready = await wait_for_ssh(self.deployment.instance_ip, config.SSH_PORT)
+        deployment_ready_duration.observe(self.time_to_ready)
+        print(f"Agent {self.deployment.id} instance reachable by SSH after {self.time_to_ready:.1f} seconds")
 
         self.deployment.status = AgentDeploymentStatus.PENDING_DEPLOY
-        self.deployment.last_update = int(time.time())
-        await amend_message(self.aleph_account, self.deployment.to_message(), self.deployment.post_hash)
-
-        # Await 5 seconds before trying the next step to connect by SSH
-        await asyncio.sleep(5)
+        await self._publish()
 
     async def deploy_code(self):
         attempts = 5
+        delays = backoff_delays(config.READINESS_BACKOFF_INITIAL, config.READINESS_BACKOFF_MAX)
 
         for attempt in range(attempts):
             try:
@@ -186,36 +309,119 @@ class AgentOrchestration(BaseModel):
             except Exception as error:
                 if attempt < (attempts - 1):
                     print(f"Agent {self.deployment.id} code deployment failed: {str(error)}")
+                    deployment_timelines.record(
+                        self.deployment.id,
+                        TimelineEventType.RETRY,
+                        stage=self.deployment.status,
+                        name="ssh_deployment",
+                        reason=str(error),
+                    )
+                    deployment_events.publish(
+                        DeploymentEventType.RETRY, self.deployment, name="ssh_deployment", reason=str(error)
+                    )
+                    await asyncio.sleep(next(delays))
                     continue
                 else:
                     raise
 
     async def _ssh_deployment(self):
-        await agent_ssh_deployment(
+        phases = await agent_ssh_deployment(
             deployment=self.deployment,
             aleph_account=self.aleph_account,
             ssh_private_key=self.ssh_private_key,
-            creator_wallet=self.creator_wallet,
+            creator_wallet=await self._get_creator_wallet(),
             env_variables=self.env_variables,
+            code_hash=await self._prefetch("code", self._fetch_code),
         )
+        for name, duration in phases.items():
+            deployment_timelines.record(
+                self.deployment.id, TimelineEventType.REMOTE_PHASE, stage=self.deployment.status, name=name,
+                duration=duration
+            )
 
         self.deployment.status = AgentDeploymentStatus.ALIVE
-        self.deployment.last_update = int(time.time())
-        await amend_message(self.aleph_account, self.deployment.to_message(), self.deployment.post_hash)
+        await self._publish()
 
     async def cleanup(self):
         print(f"Cleaning agent {self.deployment.id} remaining data")
+        self._cancel_prefetches()
         clean_ssh_keys(self.deployment.id)
-        print(f"Cleaned agent {self.deployment.id} data")
+        # The local state is only dropped once the final status is on the network, otherwise the next startup
+        # publishes it again
+        if await status_publisher.flush(self.deployment.id, timeout=config.STATUS_PUBLISH_FLUSH_TIMEOUT):
+            await state_store.delete(self.deployment.id)
+            print(f"Cleaned agent {self.deployment.id} data")
+        else:
+            print(f"Agent {self.deployment.id} final status not published, keeping its local state")
 
 
 class DeploymentOrchestrator(BaseModel):
     running_deployments: Dict[str, AgentOrchestration] = {}
+    scheduler: DeploymentScheduler = Field(
+        default_factory=lambda: DeploymentScheduler(workers=config.DEPLOYMENT_WORKERS)
+    )
+
+    class Config:
+        arbitrary_types_allowed = True
 
-    def new(self, deployment: FetchedAgentDeployment, aleph_account: ETHAccount, env_variables: Dict[str, str]):
-        ssh_private_key, ssh_public_key = create_or_recover_ssh_keys(deployment.id)
+    async def new(
+            self, deployment: FetchedAgentDeployment, aleph_account: ETHAccount, env_variables: Dict[str, str]
+    ):
+        orchestration = await self._create_orchestration(deployment, aleph_account, env_variables)
+        await orchestration.save()
 
-        orchestration = AgentOrchestration(
+        self.running_deployments[deployment.id] = orchestration
+        self.scheduler.submit(deployment.id, orchestration)
+
+    async def resume(self) -> int:
+        """
+        Schedule every deployment left unfinished by a previous run, returns how many were resumed.
+        The scheduler workers bound how many of them run at once.
+        """
+        stored_deployments = [
+            stored for stored in await state_store.pending(max_attempts=config.RESUME_MAX_ATTEMPTS)
+            if stored.deployment.id not in self.running_deployments
+        ]
+        # Built off the event loop, all at once
+        accounts = await asyncio.gather(
+            *[load_account(bytes.fromhex(stored.private_key)) for stored in stored_deployments]
+        )
+
+        resumed = 0
+        for stored, account in zip(stored_deployments, accounts):
+            agent_id = stored.deployment.id
+            orchestration = await self._create_orchestration(stored.deployment, account, stored.env_variables)
+            orchestration.creator_wallet = stored.creator_wallet
+
+            self.running_deployments[agent_id] = orchestration
+            if self.scheduler.submit(agent_id, orchestration, priority=PRIORITY_RESUME):
+                resumed += 1
+
+        await self._republish_final_statuses()
+        return resumed
+
+    @staticmethod
+    async def _republish_final_statuses():
+        """Publish again the ALIVE statuses a previous run couldn't, their local state is dropped once on the network"""
+        for stored in await state_store.unpublished():
+            try:
+                agent = await get_agent(stored.deployment.id, check_result=False)
+            except Exception as error:
+                print(f"Error checking agent {stored.deployment.id} status: {str(error)}")
+                agent = None
+
+            if agent and agent.status == AgentDeploymentStatus.ALIVE:
+                await state_store.delete(stored.deployment.id)
+            else:
+                status_publisher.publish(await load_account(bytes.fromhex(stored.private_key)), stored.deployment)
+
+    @staticmethod
+    async def _create_orchestration(
+            deployment: FetchedAgentDeployment, aleph_account: ETHAccount, env_variables: Dict[str, str]
+    ) -> AgentOrchestration:
+        ssh_private_key, ssh_public_key = await create_or_recover_ssh_keys(deployment.id)
+
+        return AgentOrchestration(
             aleph_account=aleph_account,
             deployment=deployment,
             ssh_private_key=ssh_private_key,
@@ -223,12 +429,9 @@ class DeploymentOrchestrator(BaseModel):
             env_variables=env_variables,
         )
 
-        self.running_deployments[deployment.id] = orchestration
-        run_in_new_loop(orchestration.deploy())
-
     def get(self, agent_id: str, deploy: bool = False) -> Optional[AgentOrchestration]:
         agent_deployment = self.running_deployments.get(agent_id, None)
         if agent_deployment and deploy:
-            run_in_new_loop(agent_deployment.deploy())
+            self.scheduler.submit(agent_id, agent_deployment, priority=PRIORITY_RESUME)
 
         return agent_deployment
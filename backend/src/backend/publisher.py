@@ -0,0 +1,109 @@
+import asyncio
+from typing import Dict, Optional, Set, Tuple
+
+from aleph.sdk.chains.ethereum import ETHAccount
+
+from backend.agent import cache_agent
+from backend.aleph import amend_message
+from backend.config import config
+from backend.metrics import status_publish_queue_depth
+from backend.models import FetchedAgentDeployment
+from backend.serialization import deployment_amend_content
+from backend.utils import backoff_delays
+
+
+class StatusPublisher:
+    """
+    Publishes the deployment post amends in the background. Only the latest state of each agent waits to be sent,
+    so transitions happening while an amend is in flight are merged into the next one. The agents cache is updated
+    immediately, readers don't wait for Aleph to accept the amend.
+    """
+
+    max_attempts: int
+
+    def __init__(self, max_attempts: int):
+        self.max_attempts = max_attempts
+        self._pending: Dict[str, Tuple[ETHAccount, FetchedAgentDeployment]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Agents whose latest state was given up on
+        self._failed: Set[str] = set()
+        self.published = 0
+        self.coalesced = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def publish(self, account: ETHAccount, deployment: FetchedAgentDeployment):
+        """Queue an amend of the deployment post with the given state, replacing any state not sent yet"""
+        if deployment.id in self._pending:
+            self.coalesced += 1
+        self._pending[deployment.id] = (account, deployment.copy())
+        self._failed.discard(deployment.id)
+        cache_agent(deployment)
+
+        # The task removes itself before returning, once nothing is pending anymore
+        if deployment.id not in self._tasks:
+            self._tasks[deployment.id] = asyncio.create_task(self._publish(deployment.id))
+
+    async def flush(self, agent_id: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the queued states, of one agent or all of them, are sent. Returns whether the latest states are
+        on the network, False if one was given up on or still waiting after `timeout` seconds.
+        """
+        if agent_id is None:
+            tasks = list(self._tasks.values())
+        else:
+            tasks = [self._tasks[agent_id]] if agent_id in self._tasks else []
+
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+        if agent_id is None:
+            return not self._pending and not self._tasks and not self._failed
+        return agent_id not in self._pending and agent_id not in self._tasks and agent_id not in self._failed
+
+    async def stop(self):
+        await self.flush(timeout=config.STATUS_PUBLISH_FLUSH_TIMEOUT)
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+        if self._pending or self._failed:
+            print(f"{len(self._pending) + len(self._failed)} agent deployment status updates couldn't be published")
+
+    async def _publish(self, agent_id: str):
+        try:
+            await self._publish_pending(agent_id)
+        finally:
+            self._tasks.pop(agent_id, None)
+
+    async def _publish_pending(self, agent_id: str):
+        attempt = 0
+        delays = backoff_delays(config.STATUS_PUBLISH_BACKOFF_INITIAL, config.STATUS_PUBLISH_BACKOFF_MAX)
+
+        while agent_id in self._pending:
+            account, deployment = self._pending.pop(agent_id)
+            try:
+                await amend_message(account, deployment_amend_content(deployment), deployment.post_hash)
+                self.published += 1
+            except Exception as error:
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    print(f"Giving up publishing agent {agent_id} status {deployment.status}: {str(error)}")
+                    # Unless a newer state was queued meanwhile
+                    if agent_id not in self._pending:
+                        self._failed.add(agent_id)
+                else:
+                    print(f"Error publishing agent {agent_id} status, retrying: {str(error)}")
+                    # Retry with this state unless a newer one was queued meanwhile
+                    self._pending.setdefault(agent_id, (account, deployment))
+                    await asyncio.sleep(next(delays))
+                    continue
+
+            attempt = 0
+            delays = backoff_delays(config.STATUS_PUBLISH_BACKOFF_INITIAL, config.STATUS_PUBLISH_BACKOFF_MAX)
+
+
+status_publisher = StatusPublisher(max_attempts=config.STATUS_PUBLISH_MAX_ATTEMPTS)
+status_publish_queue_depth.set_function(lambda: status_publisher.queue_depth)
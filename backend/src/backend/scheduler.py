@@ -0,0 +1,135 @@
+import asyncio
+import itertools
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Protocol
+
+
+class Deployable(Protocol):
+    async def deploy(self): ...
+
+
+# Lower values are scheduled first
+PRIORITY_RESUME = 0
+PRIORITY_NEW = 10
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    sequence: int
+    agent_id: str = field(compare=False)
+    orchestration: Any = field(compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+class DeploymentScheduler:
+    """
+    Runs agent deployments on the current event loop with a fixed number of workers. Pending jobs wait on a
+    priority queue, so a burst of deployments keeps a bounded footprint instead of spawning a thread each.
+    """
+
+    workers: int
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._queue: Optional[asyncio.PriorityQueue[_Job]] = None
+        self._sequence = itertools.count()
+        self._pending: Dict[str, _Job] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._workers: list[asyncio.Task] = []
+        self._stopping = False
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    def is_scheduled(self, agent_id: str) -> bool:
+        return agent_id in self._pending or agent_id in self._running
+
+    async def start(self):
+        if self._workers:
+            return
+
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # Cancelling a worker also cancels the deployment it awaits, the flag tells both cancellations apart
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+        for task in self._running.values():
+            task.cancel()
+
+        await asyncio.gather(*self._workers, *self._running.values(), return_exceptions=True)
+        self._workers = []
+        self._running = {}
+        self._pending = {}
+        self._queue = None
+        self._stopping = False
+
+    def submit(self, agent_id: str, orchestration: Deployable, priority: int = PRIORITY_NEW) -> bool:
+        """
+        Queue a deployment. Returns False if the agent is already waiting or being deployed.
+        """
+        if self._queue is None:
+            raise RuntimeError("Deployment scheduler not started")
+
+        if self.is_scheduled(agent_id):
+            return False
+
+        job = _Job(
+            priority=priority,
+            sequence=next(self._sequence),
+            agent_id=agent_id,
+            orchestration=orchestration,
+        )
+        self._pending[agent_id] = job
+        self._queue.put_nowait(job)
+        return True
+
+    def cancel(self, agent_id: str) -> bool:
+        """
+        Drop a pending deployment or cancel the running one. Returns False if the agent wasn't scheduled.
+        """
+        job = self._pending.pop(agent_id, None)
+        if job:
+            # The queue can't remove arbitrary items, the worker will skip it
+            job.cancelled = True
+            return True
+
+        task = self._running.get(agent_id)
+        if task:
+            task.cancel()
+            return True
+
+        return False
+
+    async def _worker(self):
+        assert self._queue is not None
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.cancelled:
+                    continue
+
+                self._pending.pop(job.agent_id, None)
+                task = asyncio.create_task(job.orchestration.deploy())
+                self._running[job.agent_id] = task
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    # Propagate the cancellation when the worker itself is being stopped
+                    if self._stopping or not task.cancelled():
+                        raise
+                    print(f"Agent {job.agent_id} deployment cancelled")
+                except Exception as error:
+                    print(f"Agent {job.agent_id} deployment failed: {str(error)}")
+                finally:
+                    self._running.pop(job.agent_id, None)
+            finally:
+                self._queue.task_done()
@@ -1,6 +1,7 @@
 #!/bin/bash
 
 ZIP_PATH="/tmp/libertai-agent.zip"
+IMAGE_PATH="/tmp/libertai-agent-image.tar.gz"
 CODE_PATH="/root/libertai-agent"
 DOCKERFILE_PATH="/tmp/libertai-agent.Dockerfile"
 ENV_FILE_PATH="/tmp/.env"
@@ -16,10 +17,22 @@ case "$3" in
         ;;
 esac
 
+# Report how long each phase took to the backend, reading this script output
+PHASE_NAME=""
+PHASE_START=0
+phase() {
+  local now
+  now=$(date +%s%3N)
+  if [ -n "$PHASE_NAME" ]; then
+    echo "LIBERTAI_PHASE $PHASE_NAME $((now - PHASE_START))"
+  fi
+  PHASE_NAME="$1"
+  PHASE_START=$now
+}
+
 # Setup
+phase docker_install
 export DEBIAN_FRONTEND=noninteractive # Suppress debconf warnings
-apt-get update
-apt-get install unzip -y
 if ! command -v docker &> /dev/null; then
     # Docker installation when not already present
     curl -fsSL https://get.docker.com | sudo DEBIAN_FRONTEND=noninteractive sh 2>/dev/null
@@ -27,33 +40,48 @@ if ! command -v docker &> /dev/null; then
     sudo systemctl enable --now docker 2>/dev/null # Start Docker and enable on boot
 fi
 
-# Prepare the dependencies
-unzip $ZIP_PATH -d $CODE_PATH
+if [ -f "$IMAGE_PATH" ]; then
+  # The image was already built by the backend, just load it
+  phase image_load
+  IMAGE_NAME=$(docker load -i $IMAGE_PATH | sed -n 's/^Loaded image: //p' | head -n 1)
+else
+  phase code_unpack
+  apt-get update
+  apt-get install unzip -y
 
-# Check if there are files inside CODE_PATH apart from folders
-NUM_FILES=$(find "$CODE_PATH" -maxdepth 1 -type f | wc -l)
+  # Prepare the dependencies
+  unzip $ZIP_PATH -d $CODE_PATH
 
-# If find files it means that this is the main code folder
-if [ "$NUM_FILES" -gt 0 ]; then
-  echo "No any folder inside '$CODE_PATH'."
-  FINAL_CODE_PATH="$CODE_PATH"
-else
-  # If doesn't find, it means that there is a folder inside and we need to access inside
-  CODE_FOLDER=$(find "$CODE_PATH" -maxdepth 1 -type d -not -path "$CODE_PATH" | head -n 1)
-  CODE_FOLDER_NAME=$(basename "$CODE_FOLDER")
-  FINAL_CODE_PATH="$CODE_PATH/$CODE_FOLDER_NAME"
-fi
+  # Check if there are files inside CODE_PATH apart from folders
+  NUM_FILES=$(find "$CODE_PATH" -maxdepth 1 -type f | wc -l)
+
+  # If find files it means that this is the main code folder
+  if [ "$NUM_FILES" -gt 0 ]; then
+    echo "No any folder inside '$CODE_PATH'."
+    FINAL_CODE_PATH="$CODE_PATH"
+  else
+    # If doesn't find, it means that there is a folder inside and we need to access inside
+    CODE_FOLDER=$(find "$CODE_PATH" -maxdepth 1 -type d -not -path "$CODE_PATH" | head -n 1)
+    CODE_FOLDER_NAME=$(basename "$CODE_FOLDER")
+    FINAL_CODE_PATH="$CODE_PATH/$CODE_FOLDER_NAME"
+  fi
 
-wget https://raw.githubusercontent.com/ethdenver-creaitors/creaitors/refs/heads/main/backend/src/backend/scripts/$2.Dockerfile -O $DOCKERFILE_PATH -q --no-cache
-docker buildx build -q "$FINAL_CODE_PATH" \
-  -f $DOCKERFILE_PATH \
-  -t $IMAGE_NAME \
-  --build-arg PYTHON_VERSION=3.12
+  phase image_build
+  wget https://raw.githubusercontent.com/ethdenver-creaitors/creaitors/refs/heads/main/backend/src/backend/scripts/$2.Dockerfile -O $DOCKERFILE_PATH -q --no-cache
+  docker buildx build -q "$FINAL_CODE_PATH" \
+    -f $DOCKERFILE_PATH \
+    -t $IMAGE_NAME \
+    --build-arg PYTHON_VERSION=3.12
+fi
 
 # Run docker image
+phase container_start
 docker run --name $CONTAINER_NAME --env-file=$ENV_FILE_PATH -p 8000:8000 -d $IMAGE_NAME $ENTRYPOINT
 
 # Cleanup
+phase cleanup
 rm -f $ZIP_PATH
+rm -f $IMAGE_PATH
 rm -rf $CODE_PATH
-rm -f $DOCKERFILE_PATH
\ No newline at end of file
+rm -f $DOCKERFILE_PATH
+phase
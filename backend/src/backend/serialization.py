@@ -0,0 +1,115 @@
+import hashlib
+from decimal import Decimal
+from email.utils import formatdate
+from enum import Enum
+from operator import attrgetter
+from typing import (
+    AbstractSet,
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+)
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON, ModelField
+from pydantic.json import decimal_encoder
+
+from backend.config import config
+from backend.models import AgentDeployment, FetchedAgentDeployment
+
+Encoder = Callable[[Any], Any]
+
+# Values serialized as they are, in any container
+_JSON_TYPES = (str, int, float, bool)
+
+
+class ModelSerializer:
+    """
+    Converts a model to JSON-ready data, same as `.dict()` followed by the pydantic JSON encoder used by FastAPI and
+    the Aleph SDK. The encoder of each field is chosen once from its type instead of on every value, and excluded
+    fields are skipped instead of copied.
+    """
+
+    def __init__(self, model: Type[BaseModel], exclude: AbstractSet[str] = frozenset(), exclude_none: bool = False):
+        self.exclude_none = exclude_none
+        self._fields: List[Tuple[str, Optional[Encoder]]] = [
+            (name, self._field_encoder(field))
+            for name, field in model.__fields__.items()
+            if name not in exclude
+        ]
+
+    def _field_encoder(self, field: ModelField) -> Optional[Encoder]:
+        field_type = field.type_
+        if field.shape != SHAPE_SINGLETON:
+            if field_type in _JSON_TYPES:
+                return None
+            raise TypeError(f"Field {field.name} is a container of {field_type}, not supported")
+
+        if not isinstance(field_type, type):
+            return None
+        if issubclass(field_type, Decimal):
+            return decimal_encoder
+        if issubclass(field_type, Enum):
+            return attrgetter("value")
+        if issubclass(field_type, BaseModel):
+            return ModelSerializer(field_type, exclude_none=self.exclude_none)
+        return None
+
+    def __call__(self, instance: BaseModel) -> Dict[str, Any]:
+        values = instance.__dict__
+        content: Dict[str, Any] = {}
+        for name, encoder in self._fields:
+            value = values[name]
+            if value is None:
+                if not self.exclude_none:
+                    content[name] = None
+            else:
+                content[name] = encoder(value) if encoder else value
+        return content
+
+
+# Content of the deployment post
+agent_post_content = ModelSerializer(AgentDeployment)
+
+# Content of the deployment post amends, without the hash of the post they amend
+deployment_amend_content = ModelSerializer(FetchedAgentDeployment, exclude={"post_hash"}, exclude_none=True)
+
+# Deployment returned by the API
+deployment_response_content = ModelSerializer(FetchedAgentDeployment)
+
+
+class DeploymentVersion(NamedTuple):
+    """Validators of a deployment state returned by the API, for the conditional requests"""
+
+    etag: str
+    last_update: int
+
+    @classmethod
+    def of(cls, deployment: FetchedAgentDeployment) -> "DeploymentVersion":
+        # Every change comes with a new `last_update` and status, except the instance IP found after the allocation
+        state = f"{deployment.last_update}:{deployment.status.value}:{deployment.instance_ip}"
+        return cls(etag=f'"{hashlib.blake2b(state.encode(), digest_size=8).hexdigest()}"',
+                   last_update=deployment.last_update)
+
+    def matches(self, if_none_match: str) -> bool:
+        """Weak comparison with the entity tags of an `If-None-Match` header"""
+        if if_none_match.strip() == "*":
+            return True
+        return any(tag.strip().removeprefix("W/") == self.etag for tag in if_none_match.split(","))
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.last_update, usegmt=True),
+            "Cache-Control": config.AGENT_RESPONSE_CACHE_CONTROL,
+        }
+
+
+def deployment_response(deployment: FetchedAgentDeployment, version: DeploymentVersion) -> ORJSONResponse:
+    return ORJSONResponse(deployment_response_content(deployment), headers=version.headers())
@@ -1,5 +1,7 @@
+import asyncio
 import io
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
 
 import paramiko
 
@@ -8,75 +10,137 @@ from aleph.sdk.chains.ethereum import ETHAccount
 from backend.agent import generate_fixed_env_variables, generate_env_file_content
 from backend.aleph import get_code_hash, get_code_file
 from backend.config import config
+from backend.images import agent_images
+from backend.metrics import instrumented
 from backend.models import FetchedAgentDeployment
+from backend.utils import load_ssh_private_key
 
+REMOTE_CODE_PATH = "/tmp/libertai-agent.zip"
+REMOTE_IMAGE_PATH = "/tmp/libertai-agent-image.tar.gz"
+REMOTE_ENV_PATH = "/tmp/.env"
+REMOTE_SCRIPT_PATH = "/tmp/deploy-agent.sh"
+# Printed by the deployment script at the end of each of its phases, followed by the phase name and milliseconds
+PHASE_MARKER = "LIBERTAI_PHASE"
+# Output lines of a failed deployment script kept in the error
+SCRIPT_ERROR_LINES = 20
 
+# Paramiko is blocking, SSH sessions run on their own threads and the pool size bounds how many run in parallel
+ssh_executor = ThreadPoolExecutor(max_workers=config.SSH_MAX_CONCURRENCY, thread_name_prefix="ssh-deployment")
+
+
+@instrumented("ssh")
 async def agent_ssh_deployment(
         deployment: FetchedAgentDeployment,
         aleph_account: ETHAccount,
         ssh_private_key: str,
         creator_wallet: str,
-        env_variables: Dict[str, str]
-):
-    # Create a Paramiko SSH client
-    ssh_client = paramiko.SSHClient()
-    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
+        env_variables: Dict[str, str],
+        code_hash: Optional[str] = None,
+) -> Dict[str, float]:
+    """
+    Deploys the agent on its instance, returns the duration in seconds of each phase of the deployment script.
+    """
     # Load private key from string
-    rsa_key = paramiko.RSAKey(file_obj=io.StringIO(ssh_private_key))
+    pkey = load_ssh_private_key(ssh_private_key)
 
     # Get code file
     agent_hash = deployment.agent_hash
-    code_hash = await get_code_hash(agent_hash)
+    if code_hash is None:
+        code_hash = await get_code_hash(agent_hash)
     if not code_hash:
         raise ValueError(f"Code hash not found for Agent hash {agent_hash}")
 
-    code_filename = await get_code_file(code_hash)
-    content = open(code_filename, mode="rb").read()
+    # Ship the pre-built image when possible, otherwise the instance builds it from the code
+    image_filename = await agent_images.get_image(code_hash)
+    code_filename = None
+    if not image_filename:
+        code_filename = await get_code_file(code_hash)
+        if not code_filename:
+            raise ValueError(f"Code file {code_hash} couldn't be downloaded")
 
-    try:
-        # Connect to the server
-        ssh_client.connect(hostname=deployment.instance_ip, username="root", pkey=rsa_key)
+    wallet_private_key = aleph_account.export_private_key()
+    fixed_env_variables = generate_fixed_env_variables(
+        private_key=wallet_private_key,
+        creator_address=creator_wallet,
+        owner_address=deployment.owner,
+    )
+    env_content = generate_env_file_content(fixed_env_variables, env_variables)
 
-        # Send the zip with the code
-        sftp = ssh_client.open_sftp()
-        remote_path = "/tmp/libertai-agent.zip"
-        sftp.putfo(io.BytesIO(content), remote_path)
-        sftp.close()
+    if deployment.instance_ip is None:
+        raise ValueError(f"Instance IP of agent {deployment.id} not known yet")
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        ssh_executor,
+        _upload_and_run,
+        deployment.instance_ip,
+        pkey,
+        code_filename,
+        image_filename,
+        env_content,
+    )
 
-        # Send the env variable file
-        sftp = ssh_client.open_sftp()
-        wallet_private_key = aleph_account.export_private_key()
 
-        fixed_env_variables = generate_fixed_env_variables(
-            private_key=wallet_private_key,
-            creator_address=creator_wallet,
-            owner_address=deployment.owner,
+def _upload_and_run(
+        hostname: str,
+        pkey: paramiko.PKey,
+        code_filename: Optional[str],
+        image_filename: Optional[str],
+        env_content: bytes,
+) -> Dict[str, float]:
+    # Create a Paramiko SSH client
+    ssh_client = paramiko.SSHClient()
+    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    try:
+        # Connect to the server
+        ssh_client.connect(
+            hostname=hostname, port=config.SSH_PORT, username="root", pkey=pkey, timeout=config.SSH_CONNECT_TIMEOUT
         )
-        content = generate_env_file_content(fixed_env_variables, env_variables)
-        remote_path = "/tmp/.env"
-        sftp.putfo(io.BytesIO(content), remote_path)
-        sftp.close()
-
-        # Send the deployment script
-        script_path = f"{config.SCRIPTS_PATH}/deploy.sh"
-        content = open(script_path, mode="rb").read()
+
+        # Send the image or the code, the env variable file and the deployment script over a single SFTP session,
+        # files are streamed from disk
         sftp = ssh_client.open_sftp()
-        remote_path = "/tmp/deploy-agent.sh"
-        sftp.putfo(io.BytesIO(content), remote_path)
-        sftp.close()
+        try:
+            if image_filename:
+                sftp.put(image_filename, REMOTE_IMAGE_PATH)
+            elif code_filename:
+                sftp.put(code_filename, REMOTE_CODE_PATH)
+            sftp.putfo(io.BytesIO(env_content), REMOTE_ENV_PATH)
+            sftp.put(f"{config.SCRIPTS_PATH}/deploy.sh", REMOTE_SCRIPT_PATH)
+        finally:
+            sftp.close()
 
         # Execute the command
         # TODO: Detect the usage type, by default use "fastapi"
         usage_type = "fastapi"
-        _stdin, _stdout, stderr = ssh_client.exec_command(
-            f"chmod +x {remote_path} && {remote_path} 3.12 poetry {usage_type}"
+        _stdin, stdout, _stderr = ssh_client.exec_command(
+            f"chmod +x {REMOTE_SCRIPT_PATH} && {REMOTE_SCRIPT_PATH} 3.12 poetry {usage_type}"
         )
 
-        # Waiting for the command to complete to get error logs
-        stderr.channel.recv_exit_status()
+        # Reading both streams as one until the command completes, so neither can fill up the channel window
+        stdout.channel.set_combine_stderr(True)
+        output = stdout.read().decode(errors="replace")
+
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status != 0:
+            last_lines = "\n".join(output.splitlines()[-SCRIPT_ERROR_LINES:])
+            raise ValueError(f"Deployment script failed with exit status {exit_status}:\n{last_lines}")
+        return parse_script_phases(output)
     except Exception as error:
         raise ValueError(str(error))
     finally:
         # Close the connection
-        ssh_client.close()
\ No newline at end of file
+        ssh_client.close()
+
+
+def parse_script_phases(output: str) -> Dict[str, float]:
+    phases: Dict[str, float] = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) == 3 and parts[0] == PHASE_MARKER:
+            try:
+                phases[parts[1]] = int(parts[2]) / 1000
+            except ValueError:
+                continue
+    return phases
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from backend.config import config
+from backend.models import AgentDeploymentStatus, FetchedAgentDeployment
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deployments (
+    agent_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    crn_hash TEXT,
+    instance_hash TEXT,
+    instance_ip TEXT,
+    deployment TEXT NOT NULL,
+    private_key TEXT NOT NULL,
+    creator_wallet TEXT,
+    env_variables TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deployments_status ON deployments (status);
+"""
+
+
+class StoredDeployment(BaseModel):
+    deployment: FetchedAgentDeployment
+    private_key: str
+    creator_wallet: Optional[str]
+    env_variables: Dict[str, str]
+    attempts: int
+    last_error: Optional[str]
+    updated_at: float
+
+
+class DeploymentStateStore:
+    """
+    Keeps the state of the running deployments in a local SQLite database, so they can be resumed right after a
+    restart without waiting for their owners to call the API again. The database is in WAL mode and all the
+    accesses go through a single thread, keeping the writes off the event loop.
+
+    Rows hold the agent wallet private key and env variables until the deployment is ALIVE, the database files are
+    only readable by the backend user, like the SSH keys.
+    """
+
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # SQLite creates the -wal and -shm files with the permissions of the database file
+            os.close(os.open(self.path, os.O_CREAT | os.O_WRONLY, 0o600))
+            for path in (self.path, f"{self.path}-wal", f"{self.path}-shm"):
+                if os.path.exists(path):
+                    os.chmod(path, 0o600)
+
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Durable enough in WAL mode, a power loss can only drop the last transactions, not corrupt the file
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    async def save(
+            self,
+            deployment: FetchedAgentDeployment,
+            private_key: str,
+            creator_wallet: Optional[str],
+            env_variables: Dict[str, str],
+    ):
+        """Insert or update the state of a deployment, retry counters are kept"""
+        await self._run(
+            self._save,
+            (
+                deployment.id,
+                deployment.status.value,
+                deployment.crn.hash if deployment.crn else None,
+                deployment.instance_hash,
+                deployment.instance_ip,
+                deployment.json(),
+                private_key,
+                creator_wallet,
+                json.dumps(env_variables),
+                time.time(),
+            ),
+        )
+
+    def _save(self, row: tuple):
+        self._connect().execute(
+            """
+            INSERT INTO deployments (
+                agent_id, status, crn_hash, instance_hash, instance_ip, deployment,
+                private_key, creator_wallet, env_variables, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (agent_id) DO UPDATE SET
+                status = excluded.status,
+                crn_hash = excluded.crn_hash,
+                instance_hash = excluded.instance_hash,
+                instance_ip = excluded.instance_ip,
+                deployment = excluded.deployment,
+                private_key = excluded.private_key,
+                creator_wallet = excluded.creator_wallet,
+                env_variables = excluded.env_variables,
+                updated_at = excluded.updated_at
+            """,
+            row,
+        )
+
+    async def record_failure(self, agent_id: str, error: str):
+        await self._run(self._record_failure, agent_id, error)
+
+    def _record_failure(self, agent_id: str, error: str):
+        self._connect().execute(
+            "UPDATE deployments SET attempts = attempts + 1, last_error = ?, updated_at = ? WHERE agent_id = ?",
+            (error, time.time(), agent_id),
+        )
+
+    async def delete(self, agent_id: str):
+        await self._run(self._delete, agent_id)
+
+    def _delete(self, agent_id: str):
+        self._connect().execute("DELETE FROM deployments WHERE agent_id = ?", (agent_id,))
+
+    async def pending(self, max_attempts: Optional[int] = None) -> List[StoredDeployment]:
+        """All the deployments not ALIVE yet, oldest first"""
+        return await self._run(self._pending, max_attempts)
+
+    def _pending(self, max_attempts: Optional[int]) -> List[StoredDeployment]:
+        where = "status != ?"
+        params: list = [AgentDeploymentStatus.ALIVE.value]
+        if max_attempts is not None:
+            where += " AND attempts < ?"
+            params.append(max_attempts)
+        return self._select(where, params)
+
+    async def unpublished(self) -> List[StoredDeployment]:
+        """The ALIVE deployments, only kept while their final status isn't known to be on the network"""
+        return await self._run(self._select, "status = ?", [AgentDeploymentStatus.ALIVE.value])
+
+    def _select(self, where: str, params: list) -> List[StoredDeployment]:
+        query = "SELECT deployment, private_key, creator_wallet, env_variables, attempts, last_error, updated_at " \
+                f"FROM deployments WHERE {where} ORDER BY updated_at"
+
+        return [
+            StoredDeployment(
+                deployment=FetchedAgentDeployment.parse_raw(deployment),
+                private_key=private_key,
+                creator_wallet=creator_wallet,
+                env_variables=json.loads(env_variables),
+                attempts=attempts,
+                last_error=last_error,
+                updated_at=updated_at,
+            )
+            for deployment, private_key, creator_wallet, env_variables, attempts, last_error, updated_at
+            in self._connect().execute(query, params).fetchall()
+        ]
+
+    async def close(self):
+        if self._connection is not None:
+            await self._run(self._connection.close)
+            self._connection = None
+
+
+state_store = DeploymentStateStore(path=config.STATE_DB_PATH)
@@ -0,0 +1,93 @@
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from enum import Enum
+from typing import Awaitable, Deque, List, Optional, TypeVar
+
+from pydantic import BaseModel
+
+from backend.config import config
+from backend.models import AgentDeploymentStatus
+
+# Agent whose deployment the running code works for, tasks started by a deployment inherit it
+current_agent_id: ContextVar[Optional[str]] = ContextVar("current_agent_id", default=None)
+
+T = TypeVar("T")
+
+
+async def run_shared(coroutine: Awaitable[T]) -> T:
+    """
+    Runs a coroutine shared by several deployments, in a task of its own. Its calls don't belong to the deployment
+    that happened to start it.
+    """
+    current_agent_id.set(None)
+    return await coroutine
+
+
+class TimelineEventType(Enum):
+    STAGE_ENTERED = "STAGE_ENTERED"
+    STAGE_EXITED = "STAGE_EXITED"
+    RETRY = "RETRY"
+    FAILED = "FAILED"
+    CALL = "CALL"
+    REMOTE_PHASE = "REMOTE_PHASE"
+
+
+class TimelineEvent(BaseModel):
+    type: TimelineEventType
+    timestamp: float
+    stage: Optional[AgentDeploymentStatus] = None
+    name: Optional[str] = None
+    duration: Optional[float] = None
+    success: Optional[bool] = None
+    reason: Optional[str] = None
+
+
+class DeploymentTimeline(BaseModel):
+    agent_id: str
+    status: Optional[AgentDeploymentStatus]
+    last_update: Optional[int]
+    events: List[TimelineEvent]
+
+
+class TimelineStore:
+    """
+    Recent events of each deployment, kept in memory. Only the last `max_events` events of the `max_deployments`
+    most recently active deployments are kept.
+    """
+
+    max_deployments: int
+    max_events: int
+
+    def __init__(self, max_deployments: int, max_events: int):
+        self.max_deployments = max_deployments
+        self.max_events = max_events
+        self._timelines: OrderedDict[str, Deque[TimelineEvent]] = OrderedDict()
+
+    def record(self, agent_id: str, event_type: TimelineEventType, **fields):
+        events = self._timelines.get(agent_id)
+        if events is None:
+            events = deque(maxlen=self.max_events)
+            self._timelines[agent_id] = events
+            while len(self._timelines) > self.max_deployments:
+                self._timelines.popitem(last=False)
+        else:
+            self._timelines.move_to_end(agent_id)
+
+        events.append(TimelineEvent(type=event_type, timestamp=time.time(), **fields))
+
+    def record_call(self, name: str, duration: float, success: bool):
+        """Record an external call made on behalf of the current deployment, if any"""
+        agent_id = current_agent_id.get()
+        if agent_id is not None:
+            self.record(agent_id, TimelineEventType.CALL, name=name, duration=duration, success=success)
+
+    def get(self, agent_id: str) -> Optional[List[TimelineEvent]]:
+        events = self._timelines.get(agent_id)
+        return list(events) if events is not None else None
+
+
+deployment_timelines = TimelineStore(
+    max_deployments=config.TIMELINE_MAX_DEPLOYMENTS,
+    max_events=config.TIMELINE_MAX_EVENTS,
+)
@@ -2,31 +2,48 @@ import asyncio
 import base64
 import hashlib
 import io
-import platform
+import random
 import subprocess
-import threading
+import time
 from decimal import Decimal, ROUND_FLOOR
 from pathlib import Path
-from typing import Tuple
+from typing import Iterator
 from urllib.parse import urlparse, ParseResult
 
 import aiohttp
 import paramiko
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 
 from uuid import UUID
-from web3 import Web3
+from eth_account import Account
 from eth_account.messages import encode_defunct
 from hexbytes import HexBytes
 
 from ecies import encrypt as ecies_encrypt, decrypt as ecies_decrypt
 
 from backend.config import config
+from backend.metrics import instrumented
 from backend.models import HostNotFoundError
 
 PRICE_PRECISION = 18
 
 
-def generate_ssh_key_pair() -> tuple[str, str]:
+def generate_ssh_key_pair(key_type: str = "rsa") -> tuple[str, str]:
+    if key_type == "ed25519":
+        # Paramiko can't generate Ed25519 keys, but loads the OpenSSH format written by cryptography
+        ed25519_key = Ed25519PrivateKey.generate()
+        private_key_str = ed25519_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.OpenSSH, serialization.NoEncryption()
+        ).decode()
+        public_key_str = ed25519_key.public_key().public_bytes(
+            serialization.Encoding.OpenSSH, serialization.PublicFormat.OpenSSH
+        ).decode()
+        return private_key_str, public_key_str
+
+    if key_type != "rsa":
+        raise ValueError(f"Unsupported SSH key type {key_type}")
+
     # Generate RSA key pair
     key = paramiko.RSAKey.generate(4096)
 
@@ -41,6 +58,17 @@ def generate_ssh_key_pair() -> tuple[str, str]:
     return private_key_str, public_key_str
 
 
+def load_ssh_private_key(private_key: str) -> paramiko.PKey:
+    """Load a private key of any type generated by `generate_ssh_key_pair`"""
+    for key_class in (paramiko.Ed25519Key, paramiko.ECDSAKey, paramiko.RSAKey):
+        try:
+            return key_class(file_obj=io.StringIO(private_key))
+        except paramiko.SSHException:
+            continue
+
+    raise ValueError("Unsupported SSH private key")
+
+
 def encrypt(data: str, public_key: str | bytes) -> str:
     """Encrypt some data with a public key"""
 
@@ -64,9 +92,8 @@ def decrypt(data: str, private_key: str | bytes) -> str:
 def check_agent_key(agent_id: UUID, owner: str, agent_key: str) -> bool:
     agent_account_message = f"{config.WALLET_MESSAGE} {owner} {agent_id}"
 
-    w3 = Web3(Web3.HTTPProvider(""))
     message = encode_defunct(text=agent_account_message)
-    address = w3.eth.account.recover_message(message, signature=agent_key)
+    address = Account.recover_message(message, signature=agent_key)
 
     return address == owner
 
@@ -100,55 +127,60 @@ async def run_in_subprocess(command: list[str], check: bool = True, stdin_input:
     return stdout
 
 
-async def check_connectivity(host: str, packets: int, timeout: int):
+def backoff_delays(initial: float, maximum: float, factor: float = 2) -> Iterator[float]:
     """
-    Waits for a host to respond to a ping request.
+    Infinite exponential backoff delays with jitter, each delay is picked between half and the whole current step.
     """
+    step = initial
+    while True:
+        yield step / 2 + random.uniform(0, step / 2)
+        step = min(step * factor, maximum)
 
-    try:
-        if not is_mac_host():
-            await run_in_subprocess(["ping", "-c", str(packets), "-W", str(timeout), host], check=True)
-        else:
-            # Only for MacOS
-            await run_in_subprocess(["ping6", "-c", str(packets), "-i", str(timeout * 1000), host], check=True)
-    except subprocess.CalledProcessError as err:
-        raise HostNotFoundError() from err
 
+async def read_ssh_banner(host: str, port: int, timeout: float) -> bool:
+    """
+    Opens a TCP connection and checks that the host answers with an SSH banner.
+    """
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        banner = await asyncio.wait_for(reader.readline(), timeout)
+        return banner.startswith(b"SSH-")
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+@instrumented("ssh")
+async def wait_for_ssh(host: str, port: int = 22) -> float:
+    """
+    Waits for a host to be reachable by SSH, returns the number of seconds it took.
+    """
+    start = time.monotonic()
+    deadline = start + config.READINESS_TIMEOUT
+    delays = backoff_delays(config.READINESS_BACKOFF_INITIAL, config.READINESS_BACKOFF_MAX)
 
-def is_mac_host() -> bool:
-    return platform.system() == "Darwin"
+    while True:
+        remaining = deadline - time.monotonic()
+        try:
+            if await read_ssh_banner(host, port, timeout=min(config.READINESS_ATTEMPT_TIMEOUT, remaining)):
+                return time.monotonic() - start
+        except (OSError, asyncio.TimeoutError):
+            pass
 
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise HostNotFoundError(f"Host {host} not reachable by SSH after {config.READINESS_TIMEOUT} seconds")
 
-def run_in_new_loop(coroutine):
-    """Ejecuta una corrutina en un nuevo bucle de eventos."""
-    def run_loop():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(coroutine)
-        loop.close()
-    thread = threading.Thread(target=run_loop)
-    thread.start()
+        await asyncio.sleep(min(next(delays), remaining))
 
 
 def format_cost(v: Decimal | str, p: int = PRICE_PRECISION) -> Decimal:
     return Decimal(v).quantize(Decimal(1) / Decimal(10**p), ROUND_FLOOR)
 
 
-def create_or_recover_ssh_keys(agent_id: str) -> Tuple[str, str]:
-    # TODO: Load existing ssh keys if they exists, if not just create random ones
-    private_key_path = Path(f"{config.KEYS_PATH}/{agent_id}_private.key")
-    public_key_path = Path(f"{config.KEYS_PATH}/{agent_id}_public.key")
-    if private_key_path.exists() and public_key_path.exists():
-        ssh_private_key = private_key_path.read_text()
-        ssh_public_key = public_key_path.read_text()
-    else:
-        ssh_private_key, ssh_public_key = generate_ssh_key_pair()
-        private_key_path.write_text(ssh_private_key)
-        public_key_path.write_text(ssh_public_key)
-
-    return ssh_private_key, ssh_public_key
-
-
 def clean_ssh_keys(agent_id: str):
     private_key_path = Path(f"{config.KEYS_PATH}/{agent_id}_private.key")
     public_key_path = Path(f"{config.KEYS_PATH}/{agent_id}_public.key")
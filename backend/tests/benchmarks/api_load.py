@@ -0,0 +1,206 @@
+"""
+Load test of the backend HTTP API, offline. Sweeps concurrency levels over `GET /agent/{agent_id}`, served from the
+orchestrator or from the network, and `POST /agent` with its signature check, against the stand-in Aleph API.
+
+Run `python -m tests.benchmarks.api_load --output api_load.json` from the backend folder. Requests go through
+`backend.main.app` in-process, so anything blocking the event loop shows up in the loop lag.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+from tests.benchmarks import standins
+from tests.benchmarks.measure import (
+    LoopLagMonitor,
+    git_revision,
+    summarize,
+    write_results,
+)
+
+SCENARIOS = ("get_agent_orchestrator", "get_agent_network", "create_agent")
+
+Request = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def _signed_agent_requests(count: int, agent_hash: str, wallet_message: str) -> List[Dict[str, Any]]:
+    """New agents requests, signed ahead so the signing doesn't count in the measures"""
+    owner = Account.create()
+    requests = []
+    for _ in range(count):
+        agent_id = str(uuid.uuid4())
+        signature = owner.sign_message(encode_defunct(text=f"{wallet_message} {owner.address} {agent_id}"))
+        requests.append({
+            "agent_id": agent_id,
+            "agent_key": signature.signature.hex(),
+            "agent_hash": agent_hash,
+            "owner": owner.address,
+            "name": f"Agent {agent_id}",
+        })
+    return requests
+
+
+def _seed_orchestrator(app, count: int, agent_hash: str) -> List[str]:
+    """Register deployments in progress without running them, they are served from the orchestrator"""
+    from backend.blockchain import CustomETHAccount
+    from backend.models import AgentDeploymentStatus, FetchedAgentDeployment
+    from backend.orchestrator import AgentOrchestration
+
+    account = CustomETHAccount(os.urandom(32))
+    agent_ids = []
+    for index in range(count):
+        agent_id = str(uuid.uuid4())
+        deployment = FetchedAgentDeployment(
+            id=agent_id,
+            name=f"Agent {index}",
+            owner=account.get_address(),
+            wallet_address=account.get_address(),
+            required_tokens=Decimal("0.005"),
+            instance_hash=None,
+            agent_hash=agent_hash,
+            last_update=int(time.time()),
+            status=AgentDeploymentStatus.PENDING_DEPLOY,
+            tags=[agent_id, account.get_address()],
+            post_hash=None,
+            instance_ip=None,
+        )
+        app.state.orchestrator.running_deployments[agent_id] = AgentOrchestration(
+            aleph_account=account, deployment=deployment, ssh_private_key="", ssh_public_key=""
+        )
+        agent_ids.append(agent_id)
+    return agent_ids
+
+
+def _scenario_request(scenario: str, running_agents: List[str], deployed_agents: List[str],
+                      agent_requests: List[Dict[str, Any]]) -> Request:
+    if scenario == "get_agent_orchestrator":
+        return lambda client, _index: client.get(f"/agent/{random.choice(running_agents)}")
+    if scenario == "get_agent_network":
+        return lambda client, _index: client.get(f"/agent/{random.choice(deployed_agents)}")
+    return lambda client, index: client.post("/agent", json=agent_requests[index])
+
+
+async def _run_level(client: httpx.AsyncClient, request: Request, concurrency: int, count: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    indexes = iter(range(count))
+
+    async def worker():
+        nonlocal errors
+        for index in indexes:
+            start = time.monotonic()
+            response = await request(client, index)
+            latencies.append(time.monotonic() - start)
+            if response.status_code != 200 or (response.json() or {}).get("error"):
+                errors += 1
+
+    lag_monitor = LoopLagMonitor()
+    lag_monitor.start()
+    start = time.monotonic()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.monotonic() - start
+    await lag_monitor.stop()
+
+    return {
+        "concurrency": concurrency,
+        "requests": count,
+        "errors": errors,
+        "elapsed": elapsed,
+        "requests_per_second": count / elapsed if elapsed else 0,
+        "latency_ms": summarize([latency * 1000 for latency in latencies]),
+        "loop_lag_ms": summarize([lag * 1000 for lag in lag_monitor.lags]),
+    }
+
+
+async def run_benchmark(arguments: argparse.Namespace, standins_info: Dict[str, Any]) -> Dict[str, Any]:
+    # The configuration is read from the environment on import
+    from backend.agent import agents_cache
+    from backend.config import config
+    from backend.main import app
+
+    agent_hash = standins_info["agent_hash"]
+    deployed_agents = standins_info["deployed_agents"]
+    results = []
+
+    async with app.router.lifespan_context(app):
+        running_agents = _seed_orchestrator(app, arguments.running_agents, agent_hash)
+
+        # Failed requests are counted as errors instead of stopping the run
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=None) as client:
+            for scenario in arguments.scenarios:
+                for concurrency in arguments.concurrency:
+                    request = _scenario_request(
+                        scenario, running_agents, deployed_agents,
+                        _signed_agent_requests(arguments.requests, agent_hash, config.WALLET_MESSAGE)
+                        if scenario == "create_agent" else [],
+                    )
+
+                    # Every level starts with cold caches, the network reads get cached along the way
+                    agents_cache.clear()
+                    hits, misses = agents_cache.hits, agents_cache.misses
+                    level = await _run_level(client, request, concurrency, arguments.requests)
+                    level["agents_cache_hits"] = agents_cache.hits - hits
+                    level["agents_cache_misses"] = agents_cache.misses - misses
+                    results.append({"scenario": scenario, **level})
+                    print(
+                        f"{scenario} x{concurrency}: {level['requests_per_second']:.0f} req/s, "
+                        f"p99 {level['latency_ms']['p99']:.1f} ms, loop lag max {level['loop_lag_ms']['max']:.1f} ms",
+                        file=sys.stderr,
+                    )
+
+    return {
+        "benchmark": "api_load",
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "parameters": {
+            "concurrency": arguments.concurrency,
+            "requests": arguments.requests,
+            "aleph_latency": arguments.aleph_latency,
+            "running_agents": arguments.running_agents,
+            "deployed_agents": len(deployed_agents),
+            "crypto_workers": config.CRYPTO_WORKERS,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario and concurrency level")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--aleph-latency", type=float, default=0.05)
+    parser.add_argument("--running-agents", type=int, default=100, help="Deployments held by the orchestrator")
+    parser.add_argument("--deployed-agents", type=int, default=1000, help="Agents only found on the network")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    arguments = parser.parse_args()
+
+    process, standins_info = standins.spawn(
+        "--aleph-latency", str(arguments.aleph_latency),
+        "--deployed-agents", str(arguments.deployed_agents),
+    )
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.environ.update(standins.backend_environment(standins_info, workdir))
+            results = asyncio.run(run_benchmark(arguments, standins_info))
+    finally:
+        standins.stop(process)
+
+    write_results(results, arguments.output)
+    if any(level["errors"] for level in results["results"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
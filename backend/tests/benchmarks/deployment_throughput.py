@@ -0,0 +1,166 @@
+"""
+End-to-end deployment throughput, offline. Drives concurrent `/agent` + `/agent/deploy` flows through
+`backend.main.app` against the local stand-ins, until every agent is ALIVE.
+
+Run `python -m tests.benchmarks.deployment_throughput --deployments 20` from the backend folder. The backend reads
+its usual settings from the environment (e.g. `DEPLOYMENT_WORKERS`), except the ones pointing to the stand-ins.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, TypedDict
+
+import httpx
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+from tests.benchmarks import standins
+from tests.benchmarks.measure import (
+    ResourceSampler,
+    git_revision,
+    summarize,
+    write_results,
+)
+
+
+class DeploymentTiming(TypedDict):
+    agent_id: str
+    create_request: float
+    deploy_request: float
+    time_to_alive: float
+
+
+async def _deploy(client: httpx.AsyncClient, agent_hash: str, wallet_message: str, timeout: float,
+                  poll_interval: float) -> DeploymentTiming:
+    owner = Account.create()
+    agent_id = str(uuid.uuid4())
+    signature = owner.sign_message(encode_defunct(text=f"{wallet_message} {owner.address} {agent_id}"))
+    agent_request = {
+        "agent_id": agent_id,
+        "agent_key": signature.signature.hex(),
+        "agent_hash": agent_hash,
+        "owner": owner.address,
+        "name": f"Benchmark {agent_id}",
+    }
+
+    start = time.monotonic()
+    created = (await client.post("/agent", json=agent_request)).json()
+    if created.get("error"):
+        raise ValueError(created["message"])
+    deploy_start = time.monotonic()
+
+    deploy_request = {**agent_request, "env_variables": {"BENCHMARK": "1"}}
+    deployed = (await client.post("/agent/deploy", json=deploy_request)).json()
+    if deployed.get("error"):
+        raise ValueError(deployed["message"])
+    deploy_end = time.monotonic()
+
+    while time.monotonic() - deploy_start < timeout:
+        agent = (await client.get(f"/agent/{agent_id}")).json()
+        if agent.get("status") == "ALIVE":
+            return {
+                "agent_id": agent_id,
+                "create_request": deploy_start - start,
+                "deploy_request": deploy_end - deploy_start,
+                "time_to_alive": time.monotonic() - deploy_start,
+            }
+        await asyncio.sleep(poll_interval)
+
+    raise TimeoutError(f"Agent {agent_id} not ALIVE after {timeout} seconds")
+
+
+async def run_benchmark(arguments: argparse.Namespace, agent_hash: str) -> Dict[str, Any]:
+    # The configuration is read from the environment on import
+    from backend.config import config
+    from backend.main import app
+    from backend.timeline import TimelineEventType, deployment_timelines
+
+    sampler = ResourceSampler()
+    sampler.start()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=None) as client:
+            start = time.monotonic()
+            outcomes = await asyncio.gather(
+                *[
+                    _deploy(client, agent_hash, config.WALLET_MESSAGE, arguments.timeout, arguments.poll_interval)
+                    for _ in range(arguments.deployments)
+                ],
+                return_exceptions=True,
+            )
+            elapsed = time.monotonic() - start
+    await sampler.stop()
+
+    deployments = [outcome for outcome in outcomes if isinstance(outcome, dict)]
+    errors = [repr(outcome) for outcome in outcomes if not isinstance(outcome, dict)]
+
+    stages: Dict[str, List[float]] = defaultdict(list)
+    for deployment in deployments:
+        for event in deployment_timelines.get(deployment["agent_id"]) or []:
+            if event.type == TimelineEventType.STAGE_EXITED and event.success and event.stage is not None \
+                    and event.duration is not None:
+                stages[event.stage.value].append(event.duration)
+
+    return {
+        "benchmark": "deployment_throughput",
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "parameters": {
+            "deployments": arguments.deployments,
+            "crns": arguments.crns,
+            "aleph_latency": arguments.aleph_latency,
+            "boot_delay": arguments.boot_delay,
+            "script_duration": arguments.script_duration,
+            "deployment_workers": config.DEPLOYMENT_WORKERS,
+            "ssh_max_concurrency": config.SSH_MAX_CONCURRENCY,
+        },
+        "completed": len(deployments),
+        "failed": len(errors),
+        "errors": errors,
+        "elapsed": elapsed,
+        "deployments_per_minute": len(deployments) / elapsed * 60 if elapsed else 0,
+        "time_to_alive": summarize([deployment["time_to_alive"] for deployment in deployments]),
+        "create_request": summarize([deployment["create_request"] for deployment in deployments]),
+        "deploy_request": summarize([deployment["deploy_request"] for deployment in deployments]),
+        "stages": {stage: summarize(durations) for stage, durations in stages.items()},
+        **sampler.results(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--deployments", type=int, default=20, help="Deployments started at once")
+    parser.add_argument("--crns", type=int, default=3)
+    parser.add_argument("--aleph-latency", type=float, default=0.05)
+    parser.add_argument("--boot-delay", type=float, default=1.0)
+    parser.add_argument("--script-duration", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds an agent has to become ALIVE")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between two agent status reads")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    arguments = parser.parse_args()
+
+    process, standins_info = standins.spawn(
+        "--crns", str(arguments.crns),
+        "--aleph-latency", str(arguments.aleph_latency),
+        "--boot-delay", str(arguments.boot_delay),
+        "--script-duration", str(arguments.script_duration),
+    )
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.environ.update(standins.backend_environment(standins_info, workdir))
+            results = asyncio.run(run_benchmark(arguments, standins_info["agent_hash"]))
+    finally:
+        standins.stop(process)
+
+    write_results(results, arguments.output)
+    if results["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
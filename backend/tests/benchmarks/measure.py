@@ -0,0 +1,123 @@
+import asyncio
+import json
+import math
+import resource
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+def percentile(values: List[float], rank: float) -> Optional[float]:
+    """Nearest-rank percentile, `rank` between 0 and 100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(rank / 100 * len(ordered)) - 1)]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def _process_status() -> Dict[str, int]:
+    """Current RSS in kB and OS threads of this process, from procfs when available"""
+    status = {"rss_kb": 0, "threads": threading.active_count()}
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    status["rss_kb"] = int(line.split()[1])
+                elif line.startswith("Threads:"):
+                    status["threads"] = int(line.split()[1])
+    except OSError:
+        pass
+    return status
+
+
+class ResourceSampler:
+    """Samples the RSS and thread count of the process in the background, keeping the peaks"""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak_rss_kb = 0
+        self.peak_threads = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def _sample(self):
+        status = _process_status()
+        self.peak_rss_kb = max(self.peak_rss_kb, status["rss_kb"])
+        self.peak_threads = max(self.peak_threads, status["threads"])
+
+    async def _run(self):
+        while True:
+            self._sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._sample()
+
+    def results(self) -> Dict[str, Any]:
+        # ru_maxrss is in kB on Linux, also catches peaks between two samples
+        max_rss_kb = max(self.peak_rss_kb, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        return {"peak_rss_mb": round(max_rss_kb / 1024, 1), "peak_threads": self.peak_threads}
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task sleeping `interval` seconds, that is how long the loop was
+    blocked by the code running on it.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.monotonic() - start - self.interval))
+
+    def start(self):
+        self.lags = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+def write_results(results: Dict[str, Any], output: Optional[str]):
+    text = json.dumps(results, indent=2)
+    print(text)
+    if output:
+        Path(output).write_text(text + "\n")
+
+
+def git_revision() -> Optional[str]:
+    """Commit the results were measured on, to compare them across commits"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
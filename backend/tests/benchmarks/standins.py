@@ -0,0 +1,584 @@
+"""
+Local stand-ins for the services a deployment talks to: the Aleph API, CRNs, the Base RPC and the instances SSH
+servers. They keep just enough state to take the backend through a whole deployment without touching mainnet.
+
+Run `python -m tests.benchmarks.standins` from the backend folder to serve them, the URLs are printed as a JSON line.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import math
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import zipfile
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import paramiko
+from aiohttp import web
+from aleph.sdk.conf import settings
+from eth_abi import decode, encode
+from web3 import Web3
+
+BACKEND_ROOT = Path(__file__).resolve().parents[2]
+BASE_CHAIN_ID = 8453
+# Post types and channel the backend is configured with when run against the stand-ins
+AGENT_POST_TYPE = "benchmark-agent"
+DEPLOYMENT_POST_TYPE = "benchmark-agent-deployment"
+CHANNEL = "benchmark"
+# Execution networks the fake CRNs hand out, the instance IP is the first address of the network
+INSTANCE_NETWORK = "::/124"
+INSTANCE_HOST = "::1"
+# ALEPH per ETH the fake Uniswap pool quotes
+POOL_PRICE = 30000
+# Phases printed by the fake deployment script, with their share of the script duration
+SCRIPT_PHASES = {
+    "docker_install": 0.1, "code_unpack": 0.1, "image_build": 0.6, "container_start": 0.15, "cleanup": 0.05,
+}
+REMOTE_SCRIPT_PATH = "/tmp/deploy-agent.sh"
+REMOTE_ENV_PATH = "/tmp/.env"
+
+
+def _selector(signature: str) -> bytes:
+    return bytes(Web3.keccak(text=signature)[:4])
+
+
+def _message(message_type: str, sender: str, content: Dict[str, Any], channel: str = "TEST") -> Dict[str, Any]:
+    item_content = json.dumps(content, separators=(",", ":"))
+    return {
+        "sender": sender,
+        "chain": "ETH",
+        "signature": "0x" + "00" * 65,
+        "type": message_type,
+        "item_type": "inline",
+        "item_content": item_content,
+        "item_hash": sha256(item_content.encode()).hexdigest(),
+        "time": time.time(),
+        "channel": channel,
+        "content": content,
+    }
+
+
+def agent_code_archive() -> bytes:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("agent/src/main.py", "from fastapi import FastAPI\n\napp = FastAPI()\n")
+        zip_file.writestr("agent/pyproject.toml", "[tool.poetry]\nname = \"agent\"\n")
+    return archive.getvalue()
+
+
+class FakeAlephAPI:
+    """
+    In-memory Aleph API node: broadcast messages, posts with amends, stored files and price estimates.
+    Every request is delayed by `latency` seconds to stand for the network round trip.
+    """
+
+    def __init__(self, latency: float = 0.0, required_tokens: float = 0.00001):
+        self.latency = latency
+        self.required_tokens = required_tokens
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.posts: Dict[str, Dict[str, Any]] = {}
+        self.files: Dict[str, bytes] = {}
+        self.requests = 0
+
+        self.app = web.Application(middlewares=[self._delay])
+        self.app.add_routes([
+            web.post("/api/v0/messages", self.post_message),
+            web.get("/api/v0/messages/{item_hash}", self.get_message),
+            web.get("/api/v0/posts.json", self.get_posts),
+            web.post("/api/v0/price/estimate", self.estimate_price),
+            web.get("/api/v0/storage/raw/{file_hash}", self.get_file),
+        ])
+
+    @web.middleware
+    async def _delay(self, request: web.Request, handler):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    def seed_agent(self, creator: str) -> str:
+        """Store the root filesystem, an agent and its code, returns the agent hash"""
+        rootfs = _message("STORE", creator, {
+            "address": creator, "time": time.time(), "item_type": "storage", "item_hash": "00" * 32,
+            "size": settings.DEFAULT_ROOTFS_SIZE,
+        })
+        self.messages[settings.UBUNTU_24_QEMU_ROOTFS_ID] = rootfs
+
+        code = agent_code_archive()
+        code_file_hash = sha256(code).hexdigest()
+        self.files[code_file_hash] = code
+        code_message = _message("STORE", creator, {
+            "address": creator, "time": time.time(), "item_type": "storage", "item_hash": code_file_hash,
+        })
+        self.messages[code_message["item_hash"]] = code_message
+
+        agent_message = _message("POST", creator, {
+            "address": creator, "time": time.time(), "type": AGENT_POST_TYPE,
+            "content": {"name": "Benchmark agent", "source_code_hash": code_message["item_hash"]},
+        })
+        self._store(agent_message)
+        return agent_message["item_hash"]
+
+    def seed_deployments(self, count: int, agent_hash: str) -> List[str]:
+        """Publish the posts of `count` agents already deployed, returns their IDs"""
+        agent_ids = []
+        for index in range(count):
+            agent_id = str(uuid.uuid4())
+            owner = Web3.to_checksum_address(sha256(agent_id.encode()).hexdigest()[:40])
+            deployment = {
+                "id": agent_id,
+                "name": f"Agent {index}",
+                "owner": owner,
+                "wallet_address": owner,
+                "required_tokens": 0.005,
+                "instance_hash": None,
+                "agent_hash": agent_hash,
+                "last_update": int(time.time()),
+                "status": "ALIVE",
+                "tags": [agent_id, owner],
+            }
+            self._store(_message("POST", owner, {
+                "address": owner, "time": time.time(), "type": DEPLOYMENT_POST_TYPE, "content": deployment,
+            }, channel=CHANNEL))
+            agent_ids.append(agent_id)
+        return agent_ids
+
+    def _store(self, message: Dict[str, Any]):
+        self.messages[message["item_hash"]] = message
+        if message["type"] != "POST":
+            return
+
+        content = message["content"]
+        post = {
+            "chain": message["chain"],
+            "item_hash": message["item_hash"],
+            "sender": message["sender"],
+            "type": content["type"],
+            "channel": message["channel"],
+            "confirmed": True,
+            "content": content["content"],
+            "item_content": message["item_content"],
+            "item_type": message["item_type"],
+            "signature": message["signature"],
+            "size": len(message["item_content"]),
+            "time": message["time"],
+            "confirmations": [],
+            "original_item_hash": message["item_hash"],
+            "original_signature": message["signature"],
+            "original_type": content["type"],
+            "hash": message["item_hash"],
+            "ref": content.get("ref"),
+        }
+        if content["type"] == "amend":
+            original = self.posts.get(content.get("ref"))
+            if original:
+                original.update(content=content["content"], item_hash=message["item_hash"], time=message["time"])
+            return
+        self.posts[message["item_hash"]] = post
+
+    async def post_message(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        message = body["message"]
+        message["content"] = json.loads(message["item_content"])
+        self._store(message)
+        return web.json_response(
+            {"publication_status": {"status": "success", "failed": []}, "message_status": "processed"}
+        )
+
+    async def get_message(self, request: web.Request) -> web.Response:
+        item_hash = request.match_info["item_hash"]
+        message = self.messages.get(item_hash)
+        if message is None:
+            raise web.HTTPNotFound()
+        return web.json_response({"status": "processed", "item_hash": item_hash, "message": message})
+
+    async def get_posts(self, request: web.Request) -> web.Response:
+        def values(name: str) -> Optional[List[str]]:
+            value = request.query.get(name)
+            return value.split(",") if value else None
+
+        types, tags, hashes = values("types"), values("tags"), values("hashes")
+        addresses, channels = values("addresses"), values("channels")
+
+        posts = [
+            post for post in self.posts.values()
+            if (not types or post["type"] in types)
+            and (not hashes or post["original_item_hash"] in hashes)
+            and (not addresses or post["sender"] in addresses)
+            and (not channels or post["channel"] in channels)
+            and (not tags or any(tag in (post["content"].get("tags") or []) for tag in tags))
+        ]
+        return web.json_response({
+            "posts": posts,
+            "pagination_page": 1,
+            "pagination_total": len(posts),
+            "pagination_per_page": int(request.query.get("pagination", 200)),
+            "pagination_item": "posts",
+        })
+
+    async def estimate_price(self, _request: web.Request) -> web.Response:
+        return web.json_response({"required_tokens": self.required_tokens, "payment_type": "superfluid"})
+
+    async def get_file(self, request: web.Request) -> web.Response:
+        content = self.files.get(request.match_info["file_hash"])
+        if content is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=content)
+
+
+class FakeCRNs:
+    """
+    Compute resource nodes served under `/{name}/` paths, and the CRN list pointing to them.
+    Allocated instances show up in the executions list after `boot_delay` seconds.
+    """
+
+    def __init__(self, count: int = 3, boot_delay: float = 0.0):
+        self.count = count
+        self.boot_delay = boot_delay
+        self.base_url = ""
+        self.allocations: Dict[str, Dict[str, float]] = {f"crn{index}": {} for index in range(count)}
+
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get("/crns.json", self.get_list),
+            web.get("/{crn}/about/usage/system", self.get_usage),
+            web.get("/{crn}/about/executions/list", self.get_executions),
+            web.post("/{crn}/control/allocation/notify", self.notify),
+        ])
+
+    def _allocations(self, request: web.Request) -> Dict[str, float]:
+        allocations = self.allocations.get(request.match_info["crn"])
+        if allocations is None:
+            raise web.HTTPNotFound()
+        return allocations
+
+    async def get_list(self, _request: web.Request) -> web.Response:
+        return web.json_response({"crns": [
+            {
+                "hash": sha256(name.encode()).hexdigest(),
+                "address": f"{self.base_url}/{name}",
+                "payment_receiver_address": Web3.to_checksum_address(sha256(name.encode()).hexdigest()[:40]),
+                "qemu_support": True,
+                "score": 0.9,
+            }
+            for name in self.allocations
+        ]})
+
+    async def get_usage(self, request: web.Request) -> web.Response:
+        self._allocations(request)
+        return web.json_response({
+            "cpu": {"count": 64, "load_average": {"load1": 1, "load5": 1, "load15": 1}},
+            "mem": {"total_kB": 512 * 1024 ** 2, "available_kB": 480 * 1024 ** 2},
+            "disk": {"total_kB": 4 * 1024 ** 3, "available_kB": 3 * 1024 ** 3},
+        })
+
+    async def get_executions(self, request: web.Request) -> web.Response:
+        now = time.monotonic()
+        return web.json_response({
+            item_hash: {"networking": {"ipv4": "10.0.0.1/24", "ipv6": INSTANCE_NETWORK}, "running": True}
+            for item_hash, allocated_at in self._allocations(request).items()
+            if now - allocated_at >= self.boot_delay
+        })
+
+    async def notify(self, request: web.Request) -> web.Response:
+        allocations = self._allocations(request)
+        body = await request.json()
+        allocations[body["instance"]] = time.monotonic()
+        return web.json_response({"success": True})
+
+
+class FakeBaseRPC:
+    """
+    JSON-RPC endpoint answering the Multicall3 reads of the backend. Every wallet is funded, and already streams
+    enough ALEPH to any receiver, so deployments never need to send a transaction.
+    """
+
+    def __init__(self):
+        self.app = web.Application()
+        self.app.add_routes([web.post("/", self.handle)])
+        self.requests = 0
+        self._results = {
+            _selector("getBlockNumber()"): lambda _args: encode(["uint256"], [self.block_number]),
+            _selector("getBasefee()"): lambda _args: encode(["uint256"], [10 ** 7]),
+            _selector("getEthBalance(address)"): lambda _args: encode(["uint256"], [10 ** 18]),
+            _selector("balanceOf(address)"): lambda _args: encode(["uint256"], [10 ** 24]),
+            _selector("slot0()"): lambda _args: encode(
+                ["uint160", "int24", "uint16", "uint16", "uint16", "uint8", "bool"],
+                [int(math.sqrt(POOL_PRICE) * 2 ** 96), 0, 0, 0, 0, 0, True],
+            ),
+            _selector("getFlow(address,address,address)"): lambda _args: encode(
+                ["uint256", "int96", "uint256", "uint256"], [int(time.time()), 10 ** 18, 0, 0]
+            ),
+        }
+        self._aggregate3 = _selector("aggregate3((address,bool,bytes)[])")
+
+    @property
+    def block_number(self) -> int:
+        return int(time.time() / 2)
+
+    def _call(self, data: bytes) -> bytes:
+        if data[:4] == self._aggregate3:
+            (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+            results = []
+            for _target, _allow_failure, call_data in calls:
+                result = self._results.get(call_data[:4])
+                results.append((result is not None, result(call_data[4:]) if result else b""))
+            return encode(["(bool,bytes)[]"], [results])
+
+        result = self._results.get(data[:4])
+        if result is None:
+            raise ValueError(f"Unsupported call {data[:4].hex()}")
+        return result(data[4:])
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        method, params = body["method"], body.get("params", [])
+        response: Dict[str, Any] = {"jsonrpc": "2.0", "id": body.get("id")}
+        try:
+            if method == "eth_chainId":
+                response["result"] = hex(BASE_CHAIN_ID)
+            elif method == "eth_blockNumber":
+                response["result"] = hex(self.block_number)
+            elif method == "eth_call":
+                response["result"] = "0x" + self._call(bytes.fromhex(params[0]["data"].removeprefix("0x"))).hex()
+            else:
+                raise ValueError(f"Unsupported method {method}")
+        except ValueError as error:
+            response["error"] = {"code": -32601, "message": str(error)}
+        return web.json_response(response)
+
+
+class _MemoryFile(paramiko.SFTPHandle):
+    def __init__(self, files: Dict[str, bytearray], path: str, flags: int):
+        super().__init__(flags)
+        self.files = files
+        self.path = path
+        files[path] = bytearray()
+
+    def write(self, offset: int, data: bytes) -> int:
+        content = self.files[self.path]
+        content[offset:offset + len(data)] = data
+        return paramiko.SFTP_OK
+
+    def stat(self) -> paramiko.SFTPAttributes:
+        attributes = paramiko.SFTPAttributes()
+        attributes.st_size = len(self.files[self.path])
+        return attributes
+
+
+class _MemorySFTP(paramiko.SFTPServerInterface):
+    """Uploads only, files are kept in memory for the lifetime of the connection"""
+
+    def __init__(self, server: "_FakeInstance", *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.files = server.files
+
+    def open(self, path: str, flags: int, attr: paramiko.SFTPAttributes):
+        return _MemoryFile(self.files, path, flags)
+
+    def stat(self, path: str):
+        if path not in self.files:
+            return paramiko.SFTP_NO_SUCH_FILE
+        attributes = paramiko.SFTPAttributes()
+        attributes.st_size = len(self.files[path])
+        return attributes
+
+    lstat = stat
+
+
+class _FakeInstance(paramiko.ServerInterface):
+    def __init__(self, script_duration: float):
+        self.script_duration = script_duration
+        self.files: Dict[str, bytearray] = {}
+
+    def get_allowed_auths(self, username: str) -> str:
+        return "publickey"
+
+    def check_auth_publickey(self, username: str, key: paramiko.PKey) -> int:
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel: paramiko.Channel, command: bytes) -> bool:
+        threading.Thread(target=self._run_script, args=(channel,), daemon=True).start()
+        return True
+
+    def _run_script(self, channel: paramiko.Channel):
+        # The deployment script can only run once everything it needs was uploaded
+        if REMOTE_SCRIPT_PATH not in self.files or REMOTE_ENV_PATH not in self.files:
+            channel.sendall_stderr(b"Deployment files missing\n")
+            channel.send_exit_status(1)
+            channel.close()
+            return
+
+        for name, share in SCRIPT_PHASES.items():
+            duration = self.script_duration * share
+            time.sleep(duration)
+            channel.sendall(f"LIBERTAI_PHASE {name} {int(duration * 1000)}\n".encode())
+        channel.send_exit_status(0)
+        channel.close()
+
+
+class FakeSSHServer:
+    """
+    SSH server standing for every instance, on the IPv6 loopback. It accepts any key, stores the uploads in memory
+    and answers the deployment script with its phase markers after `script_duration` seconds.
+    """
+
+    def __init__(self, script_duration: float = 0.0):
+        self.script_duration = script_duration
+        self.host_key = paramiko.ECDSAKey.generate()
+        self.sessions = 0
+        self._socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((INSTANCE_HOST, 0))
+        self._socket.listen(128)
+        self.port = self._socket.getsockname()[1]
+
+    def start(self):
+        threading.Thread(target=self._accept, daemon=True, name="fake-ssh").start()
+
+    def _accept(self):
+        while True:
+            connection, _address = self._socket.accept()
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection: socket.socket):
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _MemorySFTP)
+        try:
+            transport.start_server(server=_FakeInstance(self.script_duration))
+            self.sessions += 1
+        except (paramiko.SSHException, EOFError, OSError):
+            # Readiness probes close the connection right after the banner
+            transport.close()
+
+
+class StandIns:
+    def __init__(self, aleph: FakeAlephAPI, crns: FakeCRNs, rpc: FakeBaseRPC, ssh: FakeSSHServer):
+        self.aleph = aleph
+        self.crns = crns
+        self.rpc = rpc
+        self.ssh = ssh
+        self.urls: Dict[str, Any] = {}
+        self._runners: List[web.AppRunner] = []
+
+    async def _serve(self, app: web.Application) -> str:
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        self._runners.append(runner)
+        port = runner.addresses[0][1]
+        return f"http://127.0.0.1:{port}"
+
+    async def start(self):
+        aleph_url = await self._serve(self.aleph.app)
+        self.crns.base_url = await self._serve(self.crns.app)
+        rpc_url = await self._serve(self.rpc.app)
+        self.ssh.start()
+
+        self.urls = {
+            "aleph_api_url": aleph_url,
+            "crn_list_url": f"{self.crns.base_url}/crns.json",
+            "rpc_url": rpc_url,
+            "ssh_port": self.ssh.port,
+        }
+
+    async def stop(self):
+        for runner in self._runners:
+            await runner.cleanup()
+
+
+async def _serve_forever(arguments: argparse.Namespace):
+    aleph = FakeAlephAPI(latency=arguments.aleph_latency)
+    agent_hash = aleph.seed_agent(creator=Web3.to_checksum_address("0x" + "11" * 20))
+    deployed_agents = aleph.seed_deployments(arguments.deployed_agents, agent_hash)
+    standins = StandIns(
+        aleph=aleph,
+        crns=FakeCRNs(count=arguments.crns, boot_delay=arguments.boot_delay),
+        rpc=FakeBaseRPC(),
+        ssh=FakeSSHServer(script_duration=arguments.script_duration),
+    )
+    await standins.start()
+    print(json.dumps({**standins.urls, "agent_hash": agent_hash, "deployed_agents": deployed_agents}), flush=True)
+
+    # Served until the parent closes our stdin
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, sys.stdin.read)
+    await standins.stop()
+
+
+def spawn(*options: str) -> Tuple[subprocess.Popen, Dict[str, Any]]:
+    """
+    Serve the stand-ins from another process, so they don't weigh on the measured one. Returns the process, stopped
+    by closing its stdin, and the URLs and seeded data printed by it.
+    """
+    process = subprocess.Popen(
+        [sys.executable, "-m", "tests.benchmarks.standins", *options],
+        cwd=BACKEND_ROOT,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    assert process.stdout is not None
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        raise RuntimeError(f"Stand-ins exited with code {process.returncode}")
+    return process, json.loads(line)
+
+
+def stop(process: subprocess.Popen):
+    assert process.stdin is not None
+    process.stdin.close()
+    process.wait(timeout=10)
+
+
+def backend_environment(standins: Dict[str, Any], workdir: str) -> Dict[str, str]:
+    """Settings pointing the backend to the stand-ins, its files are written in `workdir`"""
+    return {
+        "ALEPH_API_URL": standins["aleph_api_url"],
+        "ALEPH_CHANNEL": CHANNEL,
+        "ALEPH_AGENT_POST_TYPE": AGENT_POST_TYPE,
+        "ALEPH_AGENT_DEPLOYMENT_POST_TYPE": DEPLOYMENT_POST_TYPE,
+        "CRN_SELECTION": "true",
+        "CRN_LIST_URL": standins["crn_list_url"],
+        "BASE_RPC_URL": standins["rpc_url"],
+        "SSH_PORT": str(standins["ssh_port"]),
+        "AGENT_IMAGE_BUILD": "false",
+        "SCRIPTS_PATH": str(BACKEND_ROOT / "src" / "backend" / "scripts"),
+        "KEYS_PATH": f"{workdir}/keys",
+        "CODE_FILES_PATH": f"{workdir}/downloads",
+        "IMAGES_PATH": f"{workdir}/images",
+        "STATE_DB_PATH": f"{workdir}/state.db",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--crns", type=int, default=3)
+    parser.add_argument("--aleph-latency", type=float, default=0.05, help="Seconds added to each Aleph API request")
+    parser.add_argument("--boot-delay", type=float, default=1.0, help="Seconds before an instance gets an IP")
+    parser.add_argument("--script-duration", type=float, default=1.0, help="Seconds the deployment script takes")
+    parser.add_argument("--deployed-agents", type=int, default=0, help="Agents already deployed on the network")
+    # Readiness probes hanging up after the banner are expected, not worth a traceback each
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    asyncio.run(_serve_forever(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
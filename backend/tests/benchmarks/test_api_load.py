@@ -0,0 +1,28 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from tests.benchmarks.standins import BACKEND_ROOT
+
+
+@pytest.mark.benchmark
+def test_api_load(tmp_path):
+    # Run in its own process, the backend configuration is read from the environment on import
+    output = tmp_path / "api_load.json"
+    subprocess.run(
+        [
+            sys.executable, "-m", "tests.benchmarks.api_load",
+            "--concurrency", "1", "10",
+            "--requests", "100",
+            "--output", str(output),
+        ],
+        cwd=BACKEND_ROOT,
+        check=True,
+        timeout=600,
+    )
+
+    results = json.loads(output.read_text())["results"]
+    assert {result["scenario"] for result in results} == {"get_agent_orchestrator", "get_agent_network", "create_agent"}
+    assert all(result["errors"] == 0 for result in results)
@@ -0,0 +1,27 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from tests.benchmarks.standins import BACKEND_ROOT
+
+
+@pytest.mark.benchmark
+def test_deployment_throughput(tmp_path):
+    # Run in its own process, the backend configuration is read from the environment on import
+    output = tmp_path / "deployment_throughput.json"
+    subprocess.run(
+        [
+            sys.executable, "-m", "tests.benchmarks.deployment_throughput",
+            "--deployments", "10",
+            "--output", str(output),
+        ],
+        cwd=BACKEND_ROOT,
+        check=True,
+        timeout=600,
+    )
+
+    results = json.loads(output.read_text())
+    assert results["failed"] == 0
+    assert results["completed"] == 10
@@ -0,0 +1,96 @@
+"""
+Micro-benchmarks of the functions run on every API request or deployment stage.
+"""
+import time
+import uuid
+from decimal import Decimal
+
+import pytest
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+from backend.agent import generate_env_file_content, generate_fixed_env_variables
+from backend.blockchain import price_from_sqrt_price_x96
+from backend.config import config
+from backend.models import (
+    AgentDeployment,
+    AgentDeploymentStatus,
+    CRNInfo,
+    FetchedAgentDeployment,
+)
+from backend.serialization import deployment_amend_content, deployment_response_content
+from backend.utils import check_agent_key, format_cost, generate_predictable_key
+
+# ALEPH pool price around 30000 ALEPH per ETH
+SQRT_PRICE_X96 = 13722720286502979387399742685184
+
+
+@pytest.fixture(scope="module")
+def signed_agent_key():
+    owner = Account.create()
+    agent_id = uuid.uuid4()
+    signature = owner.sign_message(encode_defunct(text=f"{config.WALLET_MESSAGE} {owner.address} {agent_id}"))
+    return agent_id, owner.address, signature.signature.hex()
+
+
+@pytest.fixture
+def deployment() -> FetchedAgentDeployment:
+    agent_id = str(uuid.uuid4())
+    owner = Account.create().address
+    return FetchedAgentDeployment(
+        id=agent_id,
+        name="Benchmark agent",
+        owner=owner,
+        wallet_address=Account.create().address,
+        required_tokens=Decimal("0.005"),
+        instance_hash="ab" * 32,
+        agent_hash="cd" * 32,
+        last_update=int(time.time()),
+        status=AgentDeploymentStatus.PENDING_DEPLOY,
+        tags=[agent_id, owner],
+        crn=CRNInfo(url="https://crn.example.org", hash="ef" * 32, receiver_address=owner),
+        post_hash="01" * 32,
+        instance_ip="2001:db8::1",
+    )
+
+
+def test_check_agent_key(benchmark, signed_agent_key):
+    assert benchmark(check_agent_key, *signed_agent_key)
+
+
+def test_generate_predictable_key(benchmark, signed_agent_key):
+    _agent_id, _owner, agent_key = signed_agent_key
+    assert len(benchmark(generate_predictable_key, agent_key)) == 32
+
+
+def test_format_cost(benchmark):
+    required_tokens = Decimal("0.000123456789123456789") * Decimal("0.8")
+    assert benchmark(format_cost, required_tokens) == Decimal("0.000098765431298765")
+
+
+def test_generate_env_file_content(benchmark):
+    fixed_env_variables = generate_fixed_env_variables(
+        private_key="0x" + "11" * 32, creator_address="0x" + "22" * 20, owner_address="0x" + "33" * 20
+    )
+    env_variables = {f"VARIABLE_{index}": f"value-{index}" for index in range(20)}
+    assert benchmark(generate_env_file_content, fixed_env_variables, env_variables).startswith(b"AGENT_WALLET")
+
+
+def test_deployment_amend_content(benchmark, deployment):
+    assert "post_hash" not in benchmark(deployment_amend_content, deployment)
+
+
+def test_deployment_response_content(benchmark, deployment):
+    assert benchmark(deployment_response_content, deployment)["status"] == "PENDING_DEPLOY"
+
+
+def test_deployment_dict(benchmark, deployment):
+    agent = AgentDeployment(**deployment.dict())
+    assert benchmark(agent.dict)["id"] == deployment.id
+
+
+def test_sqrt_price_conversion(benchmark):
+    # Same math as `convert_aleph_to_eth`, without the price oracle
+    required_tokens = Decimal("14.4")
+    required_eth = benchmark(lambda: required_tokens / price_from_sqrt_price_x96(SQRT_PRICE_X96))
+    assert Decimal("0.0004") < required_eth < Decimal("0.0006")
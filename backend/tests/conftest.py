@@ -0,0 +1,58 @@
+from typing import Any, Dict
+
+import pytest
+
+from backend.models import AgentDeploymentStatus, CRNInfo, FetchedAgentDeployment
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmarks", action="store_true", default=False, help="Also run the benchmarks, some take minutes"
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: slow performance measurement, only run with --benchmarks")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmarks"):
+        return
+
+    skip_benchmark = pytest.mark.skip(reason="Benchmarks only run with --benchmarks")
+    for item in items:
+        # Micro-benchmarks use the pytest-benchmark fixture instead of the marker
+        if "benchmark" in item.keywords or "benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(skip_benchmark)
+
+
+@pytest.fixture
+def make_deployment():
+    """Builds deployments in the given status, the other fields have placeholder values"""
+
+    def make(status: AgentDeploymentStatus = AgentDeploymentStatus.PENDING_FUND, agent_id: str = "agent",
+             **fields) -> FetchedAgentDeployment:
+        values: Dict[str, Any] = {
+            "id": agent_id,
+            "name": "Agent",
+            "owner": "0xowner",
+            "wallet_address": "0xwallet",
+            "required_tokens": 0.005,
+            "instance_hash": None,
+            "agent_hash": "hash",
+            "last_update": 1,
+            "status": status,
+            "tags": [agent_id],
+            "crn": None,
+            "post_hash": "post",
+            "instance_ip": None,
+        }
+        values.update(fields)
+        return FetchedAgentDeployment(**values)
+
+    return make
+
+
+@pytest.fixture
+def crn_info():
+    return CRNInfo(url="https://crn.example.org", hash="ab" * 32, receiver_address="0xreceiver")
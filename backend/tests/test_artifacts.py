@@ -0,0 +1,73 @@
+import asyncio
+import os
+
+import pytest
+
+from backend.artifacts import ArtifactCache
+
+
+async def test_concurrent_requests_share_one_download(tmp_path):
+    cache = ArtifactCache(str(tmp_path), ".zip", max_size=1024)
+    downloads = []
+    release = asyncio.Event()
+
+    async def download(key, path):
+        downloads.append(key)
+        await release.wait()
+        path.write_bytes(b"code")
+        return True
+
+    requests = [asyncio.create_task(cache.get("code", download)) for _ in range(3)]
+    await asyncio.sleep(0)
+    # Incomplete files aren't visible under their final name
+    assert not cache.path_for("code").exists()
+    release.set()
+
+    assert await asyncio.gather(*requests) == [tmp_path / "code.zip"] * 3
+    assert downloads == ["code"]
+    assert await cache.get("code", download) == tmp_path / "code.zip"
+    assert downloads == ["code"]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+async def test_failed_downloads_leave_nothing(tmp_path):
+    cache = ArtifactCache(str(tmp_path), ".zip", max_size=1024)
+
+    async def unverified(key, path):
+        path.write_bytes(b"corrupted")
+        return False
+
+    async def failing(key, path):
+        path.write_bytes(b"partial")
+        raise ConnectionError("download interrupted")
+
+    assert await cache.get("code", unverified) is None
+    with pytest.raises(ConnectionError):
+        await cache.get("code", failing)
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_least_recently_used_eviction(tmp_path):
+    cache = ArtifactCache(str(tmp_path), ".zip", max_size=250)
+
+    async def download(key, path):
+        path.write_bytes(b"x" * 100)
+        return True
+
+    for age, key in enumerate(["old", "used", "new"]):
+        await cache.get(key, download)
+        os.utime(cache.path_for(key), (age, age))
+    # Only two files fit, reading "used" makes "old" the least recently used one
+    assert not cache.path_for("old").exists()
+
+    await cache.get("used", download)
+    await cache.get("newest", download)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["newest.zip", "used.zip"]
+
+
+def test_incomplete_files_are_dropped_on_start(tmp_path):
+    (tmp_path / "code-1234.part").write_bytes(b"partial")
+    (tmp_path / "other.zip").write_bytes(b"code")
+
+    ArtifactCache(str(tmp_path), ".zip", max_size=1024)
+    assert [path.name for path in tmp_path.iterdir()] == ["other.zip"]
@@ -0,0 +1,55 @@
+from backend import cache as cache_module
+from backend.cache import MISSING, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_expiry(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    cache = TTLCache(maxsize=10, ttl=10)
+
+    cache.set("agent", "deployment")
+    cache.set("unknown", None, ttl=1)
+    assert cache.get("agent") == "deployment"
+    # None is a cached value, not a miss
+    assert cache.get("unknown") is None
+    assert cache.get("other") is MISSING
+    assert cache.get("other", "default") == "default"
+
+    clock.now = 5
+    assert cache.get("unknown") is MISSING
+    assert cache.get("agent") == "deployment"
+    clock.now = 10
+    assert cache.get("agent") is MISSING
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (3, 4)
+
+
+def test_least_recently_used_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_invalidate():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("a")
+    cache.invalidate("unknown")
+    assert cache.get("a") is MISSING and cache.get("b") == 2
+
+    cache.clear()
+    assert len(cache) == 0
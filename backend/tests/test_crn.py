@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from aleph.sdk.conf import settings
+
+from backend.clients import clients
+from backend.crn import (
+    PATH_ABOUT_EXECUTIONS_LIST,
+    PATH_ABOUT_USAGE_SYSTEM,
+    CRNCandidate,
+    CRNExecutionsCache,
+    CRNProbe,
+    CRNSelector,
+)
+from backend.models import CRNInfo
+
+INSTANCE_MEMORY_KB = settings.DEFAULT_INSTANCE_MEMORY * 1024
+TOTAL_MEMORY_KB = 16 * 1024 ** 2
+
+
+def usage(memory_available_kb: int, load_average: float, disk_available_kb: int = 100 * 1024 ** 2) -> dict:
+    return {
+        "cpu": {"count": 4, "load_average": {"load1": load_average, "load5": load_average, "load15": load_average}},
+        "mem": {"total_kB": TOTAL_MEMORY_KB, "available_kB": memory_available_kb},
+        "disk": {"total_kB": 200 * 1024 ** 2, "available_kB": disk_available_kb},
+    }
+
+
+USAGES = {
+    # Room for 3 instances
+    "roomy": usage(3 * INSTANCE_MEMORY_KB, load_average=0),
+    "busy": usage(TOTAL_MEMORY_KB // 2, load_average=2),
+    "full-disk": usage(TOTAL_MEMORY_KB, load_average=0, disk_available_kb=1024),
+}
+
+
+@pytest.fixture
+async def crn_server():
+    """Serves a CRN list and the usage of each of its nodes, which are paths of the same server"""
+    probes = []
+    usages = dict(USAGES)
+
+    async def crns(request):
+        base_url = str(request.url.origin())
+        nodes = [
+            {"hash": name, "address": f"{base_url}/{name}/", "payment_receiver_address": f"0x{name}",
+             "qemu_support": True, "score": score}
+            for name, score in [("roomy", 0.9), ("busy", 0.8), ("full-disk", 1), ("broken", 1)]
+        ]
+        nodes.append({"hash": "no-qemu", "address": f"{base_url}/no-qemu", "payment_receiver_address": "0x0",
+                      "qemu_support": False, "score": 1})
+        return web.json_response({"crns": nodes})
+
+    async def system_usage(request):
+        name = request.match_info["name"]
+        probes.append(name)
+        if name not in usages:
+            raise web.HTTPInternalServerError()
+        return web.json_response(usages[name])
+
+    app = web.Application()
+    app.router.add_get("/crns.json", crns)
+    app.router.add_get(f"/{{name}}{PATH_ABOUT_USAGE_SYSTEM}", system_usage)
+
+    server = TestServer(app)
+    await server.start_server()
+    yield server, probes, usages
+    await server.close()
+    await clients.close()
+
+
+def candidate(memory_available_kb: int, load_average: float = 0, latency: float = 0,
+              disk_available_kb: int = 100 * 1024 ** 2, network_score: float = 1) -> CRNCandidate:
+    return CRNCandidate(
+        info=CRNInfo(url="https://crn.example.org", hash="crn", receiver_address="0xreceiver"),
+        network_score=network_score,
+        probe=CRNProbe(
+            latency=latency, cpu_count=4, load_average=load_average, memory_total_kb=TOTAL_MEMORY_KB,
+            memory_available_kb=memory_available_kb, disk_available_kb=disk_available_kb, probed_at=0,
+        ),
+    )
+
+
+def test_score():
+    selector = CRNSelector(list_url="")
+
+    idle = selector.score(candidate(TOTAL_MEMORY_KB))
+    assert idle == pytest.approx(1)
+    assert selector.score(candidate(TOTAL_MEMORY_KB, network_score=0.5)) == pytest.approx(0.5)
+    # Each metric lowers the score
+    assert selector.score(candidate(TOTAL_MEMORY_KB // 2)) < idle
+    assert selector.score(candidate(TOTAL_MEMORY_KB, load_average=2)) < idle
+    assert selector.score(candidate(TOTAL_MEMORY_KB, latency=1)) < idle
+    # Overloaded CPUs don't make the score negative
+    assert selector.score(candidate(TOTAL_MEMORY_KB, load_average=8)) == pytest.approx(0.7)
+
+    # Nodes without room for an instance, or not probed, aren't candidates
+    assert selector.score(candidate(INSTANCE_MEMORY_KB - 1)) is None
+    assert selector.score(candidate(TOTAL_MEMORY_KB, disk_available_kb=1024)) is None
+    assert selector.score(CRNCandidate(info=candidate(0).info, network_score=1)) is None
+
+
+async def test_select_reserves_memory(crn_server):
+    server, probes, _usages = crn_server
+    selector = CRNSelector(list_url=str(server.make_url("/crns.json")))
+
+    # The roomy node wins until the instances allocated on it fill its memory
+    selected = [(await selector.select()).hash for _ in range(5)]
+    assert selected == ["roomy", "roomy", "roomy", "busy", "busy"]
+    assert sorted(probes) == ["broken", "busy", "full-disk", "roomy"]
+    assert {candidate.info.hash for candidate in selector.candidates} == {"roomy", "busy", "full-disk", "broken"}
+    roomy = next(candidate for candidate in selector.candidates if candidate.info.hash == "roomy")
+    assert roomy.info.url == f"{server.make_url('/roomy')}"
+
+    # A new probe measures the memory actually used, replacing the reservations
+    await selector.refresh()
+    assert (await selector.select()).hash == "roomy"
+
+
+async def test_select_without_candidates(crn_server):
+    server, _probes, usages = crn_server
+    usages.clear()
+    selector = CRNSelector(list_url=str(server.make_url("/crns.json")))
+    assert await selector.select() is None
+
+
+@pytest.fixture
+async def executions_server():
+    """Serves an executions list the test can change, and counts the requests"""
+    executions = {}
+    requests = []
+
+    async def executions_list(request):
+        requests.append(request.path)
+        return web.json_response(executions)
+
+    app = web.Application()
+    app.router.add_get(PATH_ABOUT_EXECUTIONS_LIST, executions_list)
+
+    server = TestServer(app)
+    await server.start_server()
+    yield str(server.make_url("")).rstrip("/"), executions, requests
+    await server.close()
+    await clients.close()
+
+
+async def test_wait_for_execution(executions_server):
+    crn_url, executions, requests = executions_server
+    cache = CRNExecutionsCache(ttl=60, poll_interval=0.01)
+    executions["running"] = {"networking": {"ipv6": "2001:db8::1"}}
+
+    # Already listed, answered from the first fetch
+    assert await cache.wait_for_execution(crn_url, "running", timeout=1) == executions["running"]
+
+    # Deployments waiting on the same CRN share one poller
+    waiters = [asyncio.create_task(cache.wait_for_execution(crn_url, item_hash, timeout=1))
+               for item_hash in ["first", "first", "second"]]
+    await asyncio.sleep(0.05)
+    polls = len(requests)
+    executions["first"] = {"networking": {"ipv6": "2001:db8::2"}}
+    executions["second"] = {"networking": {"ipv6": "2001:db8::3"}}
+
+    assert await asyncio.gather(*waiters) == [executions["first"], executions["first"], executions["second"]]
+    assert len(requests) <= polls + 2
+    assert cache._pollers == {} and cache._waiters == {}
+
+
+async def test_wait_for_execution_timeout(executions_server):
+    crn_url, _executions, _requests = executions_server
+    cache = CRNExecutionsCache(ttl=60, poll_interval=0.01)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await cache.wait_for_execution(crn_url, "missing", timeout=0.05)
+    await asyncio.sleep(0.05)
+    assert cache._pollers == {} and cache._waiters == {}
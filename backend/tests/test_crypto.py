@@ -0,0 +1,31 @@
+import uuid
+
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+from backend.blockchain import load_account
+from backend.config import config
+from backend.crypto import CryptoExecutor
+from backend.utils import generate_predictable_key
+
+
+async def test_load_account_off_the_loop():
+    key = generate_predictable_key("0x" + "ab" * 65)
+    account = await load_account(key)
+    assert account.get_address() == Account.from_key(key).address
+    assert account.superfluid_connector is not None
+
+
+async def test_signature_checks_are_cached():
+    owner = Account.create()
+    agent_id = uuid.uuid4()
+    signature = owner.sign_message(encode_defunct(text=f"{config.WALLET_MESSAGE} {owner.address} {agent_id}"))
+
+    executor = CryptoExecutor(workers=1, cache_size=10)
+    try:
+        assert await executor.check_agent_key(agent_id, owner.address, signature.signature.hex())
+        assert not await executor.check_agent_key(uuid.uuid4(), owner.address, signature.signature.hex())
+        assert await executor.check_agent_key(agent_id, owner.address, signature.signature.hex())
+        assert executor.verifications.hits == 1
+    finally:
+        await executor.stop()
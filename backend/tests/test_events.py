@@ -0,0 +1,65 @@
+import asyncio
+
+import orjson
+
+from backend.events import DeploymentEventHub, DeploymentEventType, Subscription
+from backend.models import AgentDeploymentStatus
+
+
+async def test_subscription_keeps_the_latest_frames():
+    subscription = Subscription("agent", maxsize=2)
+
+    assert not subscription.put(b"1")
+    assert not subscription.put(b"2")
+    assert subscription.put(b"3")
+    assert await subscription.get() == b"2"
+    assert await subscription.get() == b"3"
+    assert await subscription.get(timeout=0.01) is None
+
+
+async def test_subscription_close():
+    subscription = Subscription("agent", maxsize=10)
+    waiting = asyncio.create_task(subscription.get())
+    await asyncio.sleep(0)
+    subscription.put(b"1")
+    assert await waiting == b"1"
+
+    # The frames sent before closing are still delivered
+    subscription.put(b"2")
+    subscription.close()
+    assert await subscription.get() == b"2"
+    assert await subscription.get() is None
+
+    # Closing wakes up a waiting reader
+    other = Subscription("agent", maxsize=10)
+    waiting = asyncio.create_task(other.get())
+    await asyncio.sleep(0)
+    other.close()
+    assert await asyncio.wait_for(waiting, 1) is None
+
+
+async def test_hub_fan_out(make_deployment):
+    hub = DeploymentEventHub(buffer_size=1, max_subscribers=2)
+    first, second = hub.subscribe("agent"), hub.subscribe("agent")
+    assert hub.subscribe("other") is None
+    assert hub.subscribers == 2
+
+    hub.publish(DeploymentEventType.RETRY, make_deployment(AgentDeploymentStatus.PENDING_SWAP), name="swap",
+                reason="timeout")
+    hub.publish(DeploymentEventType.STATUS, make_deployment(AgentDeploymentStatus.ALIVE))
+    # The RETRY frames were replaced by the latest state in both buffers
+    assert hub.dropped == 2
+
+    frame = await first.get()
+    assert frame == await second.get()
+    header, data = frame.removesuffix(b"\n\n").rsplit(b"\n", 1)
+    assert header == b"id: 2\nevent: STATUS"
+    assert orjson.loads(data.removeprefix(b"data: "))["status"] == "ALIVE"
+    # Nothing follows an ALIVE state
+    assert first.closed and await first.get() is None
+
+    hub.unsubscribe(first)
+    hub.unsubscribe(first)
+    hub.unsubscribe(second)
+    assert hub.subscribers == 0
+    hub.publish(DeploymentEventType.STATUS, make_deployment())
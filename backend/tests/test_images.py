@@ -0,0 +1,31 @@
+from backend.artifacts import ArtifactCache
+from backend.images import AgentImageBuilder
+
+
+async def test_failed_builds_are_not_retried(tmp_path):
+    builds = []
+
+    async def build(code_hash, destination):
+        builds.append(code_hash)
+        if code_hash == "broken":
+            raise RuntimeError("docker build failed")
+        if code_hash == "missing":
+            return False
+        destination.write_bytes(b"image")
+        return True
+
+    builder = AgentImageBuilder(ArtifactCache(str(tmp_path), ".tar.gz", max_size=1024), enabled=True, failure_ttl=60)
+    builder.enabled = True
+    builder._build = build
+
+    assert await builder.get_image("broken") is None
+    assert await builder.get_image("missing") is None
+    assert await builder.get_image("working") == str(tmp_path / "working.tar.gz")
+    assert await builder.get_image("broken") is None
+    assert await builder.get_image("missing") is None
+    assert builds == ["broken", "missing", "working"]
+
+    # Retried once the failure expires
+    builder.failures.clear()
+    assert await builder.get_image("broken") is None
+    assert builds == ["broken", "missing", "working", "broken"]
@@ -0,0 +1,22 @@
+import asyncio
+
+from backend.keys import SSHKeyPool
+
+
+async def test_pool_lifecycle(tmp_path):
+    pool = SSHKeyPool(directory=str(tmp_path / "pool"), size=2, key_type="ed25519")
+    await pool.start()
+    await asyncio.wait_for(pool._refill, 30)
+    assert pool.available == 2
+
+    private_key_path, public_key_path = tmp_path / "agent_private.key", tmp_path / "agent_public.key"
+    ssh_private_key, ssh_public_key = await pool.assign(private_key_path, public_key_path)
+    assert private_key_path.read_text() == ssh_private_key
+    assert public_key_path.read_text() == ssh_public_key
+    assert ssh_public_key.startswith("ssh-ed25519 ")
+
+    await pool.stop()
+    assert pool._executor is None
+
+    # The ready pairs survive a restart
+    assert SSHKeyPool(directory=str(tmp_path / "pool"), size=2, key_type="ed25519").available >= 1
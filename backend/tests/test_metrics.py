@@ -0,0 +1,44 @@
+import pytest
+
+from backend.metrics import instrumented, register_cache, registry
+from backend.timeline import TimelineEventType, current_agent_id, deployment_timelines
+
+
+class Cache:
+    hits = 3
+    misses = 1
+
+
+async def test_instrumented_calls():
+    @instrumented("crn", "test_call")
+    async def call(fail: bool):
+        if fail:
+            raise ConnectionError("down")
+
+    labels = {"dependency": "crn", "operation": "test_call"}
+    current_agent_id.set("metrics-agent")
+    await call(fail=False)
+    with pytest.raises(ConnectionError):
+        await call(fail=True)
+
+    assert registry.get_sample_value("creaitors_dependency_request_duration_seconds_count", labels) == 2
+    assert registry.get_sample_value("creaitors_dependency_errors_total", labels) == 1
+    calls = deployment_timelines.get("metrics-agent")
+    assert [(event.type, event.name, event.success) for event in calls] == [
+        (TimelineEventType.CALL, "crn.test_call", True),
+        (TimelineEventType.CALL, "crn.test_call", False),
+    ]
+
+
+def test_registered_caches():
+    cache = Cache()
+    register_cache("test_cache", cache)
+
+    labels = {"cache": "test_cache"}
+    assert registry.get_sample_value("creaitors_cache_hits_total", labels) == 3
+    assert registry.get_sample_value("creaitors_cache_misses_total", labels) == 1
+    assert registry.get_sample_value("creaitors_cache_hit_ratio", labels) == 0.75
+
+    # Read when collected
+    cache.hits = 5
+    assert registry.get_sample_value("creaitors_cache_hits_total", labels) == 5
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from backend import publisher as publisher_module
+from backend.config import config
+from backend.models import AgentDeploymentStatus
+from backend.publisher import StatusPublisher
+
+ACCOUNT = object()
+
+
+@pytest.fixture
+def amends(monkeypatch):
+    """Statuses sent, in order, the test can make the next calls fail by queueing errors"""
+    sent = []
+    errors = []
+
+    async def amend_message(account, content, ref):
+        await asyncio.sleep(0)
+        if errors:
+            raise errors.pop(0)
+        assert "post_hash" not in content
+        assert ref == "post"
+        sent.append(content["status"])
+
+    monkeypatch.setattr(publisher_module, "amend_message", amend_message)
+    monkeypatch.setattr(publisher_module, "cache_agent", lambda deployment: None)
+    monkeypatch.setattr(config, "STATUS_PUBLISH_BACKOFF_INITIAL", 0)
+    monkeypatch.setattr(config, "STATUS_PUBLISH_BACKOFF_MAX", 0)
+    return sent, errors
+
+
+async def test_coalesces_states_queued_during_an_amend(amends, make_deployment):
+    sent, _errors = amends
+    publisher = StatusPublisher(max_attempts=3)
+
+    publisher.publish(ACCOUNT, make_deployment(AgentDeploymentStatus.PENDING_SWAP))
+    await asyncio.sleep(0)
+    # Both queued while the first amend is in flight, only the latest is sent
+    publisher.publish(ACCOUNT, make_deployment(AgentDeploymentStatus.PENDING_ALLOCATION))
+    publisher.publish(ACCOUNT, make_deployment(AgentDeploymentStatus.PENDING_START))
+
+    assert await publisher.flush("agent", timeout=1)
+    assert sent == ["PENDING_SWAP", "PENDING_START"]
+    assert publisher.coalesced == 1
+    assert publisher.queue_depth == 0
+
+
+async def test_retries_failed_amends(amends, make_deployment):
+    sent, errors = amends
+    errors.extend([ConnectionError("down"), ConnectionError("down")])
+    publisher = StatusPublisher(max_attempts=3)
+
+    publisher.publish(ACCOUNT, make_deployment(AgentDeploymentStatus.ALIVE))
+    assert await publisher.flush("agent", timeout=1)
+    assert sent == ["ALIVE"]
+
+
+async def test_reports_states_given_up(amends, make_deployment):
+    sent, errors = amends
+    errors.extend([ConnectionError("down")] * 2)
+    publisher = StatusPublisher(max_attempts=2)
+
+    publisher.publish(ACCOUNT, make_deployment(AgentDeploymentStatus.ALIVE))
+    assert not await publisher.flush("agent", timeout=1)
+    assert not await publisher.flush(timeout=1)
+    assert sent == []
+
+    # A newer state clears the failure once sent
+    publisher.publish(ACCOUNT, make_deployment(AgentDeploymentStatus.ALIVE))
+    assert await publisher.flush("agent", timeout=1)
+    assert sent == ["ALIVE"]
+
+
+async def test_flush_timeout(amends, monkeypatch, make_deployment):
+    publisher = StatusPublisher(max_attempts=1)
+    release = asyncio.Event()
+
+    async def slow_amend(account, content, ref):
+        await release.wait()
+
+    monkeypatch.setattr(publisher_module, "amend_message", slow_amend)
+    publisher.publish(ACCOUNT, make_deployment(AgentDeploymentStatus.ALIVE))
+    assert not await publisher.flush("agent", timeout=0.01)
+    release.set()
+    assert await publisher.flush("agent", timeout=1)
+
+
+async def test_state_queued_as_the_last_amend_completes(amends, monkeypatch, make_deployment):
+    sent, _errors = amends
+    publisher = StatusPublisher(max_attempts=3)
+    final = make_deployment(AgentDeploymentStatus.ALIVE)
+
+    async def amend_message(account, content, ref):
+        sent.append(content["status"])
+        if len(sent) == 1:
+            # Runs once the publishing task has returned, before its done callbacks
+            asyncio.get_running_loop().call_soon(publisher.publish, ACCOUNT, final)
+
+    monkeypatch.setattr(publisher_module, "amend_message", amend_message)
+    publisher.publish(ACCOUNT, make_deployment(AgentDeploymentStatus.PENDING_DEPLOY))
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+    assert await publisher.flush("agent", timeout=1)
+    assert sent == ["PENDING_DEPLOY", "ALIVE"]
@@ -0,0 +1,117 @@
+import asyncio
+from typing import Optional
+
+from backend.scheduler import PRIORITY_NEW, PRIORITY_RESUME, DeploymentScheduler
+
+
+class FakeDeployment:
+    def __init__(self, name: str, order: list, release: Optional[asyncio.Event] = None):
+        self.name = name
+        self.order = order
+        self.release = release
+        self.started = asyncio.Event()
+        self.cancelled = False
+
+    async def deploy(self):
+        self.order.append(self.name)
+        self.started.set()
+        if self.release is not None:
+            try:
+                await self.release.wait()
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+
+
+async def test_runs_resumed_deployments_first():
+    order = []
+    release = asyncio.Event()
+    scheduler = DeploymentScheduler(workers=1)
+    await scheduler.start()
+
+    # Keep the only worker busy while the other jobs are queued
+    blocker = FakeDeployment("blocker", order, release)
+    scheduler.submit("blocker", blocker)
+    await blocker.started.wait()
+    scheduler.submit("new-1", FakeDeployment("new-1", order), priority=PRIORITY_NEW)
+    scheduler.submit("resumed", FakeDeployment("resumed", order), priority=PRIORITY_RESUME)
+    scheduler.submit("new-2", FakeDeployment("new-2", order), priority=PRIORITY_NEW)
+    assert scheduler.queue_depth == 3
+
+    release.set()
+    await asyncio.wait_for(scheduler._queue.join(), 1)
+    assert order == ["blocker", "resumed", "new-1", "new-2"]
+    await scheduler.stop()
+
+
+async def test_rejects_agents_already_scheduled():
+    scheduler = DeploymentScheduler(workers=1)
+    await scheduler.start()
+    release = asyncio.Event()
+
+    assert scheduler.submit("agent", FakeDeployment("agent", [], release))
+    assert not scheduler.submit("agent", FakeDeployment("agent", []))
+    release.set()
+    await scheduler.stop()
+
+
+async def test_cancel_pending_and_running():
+    order = []
+    release = asyncio.Event()
+    scheduler = DeploymentScheduler(workers=1)
+    await scheduler.start()
+
+    running = FakeDeployment("running", order, release)
+    scheduler.submit("running", running)
+    await running.started.wait()
+    scheduler.submit("pending", FakeDeployment("pending", order))
+
+    assert scheduler.cancel("pending")
+    assert scheduler.cancel("running")
+    assert not scheduler.cancel("unknown")
+    await asyncio.wait_for(scheduler._queue.join(), 1)
+
+    assert running.cancelled
+    assert order == ["running"]
+    assert not scheduler.is_scheduled("running") and not scheduler.is_scheduled("pending")
+
+    # The worker survived the cancellation of its deployment
+    scheduler.submit("next", FakeDeployment("next", order))
+    await asyncio.wait_for(scheduler._queue.join(), 1)
+    assert order == ["running", "next"]
+    await scheduler.stop()
+
+
+async def test_stop_with_deployment_in_flight():
+    scheduler = DeploymentScheduler(workers=2)
+    await scheduler.start()
+    running = FakeDeployment("running", [], asyncio.Event())
+    scheduler.submit("running", running)
+    await running.started.wait()
+
+    await asyncio.wait_for(scheduler.stop(), 1)
+    assert running.cancelled
+    assert scheduler.in_flight == 0
+
+    # Can be started again after a stop
+    await scheduler.start()
+    order = []
+    scheduler.submit("again", FakeDeployment("again", order))
+    await asyncio.wait_for(scheduler._queue.join(), 1)
+    assert order == ["again"]
+    await scheduler.stop()
+
+
+async def test_failed_deployment_keeps_the_worker():
+    class FailingDeployment:
+        async def deploy(self):
+            raise ValueError("boom")
+
+    order = []
+    scheduler = DeploymentScheduler(workers=1)
+    await scheduler.start()
+    scheduler.submit("failing", FailingDeployment())
+    scheduler.submit("next", FakeDeployment("next", order))
+    await asyncio.wait_for(scheduler._queue.join(), 1)
+    assert order == ["next"]
+    await scheduler.stop()
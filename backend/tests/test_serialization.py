@@ -0,0 +1,30 @@
+from backend.models import AgentDeploymentStatus
+from backend.serialization import DeploymentVersion
+
+
+def test_version_changes_with_the_state(make_deployment):
+    version = DeploymentVersion.of(make_deployment(AgentDeploymentStatus.PENDING_START))
+
+    assert DeploymentVersion.of(make_deployment(AgentDeploymentStatus.PENDING_START)) == version
+    assert DeploymentVersion.of(make_deployment(AgentDeploymentStatus.PENDING_DEPLOY)).etag != version.etag
+    assert DeploymentVersion.of(make_deployment(AgentDeploymentStatus.PENDING_START, last_update=2)).etag \
+        != version.etag
+    assert DeploymentVersion.of(
+        make_deployment(AgentDeploymentStatus.PENDING_START, instance_ip="2001:db8::1")
+    ).etag != version.etag
+
+
+def test_version_matches(make_deployment):
+    version = DeploymentVersion.of(make_deployment())
+
+    assert version.matches(version.etag)
+    assert version.matches(f"W/{version.etag}")
+    assert version.matches(f'"other", {version.etag}')
+    assert version.matches(" * ")
+    assert not version.matches('"other"')
+    assert not version.matches(version.etag.strip('"'))
+    assert not version.matches("")
+
+    headers = version.headers()
+    assert headers["ETag"] == version.etag
+    assert headers["Last-Modified"] == "Thu, 01 Jan 1970 00:00:01 GMT"
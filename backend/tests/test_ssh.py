@@ -0,0 +1,101 @@
+import pytest
+
+from backend import ssh
+from backend.config import config
+
+
+class FakeChannel:
+    def __init__(self, exit_status: int):
+        self.exit_status = exit_status
+        self.combine_stderr = False
+
+    def set_combine_stderr(self, combine: bool):
+        self.combine_stderr = combine
+
+    def recv_exit_status(self) -> int:
+        return self.exit_status
+
+
+class FakeStream:
+    def __init__(self, channel: FakeChannel, stdout: bytes, stderr: bytes):
+        self.channel = channel
+        self._stdout = stdout
+        self._stderr = stderr
+
+    def read(self) -> bytes:
+        # The remote stderr only shows up on stdout once the streams are combined
+        return self._stdout + self._stderr if self.channel.combine_stderr else self._stdout
+
+
+class FakeSFTP:
+    def __init__(self):
+        self.files = []
+
+    def put(self, local_path, remote_path):
+        self.files.append(remote_path)
+
+    def putfo(self, file, remote_path):
+        self.files.append(remote_path)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def ssh_client(monkeypatch):
+    """Fake SSH client running a deployment script, the test sets its output and exit status"""
+
+    class FakeSSHClient:
+        stdout = b""
+        stderr = b""
+        exit_status = 0
+        instances: list = []
+
+        def __init__(self):
+            self.sftp = FakeSFTP()
+            self.closed = False
+            FakeSSHClient.instances.append(self)
+
+        def set_missing_host_key_policy(self, policy):
+            pass
+
+        def connect(self, **kwargs):
+            pass
+
+        def open_sftp(self):
+            return self.sftp
+
+        def exec_command(self, command):
+            channel = FakeChannel(self.exit_status)
+            return None, FakeStream(channel, self.stdout, self.stderr), FakeStream(channel, self.stderr, b"")
+
+        def close(self):
+            self.closed = True
+
+    # The fakes only stand in for methods the real classes have
+    assert all(hasattr(ssh.paramiko.Channel, name) for name in vars(FakeChannel) if not name.startswith("_"))
+    assert all(hasattr(ssh.paramiko.SSHClient, name) for name in vars(FakeSSHClient) if not name.startswith("_")
+               and name not in ("stdout", "stderr", "exit_status", "instances"))
+    monkeypatch.setattr(ssh.paramiko, "SSHClient", FakeSSHClient)
+    monkeypatch.setattr(config, "SCRIPTS_PATH", "scripts")
+    return FakeSSHClient
+
+
+def test_upload_and_run(ssh_client):
+    ssh_client.stdout = b"Installing\nLIBERTAI_PHASE install 1500\nLIBERTAI_PHASE run 250\n"
+    ssh_client.stderr = b"apt warnings\n" * 1000
+
+    phases = ssh._upload_and_run("2001:db8::1", None, None, "image.tar.gz", b"KEY=value")
+    assert phases == {"install": 1.5, "run": 0.25}
+    assert ssh_client.instances[-1].sftp.files == [ssh.REMOTE_IMAGE_PATH, ssh.REMOTE_ENV_PATH, ssh.REMOTE_SCRIPT_PATH]
+    assert ssh_client.instances[-1].closed
+
+
+def test_failing_script(ssh_client):
+    ssh_client.stdout = b"LIBERTAI_PHASE install 1500\n"
+    ssh_client.stderr = b"docker: command not found\n"
+    ssh_client.exit_status = 127
+
+    with pytest.raises(ValueError, match="exit status 127:\n.*\ndocker: command not found"):
+        ssh._upload_and_run("2001:db8::1", None, "code.zip", None, b"")
+    assert ssh_client.instances[-1].closed
@@ -0,0 +1,78 @@
+import os
+import stat
+
+import pytest
+
+from backend.models import AgentDeploymentStatus
+from backend.state import DeploymentStateStore
+
+
+@pytest.fixture
+async def store(tmp_path):
+    store = DeploymentStateStore(str(tmp_path / "state.db"))
+    yield store
+    await store.close()
+
+
+async def test_round_trip(store, make_deployment, crn_info):
+    deployment = make_deployment(
+        AgentDeploymentStatus.PENDING_START, crn=crn_info, instance_hash="cd" * 32, instance_ip="2001:db8::1"
+    )
+    await store.save(deployment, private_key="11" * 32, creator_wallet="0xcreator", env_variables={"KEY": "value"})
+
+    [stored] = await store.pending()
+    assert stored.deployment == deployment
+    assert stored.private_key == "11" * 32
+    assert stored.creator_wallet == "0xcreator"
+    assert stored.env_variables == {"KEY": "value"}
+    assert stored.attempts == 0 and stored.last_error is None
+
+
+async def test_updates_keep_the_failures(store, make_deployment):
+    deployment = make_deployment(AgentDeploymentStatus.PENDING_SWAP)
+    await store.save(deployment, private_key="11" * 32, creator_wallet=None, env_variables={})
+    await store.record_failure(deployment.id, "swap failed")
+    await store.record_failure(deployment.id, "swap failed again")
+
+    deployment.status = AgentDeploymentStatus.PENDING_ALLOCATION
+    await store.save(deployment, private_key="11" * 32, creator_wallet=None, env_variables={})
+
+    [stored] = await store.pending()
+    assert stored.deployment.status == AgentDeploymentStatus.PENDING_ALLOCATION
+    assert stored.attempts == 2 and stored.last_error == "swap failed again"
+    assert await store.pending(max_attempts=2) == []
+
+
+async def test_pending_and_unpublished(store, make_deployment):
+    for index, status in enumerate([AgentDeploymentStatus.PENDING_DEPLOY, AgentDeploymentStatus.ALIVE,
+                                    AgentDeploymentStatus.PENDING_FUND]):
+        await store.save(make_deployment(status, agent_id=f"agent-{index}"), private_key="11" * 32,
+                         creator_wallet=None, env_variables={})
+
+    # Oldest first
+    assert [stored.deployment.id for stored in await store.pending()] == ["agent-0", "agent-2"]
+    assert [stored.deployment.id for stored in await store.unpublished()] == ["agent-1"]
+
+    await store.delete("agent-0")
+    await store.delete("agent-1")
+    assert [stored.deployment.id for stored in await store.pending()] == ["agent-2"]
+    assert await store.unpublished() == []
+
+
+async def test_files_are_private(tmp_path, make_deployment):
+    path = tmp_path / "state.db"
+    # Left readable by a previous version
+    path.touch(mode=0o644)
+    os.chmod(path, 0o644)
+
+    store = DeploymentStateStore(str(path))
+    await store.save(make_deployment(), private_key="11" * 32, creator_wallet=None, env_variables={})
+    files = [path, tmp_path / "state.db-wal", tmp_path / "state.db-shm"]
+    assert {stat.S_IMODE(file.stat().st_mode) for file in files} == {0o600}
+    await store.close()
+
+    os.unlink(path)
+    store = DeploymentStateStore(str(path))
+    await store.pending()
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    await store.close()
@@ -0,0 +1,82 @@
+import asyncio
+
+from backend.artifacts import ArtifactCache
+from backend.models import AgentDeploymentStatus
+from backend.ssh import parse_script_phases
+from backend.timeline import TimelineEventType, TimelineStore, current_agent_id
+
+
+def test_keeps_the_last_events_of_each_deployment():
+    timelines = TimelineStore(max_deployments=10, max_events=3)
+    for status in [AgentDeploymentStatus.PENDING_FUND, AgentDeploymentStatus.PENDING_SWAP,
+                   AgentDeploymentStatus.PENDING_ALLOCATION, AgentDeploymentStatus.PENDING_START]:
+        timelines.record("agent", TimelineEventType.STAGE_ENTERED, stage=status)
+
+    assert [event.stage for event in timelines.get("agent")] == [
+        AgentDeploymentStatus.PENDING_SWAP, AgentDeploymentStatus.PENDING_ALLOCATION, AgentDeploymentStatus.PENDING_START
+    ]
+    assert timelines.get("unknown") is None
+
+
+def test_evicts_the_least_recently_active_deployments():
+    timelines = TimelineStore(max_deployments=2, max_events=10)
+    timelines.record("first", TimelineEventType.RETRY, name="swap")
+    timelines.record("second", TimelineEventType.RETRY, name="swap")
+    timelines.record("first", TimelineEventType.FAILED, reason="swap failed")
+    timelines.record("third", TimelineEventType.RETRY, name="swap")
+
+    assert timelines.get("second") is None
+    assert [event.type for event in timelines.get("first")] == [TimelineEventType.RETRY, TimelineEventType.FAILED]
+    assert len(timelines.get("third")) == 1
+
+
+def test_calls_are_recorded_for_the_current_deployment():
+    timelines = TimelineStore(max_deployments=10, max_events=10)
+    timelines.record_call("aleph.get_agent", duration=0.1, success=True)
+    token = current_agent_id.set("agent")
+    try:
+        timelines.record_call("aleph.get_agent", duration=0.2, success=False)
+    finally:
+        current_agent_id.reset(token)
+
+    [call] = timelines.get("agent")
+    assert (call.type, call.name, call.duration, call.success) == (TimelineEventType.CALL, "aleph.get_agent", 0.2, False)
+
+
+def test_parse_script_phases():
+    output = "\n".join([
+        "Installing Docker",
+        "LIBERTAI_PHASE docker_install 12500",
+        "LIBERTAI_PHASE image_load 830",
+        # Not phase lines, even if they look close
+        "LIBERTAI_PHASE image_build",
+        "LIBERTAI_PHASE run fast",
+        "LIBERTAI_PHASE run 10 extra",
+        "echo LIBERTAI_PHASE run 10",
+        "LIBERTAI_PHASE run 40",
+    ])
+    assert parse_script_phases(output) == {"docker_install": 12.5, "image_load": 0.83, "run": 0.04}
+    assert parse_script_phases("") == {}
+
+
+async def test_shared_downloads_belong_to_no_deployment(tmp_path):
+    timelines = TimelineStore(max_deployments=10, max_events=10)
+    cache = ArtifactCache(str(tmp_path), ".zip", max_size=1024)
+    release = asyncio.Event()
+
+    async def download(key, path):
+        await release.wait()
+        timelines.record_call("code_file", duration=1, success=True)
+        path.write_bytes(b"code")
+        return True
+
+    async def deploy(agent_id):
+        current_agent_id.set(agent_id)
+        return await cache.get("code", download)
+
+    requests = [asyncio.create_task(deploy("first")), asyncio.create_task(deploy("second"))]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*requests)
+
+    assert timelines.get("first") is None and timelines.get("second") is None
@@ -0,0 +1,66 @@
+import asyncio
+import time
+from itertools import islice
+
+import pytest
+
+from backend.config import config
+from backend.models import HostNotFoundError
+from backend.utils import backoff_delays, read_ssh_banner, wait_for_ssh
+
+
+@pytest.fixture
+def readiness(monkeypatch):
+    monkeypatch.setattr(config, "READINESS_TIMEOUT", 0.5)
+    monkeypatch.setattr(config, "READINESS_ATTEMPT_TIMEOUT", 0.1)
+    monkeypatch.setattr(config, "READINESS_BACKOFF_INITIAL", 0.01)
+    monkeypatch.setattr(config, "READINESS_BACKOFF_MAX", 0.05)
+
+
+async def start_server(banner: bytes, connections: list):
+    async def handle(reader, writer):
+        connections.append(time.monotonic())
+        if banner:
+            writer.write(banner)
+            await writer.drain()
+        else:
+            # Accepts the connection but never answers, like a port forwarded to a booting instance
+            await asyncio.sleep(1)
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_backoff_delays():
+    delays = list(islice(backoff_delays(1, 8), 6))
+    steps = [1, 2, 4, 8, 8, 8]
+    assert all(step / 2 <= delay <= step for step, delay in zip(steps, delays))
+
+
+async def test_read_ssh_banner():
+    server, port = await start_server(b"SSH-2.0-OpenSSH_9.6\r\n", [])
+    other, other_port = await start_server(b"HTTP/1.1 400 Bad Request\r\n", [])
+    async with server, other:
+        assert await read_ssh_banner("127.0.0.1", port, timeout=1)
+        assert not await read_ssh_banner("127.0.0.1", other_port, timeout=1)
+
+
+async def test_wait_for_ssh(readiness):
+    server, port = await start_server(b"SSH-2.0-OpenSSH_9.6\r\n", [])
+    async with server:
+        assert await wait_for_ssh("127.0.0.1", port) < config.READINESS_TIMEOUT
+
+
+async def test_wait_for_ssh_deadline(readiness):
+    connections: list = []
+    server, port = await start_server(b"", connections)
+    async with server:
+        start = time.monotonic()
+        with pytest.raises(HostNotFoundError):
+            await wait_for_ssh("127.0.0.1", port)
+        elapsed = time.monotonic() - start
+
+    # Retried until the deadline, each attempt bounded by its own timeout
+    assert config.READINESS_TIMEOUT <= elapsed < config.READINESS_TIMEOUT + config.READINESS_ATTEMPT_TIMEOUT
+    assert len(connections) >= 3